@@ -6,7 +6,7 @@ db = SQLAlchemy()
 PASSWORD_HASH = None
 
 
-def create_app(config_class=None):
+def create_app(config_class=None, migrate=True):
     app = Flask(__name__)
 
     if config_class:
@@ -24,8 +24,34 @@ def create_app(config_class=None):
     from werkzeug.middleware.proxy_fix import ProxyFix
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
 
+    # SQLite production profile: pool sized to the server threads, pragmas on connect
+    from app import sqlite_profile
+    use_profile = sqlite_profile.enabled(app.config)
+    if use_profile:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**sqlite_profile.engine_options(app.config),
+                                                   **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
     db.init_app(app)
 
+    # /api/track ingest: a segment log loaded by the compactor, or a write-behind queue whose
+    # writer thread starts with the first queued event; else events are stored on the request
+    if app.config.get('TRACK_SEGMENT_DIR'):
+        from app.api.segment_log import SegmentLog, segment_directory
+        app.extensions['segment_log'] = SegmentLog(
+            segment_directory(app),
+            max_bytes=app.config.get('TRACK_SEGMENT_MAX_BYTES', 8 * 1024 * 1024),
+            max_age=app.config.get('TRACK_SEGMENT_MAX_AGE', 60.0),
+            fsync_interval=app.config.get('TRACK_SEGMENT_FSYNC_INTERVAL', 1.0),
+        )
+    elif app.config.get('TRACK_QUEUE_ENABLED'):
+        from app.api.event_queue import EventQueue
+        app.extensions['event_queue'] = EventQueue(
+            app,
+            max_events=app.config.get('TRACK_QUEUE_MAX_EVENTS', 50000),
+            batch_size=app.config.get('TRACK_QUEUE_BATCH_SIZE', 500),
+            flush_interval=app.config.get('TRACK_QUEUE_FLUSH_INTERVAL', 1.0),
+        )
+
     # Iframe-friendly headers
     @app.after_request
     def set_headers(response):
@@ -51,9 +77,21 @@ def create_app(config_class=None):
     app.register_blueprint(experiment_bp)
     app.register_blueprint(api_bp)
 
-    # Create tables
+    # Create tables, then apply migrations for what create_all() does not change (app/migrations.py)
     with app.app_context():
+        if use_profile:
+            settings = sqlite_profile.pragmas(app.config)
+            sqlite_profile.install(db.engine, settings)
+            effective, mismatches = sqlite_profile.self_check(db.engine, settings)
+            app.extensions['sqlite_profile'] = effective
+            app.logger.info('SQLite profile: %s', ', '.join(f'{k}={v}' for k, v in effective.items()))
+            for mismatch in mismatches:
+                app.logger.warning('SQLite profile: %s', mismatch)
+
         from app import models  # noqa: F401
         db.create_all()
+        if migrate:
+            from app.migrations import upgrade
+            upgrade()
 
     return app
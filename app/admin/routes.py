@@ -3,7 +3,8 @@ import csv
 import io
 from datetime import datetime
 from functools import wraps
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, Response
+from flask import (Blueprint, render_template, request, redirect, url_for, session, flash, Response,
+                   current_app, jsonify)
 import bcrypt
 import pandas as pd
 
@@ -11,6 +12,8 @@ from app import db, PASSWORD_HASH
 from app.models import (Experiment, Risk, Method, Participant, Session as ExpSession,
                          MethodSession, AssessmentResult, InteractionEvent)
 from app.methods import METHOD_TYPE_LABELS, get_default_config, get_method_handler
+from app.result_tables import aggregate
+from app.api import ingest
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -362,8 +365,21 @@ def results(experiment_id):
                 'summary': summary,
             })
 
+    # Per-risk statistics across participants, aggregated in SQL from the typed result tables
+    risk_names = {r.id: r.name for r in risks}
+    aggregates = []
+    for method in methods:
+        table = aggregate(method)
+        if table and table['rows']:
+            aggregates.append({
+                'method': method,
+                'columns': ['Risk'] + table['columns'][1:],
+                'rows': [[risk_names.get(row[0], '')] + [round(v, 2) if isinstance(v, float) else v for v in row[1:]]
+                         for row in table['rows']],
+            })
+
     return render_template('admin/results.html', experiment=exp, results_data=results_data,
-                           risks=risks, methods=methods)
+                           aggregates=aggregates, risks=risks, methods=methods)
 
 
 @admin_bp.route('/experiment/<int:experiment_id>/results/export/<format>')
@@ -415,6 +431,23 @@ def results_export(experiment_id, format):
     return "Invalid format", 400
 
 
+# --- Ingest ---
+
+@admin_bp.route('/ingest/stats')
+@admin_required
+def ingest_stats():
+    # Counters of the /api/track write-behind queue (app/api/event_queue.py) or segment log
+    # (app/api/segment_log.py), and of compressed request bodies (app/api/ingest.py)
+    compression = {'compression': ingest.compression_stats()}
+    segment_log = current_app.extensions.get('segment_log')
+    if segment_log is not None:
+        return jsonify({'enabled': False, 'segments': segment_log.stats(), **compression})
+    queue = current_app.extensions.get('event_queue')
+    if queue is None:
+        return jsonify({'enabled': False, **compression})
+    return jsonify({'enabled': True, **queue.stats(), **compression})
+
+
 # --- Interaction Logs ---
 
 @admin_bp.route('/experiment/<int:experiment_id>/interactions')
@@ -0,0 +1,191 @@
+"""In-process write-behind queue for interaction events.
+
+Even as one bulk insert, storing a /api/track batch on the request thread
+takes the SQLite write lock, in competition with participants submitting
+assessments. With the queue enabled (TRACK_QUEUE_ENABLED), /api/track only
+validates a batch (app/api/ingest.py), puts its rows here and answers 202.
+A background writer thread drains the queue in large transactions, when
+TRACK_QUEUE_BATCH_SIZE events are waiting or the oldest waiting event is
+TRACK_QUEUE_FLUSH_INTERVAL seconds old.
+
+The queue holds at most TRACK_QUEUE_MAX_EVENTS events. A batch that does not
+fit is refused (put() returns False) and /api/track answers 429 with
+Retry-After, so the client keeps its events and sends them again later. A
+write that fails is retried with the batch kept at the head of the queue; after
+MAX_RETRIES attempts its events are counted as lost. stop() (registered with
+atexit when the writer starts) flushes what is left before the process exits.
+
+Events are lost if the process is killed, so the queue trades at most one
+flush interval of interaction events for request latency; assessment
+results never go through it. stats() returns the counters shown at
+/admin/ingest/stats.
+"""
+
+import atexit
+import threading
+import time
+from collections import deque
+
+MAX_RETRIES = 3
+
+
+class EventQueue:
+
+    def __init__(self, app, max_events=50000, batch_size=500, flush_interval=1.0):
+        self.app = app
+        self.max_events = max_events
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._rows = deque()
+        self._oldest = None  # monotonic time the oldest waiting row was queued
+        self._cond = threading.Condition()
+        self._thread = None
+        self._flushers = 0  # flush() calls waiting: write whatever is queued
+        self._in_flight = 0  # rows taken by the writer and not written yet
+        self._stopping = False
+        self._retries = 0
+        self.counters = {'enqueued': 0, 'written': 0, 'rejected': 0, 'lost': 0, 'write_errors': 0,
+                         'flushes': 0, 'flush_seconds': 0.0, 'last_flush_ms': None, 'max_flush_ms': 0.0,
+                         'max_depth': 0}
+
+    def put(self, rows):
+        """Queue row tuples (see ingest.COLUMNS); False if they do not fit, nothing is queued then."""
+        with self._cond:
+            if self._stopping or len(self._rows) + len(rows) > self.max_events:
+                self.counters['rejected'] += len(rows)
+                return False
+            if not rows:
+                return True
+            was_empty = not self._rows
+            if was_empty:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            self.counters['enqueued'] += len(rows)
+            self.counters['max_depth'] = max(self.counters['max_depth'], len(self._rows))
+            self._start()
+            if was_empty or len(self._rows) >= self.batch_size:
+                self._cond.notify_all()  # the writer sleeps until the first row, then until a batch is due
+        return True
+
+    def retry_after(self):
+        """Seconds a refused client should wait: about the time the writer needs to make room."""
+        return max(1, int(self.flush_interval + 0.999))
+
+    def depth(self):
+        with self._cond:
+            return len(self._rows) + self._in_flight
+
+    def flush(self, timeout=None):
+        """Write everything queued so far; returns False if that did not finish within `timeout` seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if self._thread is None:
+                return not self._rows
+            self._flushers += 1
+            self._cond.notify_all()
+            try:
+                while self._rows or self._in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self._flushers -= 1
+        return True
+
+    def stop(self, timeout=30):
+        """Flush and stop the writer; later put() calls are refused."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            atexit.unregister(self.stop)
+
+    def stats(self):
+        with self._cond:
+            counters = dict(self.counters)
+            depth = len(self._rows) + self._in_flight
+        flushes = counters['flushes']
+        counters['mean_flush_ms'] = counters['flush_seconds'] * 1000 / flushes if flushes else None
+        del counters['flush_seconds']
+        return {'depth': depth, 'capacity': self.max_events, 'batch_size': self.batch_size,
+                'flush_interval': self.flush_interval, 'running': bool(self._thread and self._thread.is_alive()),
+                **counters}
+
+    # --- writer ---
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='event-queue-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _due(self):
+        if not self._rows:
+            return False
+        return (self._stopping or self._flushers or len(self._rows) >= self.batch_size
+                or time.monotonic() - self._oldest >= self.flush_interval)
+
+    def _take(self):
+        """Wait until a batch is due and take it; None once stopping with nothing left."""
+        with self._cond:
+            while not self._due():
+                if self._stopping and not self._rows:
+                    return None
+                timeout = None if not self._rows else self._oldest + self.flush_interval - time.monotonic()
+                self._cond.wait(timeout if timeout is None else max(timeout, 0.001))
+            count = min(len(self._rows), self.batch_size)
+            batch = [self._rows.popleft() for _ in range(count)]
+            if not self._rows:
+                self._oldest = None  # else the rows left are at least as old: the next batch may be due at once
+            self._in_flight = count
+            return batch
+
+    def _write(self, batch):
+        from app import db
+        from app.api import ingest
+        start = time.perf_counter()
+        with self.app.app_context():
+            try:
+                ingest.insert_events(batch)
+                db.session.commit()
+                error = None
+            except Exception as e:
+                db.session.rollback()
+                error = e
+            finally:
+                db.session.remove()
+        elapsed = time.perf_counter() - start
+
+        with self._cond:
+            self._in_flight = 0
+            if error is None:
+                self._retries = 0
+                self.counters['written'] += len(batch)
+                self.counters['flushes'] += 1
+                self.counters['flush_seconds'] += elapsed
+                self.counters['last_flush_ms'] = elapsed * 1000
+                self.counters['max_flush_ms'] = max(self.counters['max_flush_ms'], elapsed * 1000)
+            else:
+                self.counters['write_errors'] += 1
+                self._retries += 1
+                if self._retries < MAX_RETRIES:
+                    self._rows.extendleft(reversed(batch))
+                    self._oldest = time.monotonic()
+                else:
+                    self._retries = 0
+                    self.counters['lost'] += len(batch)
+                    self.app.logger.error('Event queue: dropped %d events after %d failed writes: %s',
+                                          len(batch), MAX_RETRIES, error)
+            self._cond.notify_all()
+        if error is not None:
+            time.sleep(min(self.flush_interval, 1.0))
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            self._write(batch)
@@ -0,0 +1,362 @@
+"""Bulk ingest of tracker.js interaction events.
+
+/api/track is the highest-volume endpoint: every open page flushes its event
+buffer every 5 s. Rather than one InteractionEvent ORM object per event, a
+batch is validated into plain tuples first (parse_events) and then written
+with a single executemany INSERT (insert_events), so a batch is stored
+completely or not at all and the write lock is held for one statement.
+
+Limits: a request body is at most MAX_TRACK_BYTES and a batch at most
+MAX_TRACK_EVENTS events. Text fields are cut to their column sizes.
+
+Bodies may be sent with Content-Encoding gzip or deflate (decode_body). They
+are inflated incrementally and refused once the inflated body would exceed
+the same limit as an uncompressed body, so a small "decompression bomb"
+never expands beyond it in memory. compression_stats() counts requests,
+bytes before and after decoding and the CPU time spent inflating, per
+encoding.
+
+tracker.js sends batches in a compact columnar format ("v": 2); batches
+without "v" are objects per event as before, and both are accepted. In the
+columnar format every string is sent once, in "strings", and referenced by
+index:
+
+    {"v": 2, "method_session_id": 5,
+     "strings": ["click", "/experiment/1/method/5", "element_id", "choice_1", "x"],
+     "t0": 12345,              timestamp of the first event, in ms
+     "dt": [0, 120, 35],       integer ms since the previous event
+     "type": [0, 0, 0],        event_type, per event (string index)
+     "url": [1, 1, 1],         page_url, per event (string index)
+     "shapes": [[-3, 4]],      key lists of event_data objects, see below
+     "data": [[0, 3, 450], [0, 3, 460], null]}
+
+"data" holds one entry per event: null for {}, else [shape, values...].
+A shape lists the event_data keys as string indexes; a key written as
+-(index + 1) has a string value, sent as a string index too, the other
+values are sent as they are. Optional "id", "tag" and "cls" columns (string
+indexes) carry element_id, element_tag and element_class.
+encode_columns() is the Python counterpart of tracker.js's encoder.
+"""
+
+import json
+import math
+import threading
+import time
+import zlib
+
+MAX_TRACK_BYTES = 256 * 1024
+MAX_TRACK_EVENTS = 1000
+MAX_META_BYTES = 16 * 1024  # /api/session_meta
+
+# InteractionEvent columns written by the ingest path, in tuple order
+COLUMNS = ('session_id', 'method_session_id', 'timestamp', 'event_type', 'element_id', 'element_tag',
+           'element_class', 'page_url', 'event_data')
+
+# Column sizes of the text fields (page_url is Text; capped to keep rows small)
+_TEXT_LIMITS = {'event_type': 50, 'element_id': 255, 'element_tag': 50, 'element_class': 500, 'page_url': 2000}
+
+_insert_statements = {}  # dialect name -> INSERT statement (see _insert_sql)
+
+# Content-Encoding -> zlib wbits (gzip container, zlib container)
+_ENCODINGS = {'gzip': 16 + zlib.MAX_WBITS, 'x-gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+_stats_lock = threading.Lock()
+_encoding_stats = {}  # encoding -> counters, see compression_stats()
+
+
+class IngestError(ValueError):
+    """A request the ingest path rejects; `status` is the HTTP status to answer with."""
+
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+def read_body(stream, content_length, limit=MAX_TRACK_BYTES):
+    """Read a request body of at most `limit` bytes, without reading past the limit."""
+    if content_length is not None and content_length > limit:
+        raise IngestError(413, 'too_large', f'At most {limit} bytes per request.')
+    body = stream.read(limit + 1)
+    if len(body) > limit:
+        raise IngestError(413, 'too_large', f'At most {limit} bytes per request.')
+    return body
+
+
+def _count(encoding, bytes_in, bytes_out, cpu_seconds, rejected=False):
+    with _stats_lock:
+        stats = _encoding_stats.setdefault(encoding, {'requests': 0, 'rejected': 0, 'bytes_in': 0, 'bytes_out': 0,
+                                                      'cpu_seconds': 0.0})
+        stats['requests'] += 1
+        stats['rejected'] += rejected
+        stats['bytes_in'] += bytes_in
+        stats['bytes_out'] += bytes_out
+        stats['cpu_seconds'] += cpu_seconds
+
+
+def compression_stats():
+    """Per Content-Encoding: requests, rejected, bytes in/out, compression ratio (out/in) and decode CPU ms."""
+    with _stats_lock:
+        stats = {encoding: dict(counters) for encoding, counters in _encoding_stats.items()}
+    for counters in stats.values():
+        counters['ratio'] = counters['bytes_out'] / counters['bytes_in'] if counters['bytes_in'] else None
+        counters['decode_cpu_ms'] = counters.pop('cpu_seconds') * 1000
+    return stats
+
+
+def _inflate(body, wbits, limit):
+    inflater = zlib.decompressobj(wbits)
+    decoded = inflater.decompress(body, limit + 1)
+    if len(decoded) > limit:
+        raise IngestError(413, 'too_large', f'At most {limit} bytes per request after decompression.')
+    if not inflater.eof or inflater.unused_data:
+        raise zlib.error('truncated or trailing data')
+    return decoded
+
+
+def decode_body(body, content_encoding, limit=MAX_TRACK_BYTES):
+    """Remove the Content-Encoding (gzip or deflate) of a request body, inflating at most `limit` bytes."""
+    encoding = (content_encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        _count(encoding, len(body), len(body), 0.0)
+        return body
+    if encoding not in _ENCODINGS:
+        _count(encoding, len(body), 0, 0.0, rejected=True)
+        raise IngestError(415, 'unsupported_encoding', 'Content-Encoding must be gzip or deflate.')
+    start = time.thread_time()
+    decoded = b''
+    try:
+        try:
+            decoded = _inflate(body, _ENCODINGS[encoding], limit)
+        except zlib.error:
+            if encoding != 'deflate':
+                raise
+            decoded = _inflate(body, -zlib.MAX_WBITS, limit)  # raw deflate, as some clients send it
+    except zlib.error:
+        raise IngestError(400, 'invalid_encoding', f'Body is not valid {encoding} data.') from None
+    finally:
+        _count(encoding, len(body), len(decoded), time.thread_time() - start, rejected=not decoded)
+    return decoded
+
+
+def decode_payload(body):
+    """The JSON object of a request body (sendBeacon posts it as text/plain, so the content type is not checked)."""
+    try:
+        data = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        data = None
+    if not data or not isinstance(data, dict):
+        raise IngestError(400, 'no_data', 'Expected a JSON object.')
+    return data
+
+
+def _text(value, limit):
+    if value is None:
+        return ''
+    return (value if isinstance(value, str) else str(value))[:limit]
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return 0.0
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return number if math.isfinite(number) else 0.0
+
+
+def _id(value):
+    """An integer id from JSON (tracker.js sends the method session id as a string), else None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+
+def parse_events(data, session_id, default_method_session_id=None):
+    """Validate the events of a /api/track payload into row tuples (see COLUMNS).
+
+    Raises IngestError if 'events' is not a list of objects (or the columns
+    of a "v": 2 payload do not fit together) or there are more than
+    MAX_TRACK_EVENTS events.
+    """
+    if 'v' in data:
+        if data['v'] != 2:
+            raise IngestError(400, 'invalid', f'Unknown payload version {data["v"]!r}.')
+        return _parse_columns(data, session_id, default_method_session_id)
+    events = data.get('events', [])
+    if not isinstance(events, list) or not all(isinstance(evt, dict) for evt in events):
+        raise IngestError(400, 'invalid', 'Expected "events" to be a list of objects.')
+    if len(events) > MAX_TRACK_EVENTS:
+        raise IngestError(413, 'too_large', f'At most {MAX_TRACK_EVENTS} events per request.')
+    method_session_id = _id(data.get('method_session_id')) or _id(default_method_session_id)
+    limits = _TEXT_LIMITS
+    return [(
+        session_id,
+        method_session_id,
+        _number(evt.get('timestamp', 0)),
+        _text(evt.get('event_type', 'unknown'), limits['event_type']) or 'unknown',
+        _text(evt.get('element_id'), limits['element_id']),
+        _text(evt.get('element_tag'), limits['element_tag']),
+        _text(evt.get('element_class'), limits['element_class']),
+        _text(evt.get('page_url'), limits['page_url']),
+        json.dumps(evt.get('event_data', {})),
+    ) for evt in events]
+
+
+def _invalid(message):
+    return IngestError(400, 'invalid', message)
+
+
+def _column(data, name, count, optional=False):
+    values = data.get(name)
+    if values is None and optional:
+        return None
+    if not isinstance(values, list) or len(values) != count:
+        raise _invalid(f'Expected "{name}" to be a list of {count} values.')
+    return values
+
+
+def _parse_columns(data, session_id, default_method_session_id):
+    """parse_events() for the columnar format (see the module docstring)."""
+    strings, dt = data.get('strings'), data.get('dt')
+    if not isinstance(strings, list) or not all(isinstance(value, str) for value in strings):
+        raise _invalid('Expected "strings" to be a list of strings.')
+    if not isinstance(dt, list):
+        raise _invalid('Expected "dt" to be a list of numbers.')
+    count = len(dt)
+    if count > MAX_TRACK_EVENTS:
+        raise IngestError(413, 'too_large', f'At most {MAX_TRACK_EVENTS} events per request.')
+    columns = [_column(data, 'type', count), _column(data, 'url', count)]
+    columns += [_column(data, name, count, optional=True) for name in ('id', 'tag', 'cls')]
+    shapes = data.get('shapes', [])
+    entries = _column(data, 'data', count)
+    if not isinstance(shapes, list) or not all(
+            isinstance(shape, list) and all(type(key) is int for key in shape) for shape in shapes):
+        raise _invalid('Expected "shapes" to be a list of lists of string indexes.')
+
+    def valid(i):
+        return type(i) is int and 0 <= i < len(strings)
+
+    def lookup(values, field):
+        if values is None:
+            return [''] * count
+        if not all(valid(i) for i in values):
+            raise _invalid('String index out of range.')
+        # Each string is cut to the column size once, not once per event
+        limit = _TEXT_LIMITS[field]
+        table = [value[:limit] for value in strings]
+        return [table[i] for i in values]
+
+    event_types = [value or 'unknown' for value in lookup(columns[0], 'event_type')]
+    page_urls = lookup(columns[1], 'page_url')
+    element_ids = lookup(columns[2], 'element_id')
+    element_tags = lookup(columns[3], 'element_tag')
+    element_classes = lookup(columns[4], 'element_class')
+
+    if not all(valid(~key if key < 0 else key) for shape in shapes for key in shape):
+        raise _invalid('String index out of range.')
+    if any(len({~key if key < 0 else key for key in shape}) != len(shape) for shape in shapes):
+        raise _invalid('Expected the keys of a shape to be different.')
+
+    # event_data is stored as json.dumps() of the object would write it, but
+    # assembled from text encoded once per string and per shape key
+    quoted = [json.dumps(value) for value in strings]
+    prefixes = [[quoted[~key if key < 0 else key] + ': ' for key in shape] for shape in shapes]
+    string_keys = [[key < 0 for key in shape] for shape in shapes]
+    event_data = []
+    for entry in entries:
+        if entry is None:
+            event_data.append('{}')
+            continue
+        if (type(entry) is not list or not entry or type(entry[0]) is not int
+                or not 0 <= entry[0] < len(shapes) or len(entry) != len(shapes[entry[0]]) + 1):
+            raise _invalid('Expected "data" entries to be null or [shape, values...].')
+        parts = []
+        for prefix, is_string, value in zip(prefixes[entry[0]], string_keys[entry[0]], entry[1:]):
+            if is_string:
+                if type(value) is not int or not 0 <= value < len(quoted):
+                    raise _invalid('String index out of range.')
+                parts.append(prefix + quoted[value])
+            else:
+                parts.append(prefix + (str(value) if type(value) is int else json.dumps(value)))
+        event_data.append('{' + ', '.join(parts) + '}')
+
+    timestamp = _number(data.get('t0', 0))
+    timestamps = []
+    for delta in dt:
+        if type(delta) is not int:
+            raise _invalid('Expected "dt" to be a list of integers.')
+        timestamp += delta
+        timestamps.append(float(timestamp))
+
+    method_session_id = _id(data.get('method_session_id')) or _id(default_method_session_id)
+    return list(zip([session_id] * count, [method_session_id] * count, timestamps, event_types, element_ids,
+                    element_tags, element_classes, page_urls, event_data))
+
+
+def encode_columns(events, method_session_id=None):
+    """Encode event objects (as tracker.js collects them) in the columnar format."""
+    strings, index, shapes, shape_index = [], {}, [], {}
+
+    def ref(value):
+        value = '' if value is None else str(value)
+        if value not in index:
+            index[value] = len(strings)
+            strings.append(value)
+        return index[value]
+
+    payload = {'v': 2, 'method_session_id': method_session_id, 'strings': strings, 't0': 0, 'dt': [],
+               'type': [], 'url': [], 'shapes': shapes, 'data': []}
+    previous = None
+    for evt in events:
+        timestamp = round(_number(evt.get('timestamp', 0)))
+        if previous is None:
+            payload['t0'] = previous = timestamp
+        payload['dt'].append(timestamp - previous)
+        previous = timestamp
+        payload['type'].append(ref(evt.get('event_type', 'unknown')))
+        payload['url'].append(ref(evt.get('page_url', '')))
+        event_data = evt.get('event_data') or {}
+        if not event_data:
+            payload['data'].append(None)
+            continue
+        shape = tuple(~ref(key) if isinstance(value, str) else ref(key) for key, value in event_data.items())
+        if shape not in shape_index:
+            shape_index[shape] = len(shapes)
+            shapes.append(list(shape))
+        payload['data'].append([shape_index[shape]] + [ref(value) if isinstance(value, str) else value
+                                                        for value in event_data.values()])
+    for field, name in (('element_id', 'id'), ('element_tag', 'tag'), ('element_class', 'cls')):
+        if any(evt.get(field) for evt in events):
+            payload[name] = [ref(evt.get(field)) for evt in events]
+    return payload
+
+
+def _insert_sql(dialect):
+    """Positional INSERT of COLUMNS in the driver's parameter style."""
+    quote = dialect.identifier_preparer.quote
+    if dialect.paramstyle == 'qmark':
+        markers = ['?'] * len(COLUMNS)
+    elif dialect.paramstyle == 'numeric':
+        markers = [f':{i}' for i in range(1, len(COLUMNS) + 1)]
+    else:  # format, pyformat
+        markers = ['%s'] * len(COLUMNS)
+    return (f'INSERT INTO {quote("interaction_event")} ({", ".join(quote(c) for c in COLUMNS)}) '
+            f'VALUES ({", ".join(markers)})')
+
+
+def insert_events(rows):
+    """Insert row tuples with one executemany statement on the session's connection. Does not commit."""
+    from app import db
+    if not rows:
+        return
+    connection = db.session.connection()
+    name = connection.dialect.name
+    if name not in _insert_statements:
+        _insert_statements[name] = _insert_sql(connection.dialect)
+    connection.exec_driver_sql(_insert_statements[name], rows)
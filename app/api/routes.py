@@ -1,41 +1,54 @@
-import json
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, current_app, request, jsonify, session
 from app import db
-from app.models import InteractionEvent, Session as ExpSession
+from app.models import Session as ExpSession, MethodSession, Risk
+from app.methods import get_method_handler
+from app.api import ingest
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+MAX_BATCH_ANSWERS = 500
+
 
 @api_bp.route('/track', methods=['POST'])
 def track():
-    """Receive interaction events from tracker.js."""
+    """Receive interaction events from tracker.js: logged to a segment or queued if enabled, else stored at once."""
     session_id = session.get('exp_session_id')
     if not session_id:
         return jsonify({'status': 'no_session'}), 200
 
-    data = request.get_json(silent=True)
-    if not data:
-        return jsonify({'status': 'no_data'}), 400
+    try:
+        body = ingest.read_body(request.stream, request.content_length)
+        data = ingest.decode_payload(ingest.decode_body(body, request.headers.get('Content-Encoding')))
+        rows = ingest.parse_events(data, session_id, session.get('current_method_session_id'))
+    except ingest.IngestError as e:
+        return jsonify({'status': e.code, 'error': str(e)}), e.status
+
+    segment_log = current_app.extensions.get('segment_log')
+    if segment_log is not None:
+        # Loaded into the database later by the compactor (app/api/segment_log.py)
+        try:
+            appended = segment_log.append(rows)
+        except OSError:
+            current_app.logger.exception('Segment log: could not append a /api/track batch')
+            response = jsonify({'status': 'unavailable', 'error': 'Events cannot be stored right now.'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        if appended:
+            return jsonify({'status': 'queued', 'count': len(rows)}), 202
+        # The log is closed (the process is shutting down): store the batch at once below
 
-    events = data.get('events', [])
-    method_session_id = data.get('method_session_id') or session.get('current_method_session_id')
-
-    for evt in events:
-        event = InteractionEvent(
-            session_id=session_id,
-            method_session_id=method_session_id,
-            timestamp=evt.get('timestamp', 0),
-            event_type=evt.get('event_type', 'unknown'),
-            element_id=evt.get('element_id', ''),
-            element_tag=evt.get('element_tag', ''),
-            element_class=evt.get('element_class', ''),
-            page_url=evt.get('page_url', ''),
-        )
-        event.set_event_data(evt.get('event_data', {}))
-        db.session.add(event)
+    queue = current_app.extensions.get('event_queue')
+    if queue is not None:
+        # Written by the queue's writer thread (app/api/event_queue.py)
+        if not queue.put(rows):
+            response = jsonify({'status': 'busy', 'error': 'Too many events waiting to be stored.'})
+            response.headers['Retry-After'] = str(queue.retry_after())
+            return response, 429
+        return jsonify({'status': 'queued', 'count': len(rows)}), 202
 
+    ingest.insert_events(rows)
     db.session.commit()
-    return jsonify({'status': 'ok', 'count': len(events)}), 200
+    return jsonify({'status': 'ok', 'count': len(rows)}), 200
 
 
 @api_bp.route('/session_meta', methods=['POST'])
@@ -45,9 +58,12 @@ def session_meta():
     if not session_id:
         return jsonify({'status': 'no_session'}), 200
 
-    data = request.get_json(silent=True)
-    if not data:
-        return jsonify({'status': 'no_data'}), 400
+    try:
+        body = ingest.read_body(request.stream, request.content_length, ingest.MAX_META_BYTES)
+        data = ingest.decode_payload(ingest.decode_body(body, request.headers.get('Content-Encoding'),
+                                                        ingest.MAX_META_BYTES))
+    except ingest.IngestError as e:
+        return jsonify({'status': e.code, 'error': str(e)}), e.status
 
     exp_session = ExpSession.query.get(session_id)
     if exp_session:
@@ -59,3 +75,37 @@ def session_meta():
         db.session.commit()
 
     return jsonify({'status': 'ok'}), 200
+
+
+@api_bp.route('/uranus/<int:method_session_id>/answers', methods=['POST'])
+def uranus_answers(method_session_id):
+    """Apply a batch of pairwise comparison answers made locally by the Uranus page."""
+    session_id = session.get('exp_session_id')
+    if not session_id:
+        return jsonify({'status': 'no_session'}), 403
+
+    method_session = MethodSession.query.get(method_session_id)
+    if not method_session or method_session.session_id != session_id:
+        return jsonify({'status': 'forbidden'}), 403
+    if method_session.method.method_type != 'uranus':
+        return jsonify({'status': 'invalid', 'error': 'Not a pairwise comparison method.'}), 400
+
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'status': 'no_data'}), 400
+
+    answers = data.get('answers')
+    version = data.get('version')
+    if not isinstance(answers, list) or not isinstance(version, int) or isinstance(version, bool):
+        return jsonify({'status': 'invalid', 'error': 'Expected "answers" list and integer "version".'}), 400
+    if len(answers) > MAX_BATCH_ANSWERS:
+        return jsonify({'status': 'too_large', 'error': f'At most {MAX_BATCH_ANSWERS} answers per batch.'}), 413
+
+    risks = Risk.query.filter_by(experiment_id=method_session.session.experiment_id).order_by(Risk.order).all()
+    result = get_method_handler('uranus').process_batch(answers, version, method_session, risks)
+
+    if result['conflict']:
+        return jsonify({'status': 'conflict', **result}), 409
+    if result['error']:
+        return jsonify({'status': 'invalid', **result}), 400
+    return jsonify({'status': 'ok', **result}), 200
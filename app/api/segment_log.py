@@ -0,0 +1,453 @@
+"""Append-only segment log for /api/track batches, loaded into the database by a compactor.
+
+With TRACK_SEGMENT_DIR set, /api/track does not write interaction events to
+the database at all: each validated batch (row tuples, see
+app/api/ingest.py) is appended as one record to a segment file and the
+request answers 202. The database file then only grows when the compactor
+runs, in large transactions, away from the participants' requests:
+
+    python -m app.api.segment_log compact [--watch SECONDS]
+    python -m app.api.segment_log status
+
+Segment files live in TRACK_SEGMENT_DIR (relative to the instance folder).
+A process appends to its own `<utc time>-<pid>-<start>-<n>.open` file, where
+<start> is the process start time (from /proc, 0 where unknown), so that a
+later process that reuses the PID is not taken for the writer. The file is
+sealed (fsynced and renamed to `.seg`) when it reaches
+TRACK_SEGMENT_MAX_BYTES, is TRACK_SEGMENT_MAX_AGE seconds old, or the
+process exits. Appends are fsynced in batches by a background thread every
+TRACK_SEGMENT_FSYNC_INTERVAL seconds, so a power loss can cost the batches
+of that last interval; a crashed process costs nothing that was written.
+
+A record is a 4-byte length, the CRC-32 of the payload and the payload, a
+JSON array of rows. A torn or corrupt record ends the readable part of a
+segment. `.open` files of processes that no longer run are cut to their
+last complete record and sealed by the compactor.
+
+The compactor loads sealed segments in order. The position it reached in
+each segment is a segment_offset row, updated in the same transaction as
+the events loaded up to it, so a crash at any point neither loses nor
+duplicates a batch. The update is conditional on the previous position, so
+a second compactor running at the same time skips the segment instead of
+loading it again. Fully loaded segments are deleted.
+"""
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+OPEN = '.open'
+SEALED = '.seg'
+DAMAGED = '.damaged'
+
+_HEADER = struct.Struct('>II')  # payload length, CRC-32 of the payload
+MAX_RECORD_BYTES = 16 * 1024 * 1024  # a longer length field is corruption
+
+log = logging.getLogger(__name__)
+
+
+def encode_record(rows):
+    payload = json.dumps(rows, separators=(',', ':')).encode('utf-8')
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_records(path, offset=0):
+    """Yield (end offset, rows) for the complete records of a segment from `offset` on.
+
+    Stops at the first torn or corrupt record.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            length, crc = _HEADER.unpack(header)
+            if length > MAX_RECORD_BYTES:
+                return
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            try:
+                rows = json.loads(payload)
+            except ValueError:
+                return
+            offset += _HEADER.size + length
+            yield offset, [tuple(row) for row in rows]
+
+
+def _start_time(pid):
+    """Start time of a running process in clock ticks since boot (/proc/<pid>/stat), or None."""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name is in parentheses and may contain spaces; starttime is the 20th field after it
+    return int(stat[stat.rindex(b')') + 2:].split()[19])
+
+
+def _fsync_directory(directory):
+    if os.name != 'posix':
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SegmentLog:
+
+    def __init__(self, directory, max_bytes=8 * 1024 * 1024, max_age=60.0, fsync_interval=1.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+        self._cond = threading.Condition()
+        self._file = None
+        self._path = None
+        self._size = 0  # bytes of complete records in the open segment
+        self._opened = None  # monotonic time the open segment was created
+        self._dirty = False  # written since the last fsync
+        self._thread = None
+        self._closed = False
+        self._sequence = 0  # segments opened by this log, part of the file name
+        self.counters = {'batches': 0, 'events': 0, 'bytes': 0, 'sealed': 0, 'fsyncs': 0, 'write_errors': 0}
+
+    def append(self, rows):
+        """Append one batch of row tuples as a record; False once the log is closed.
+
+        Raises OSError if the record could not be written; the segment is then
+        cut back to its last complete record and sealed.
+        """
+        record = encode_record(rows)
+        full = None
+        with self._cond:
+            if self._closed:
+                return False
+            try:
+                if self._file is None:
+                    self._open()
+                self._file.write(record)
+                self._file.flush()
+            except OSError:
+                self.counters['write_errors'] += 1
+                self._abandon()
+                raise
+            self._size += len(record)
+            self._dirty = True
+            self.counters['batches'] += 1
+            self.counters['events'] += len(rows)
+            self.counters['bytes'] += len(record)
+            if self._size >= self.max_bytes:
+                full = self._detach()
+            self._start()
+        if full is not None:
+            self._finish(full)  # the fsync does not hold up other appends
+        return True
+
+    def close(self, timeout=30):
+        """Seal the open segment and stop the fsync thread; later appends are refused."""
+        with self._cond:
+            self._closed = True
+            segment = self._detach() if self._file is not None else None
+            self._cond.notify_all()
+            thread = self._thread
+        if segment is not None:
+            self._finish(segment)
+        if thread is not None:
+            thread.join(timeout)
+            atexit.unregister(self.close)
+
+    def stats(self):
+        with self._cond:
+            counters = dict(self.counters)
+            open_bytes = self._size
+        sealed = [name for name in os.listdir(self.directory) if name.endswith(SEALED)]
+        return {'directory': self.directory, 'open_bytes': open_bytes, 'pending_segments': len(sealed),
+                'pending_bytes': sum(os.path.getsize(os.path.join(self.directory, name)) for name in sealed),
+                **counters}
+
+    # --- segments ---
+
+    def _open(self):
+        self._sequence += 1
+        pid = os.getpid()
+        name = f'{datetime.utcnow():%Y%m%dT%H%M%S%f}-{pid}-{_start_time(pid) or 0}-{self._sequence}{OPEN}'
+        self._path = os.path.join(self.directory, name)
+        self._file = open(self._path, 'xb')
+        self._size = 0
+        self._opened = time.monotonic()
+
+    def _detach(self):
+        """Take the open segment out of the log, under the lock; the next append opens a new one."""
+        segment = (self._file, self._path, self._size, self._dirty)
+        self._file = self._path = None
+        self._size = 0
+        self._dirty = False
+        return segment
+
+    def _finish(self, segment):
+        """Fsync, close and seal a detached segment. Called without the lock held."""
+        file, path, size, dirty = segment
+        try:
+            if dirty:
+                os.fsync(file.fileno())
+        finally:
+            file.close()
+        if size:
+            os.replace(path, path[:-len(OPEN)] + SEALED)
+            _fsync_directory(self.directory)
+        else:
+            os.remove(path)
+        with self._cond:
+            if dirty:
+                self.counters['fsyncs'] += 1
+            if size:
+                self.counters['sealed'] += 1
+
+    def _seal(self):
+        self._finish(self._detach())
+
+    def _abandon(self):
+        """After a failed write: cut the torn record off and seal what was complete."""
+        if self._file is None:
+            return
+        path = self._path
+        try:
+            self._file.truncate(self._size)
+            self._seal()
+        except OSError as e:
+            log.error('Segment log: could not seal %s after a failed write: %s', path, e)
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+            self._file = self._path = None
+            self._size = 0
+
+    # --- fsync thread ---
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='segment-log-fsync', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        # Only picks the work under the lock: the fsync runs on a duplicate of the file descriptor, so appends
+        # go on meanwhile and a concurrent seal cannot close the descriptor being synced
+        while True:
+            with self._cond:
+                if not self._closed:
+                    self._cond.wait(self.fsync_interval)
+                if self._closed:
+                    return
+                if self._file is None:
+                    continue
+                path, segment, fd = self._path, None, None
+                try:
+                    if time.monotonic() - self._opened >= self.max_age:
+                        segment = self._detach()
+                    elif self._dirty:
+                        fd = os.dup(self._file.fileno())
+                        self._dirty = False
+                    else:
+                        continue
+                except OSError as e:
+                    self.counters['write_errors'] += 1
+                    log.error('Segment log: fsync of %s failed: %s', path, e)
+                    continue
+            try:
+                if segment is not None:
+                    self._finish(segment)
+                else:
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                    with self._cond:
+                        self.counters['fsyncs'] += 1
+            except OSError as e:
+                with self._cond:
+                    self.counters['write_errors'] += 1
+                    if fd is not None and self._path == path:
+                        self._dirty = True  # try again next interval
+                log.error('Segment log: fsync of %s failed: %s', path, e)
+
+
+def segment_directory(app):
+    """The segment directory of an app (TRACK_SEGMENT_DIR, relative to the instance folder), or None."""
+    directory = app.config.get('TRACK_SEGMENT_DIR')
+    return os.path.join(app.instance_path, directory) if directory else None
+
+
+# --- compactor ---
+
+def _alive(pid, start):
+    """Whether the process that wrote a segment still runs: same PID and, where known, same start time."""
+    if os.name != 'posix':
+        return True  # no cheap check: leave the file to its owner
+    try:
+        os.kill(pid, 0)
+    except (ProcessLookupError, OverflowError):
+        return False
+    except PermissionError:
+        pass
+    # After a restart (e.g. a container whose server is PID 1 again) the PID belongs to another process
+    return not start or _start_time(pid) in (None, start)
+
+
+def seal_stale(directory):
+    """Seal the `.open` segments of processes that are no longer running. Returns their names."""
+    sealed = []
+    for name in sorted(os.listdir(directory)):
+        parts = name[:-len(OPEN)].split('-')
+        # <time>-<pid>-<start>-<n>; <time>-<pid>-<n> segments (no start time) are checked by PID only
+        pid, start = (parts[1], parts[2]) if len(parts) == 4 else (parts[1], '0') if len(parts) == 3 else ('', '')
+        if not name.endswith(OPEN) or not pid.isdigit() or not start.isdigit() or _alive(int(pid), int(start)):
+            continue
+        path = os.path.join(directory, name)
+        end = 0
+        for end, _ in read_records(path):
+            pass
+        with open(path, 'r+b') as f:
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path, path[:-len(OPEN)] + SEALED)
+        sealed.append(name)
+    if sealed:
+        _fsync_directory(directory)
+    return sealed
+
+
+def pending_segments(directory):
+    """Names of the sealed segments not yet loaded, oldest first."""
+    return sorted(name for name in os.listdir(directory) if name.endswith(SEALED))
+
+
+def _advance(name, position, end, rows, completed=False):
+    """Insert `rows` and move the segment's position from `position` to `end`, in one transaction.
+
+    Returns False (and stores nothing) if another compactor moved the position first.
+    """
+    from app import db
+    from app.api import ingest
+    from app.models import SegmentOffset
+    ingest.insert_events(rows)
+    result = db.session.execute(
+        db.update(SegmentOffset)
+        .where(SegmentOffset.name == name, SegmentOffset.position == position)
+        .values(position=end, events=SegmentOffset.events + len(rows), completed=completed,
+                updated_at=datetime.utcnow()))
+    if result.rowcount != 1:
+        db.session.rollback()
+        return False
+    db.session.commit()
+    return True
+
+
+def compact_segment(directory, name, chunk_events=5000):
+    """Load one sealed segment from where the compactor left it; returns the events loaded.
+
+    Returns None if another compactor is working on the segment.
+    """
+    from app import db
+    from app.models import SegmentOffset
+    from sqlalchemy.exc import IntegrityError
+
+    path = os.path.join(directory, name)
+    state = db.session.get(SegmentOffset, name)
+    if state is None:
+        try:
+            state = SegmentOffset(name=name, position=0, events=0, completed=False)
+            db.session.add(state)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return None
+    position, completed = state.position, state.completed
+
+    loaded = 0
+    rows = []
+    end = position
+    if not completed:
+        for end, batch in read_records(path, position):
+            rows.extend(batch)
+            if len(rows) >= chunk_events:
+                if not _advance(name, position, end, rows):
+                    return None
+                loaded += len(rows)
+                position, rows = end, []
+        if not _advance(name, position, end, rows, completed=True):
+            return None
+        loaded += len(rows)
+
+    if end < os.path.getsize(path) and not completed:
+        # Sealed segments end with a complete record; keep the unreadable rest for inspection
+        log.error('Segment log: %s is damaged after byte %d; loaded the records before it', name, end)
+        os.replace(path, path[:-len(SEALED)] + DAMAGED)
+    else:
+        os.remove(path)
+    return loaded
+
+
+def compact(directory, chunk_events=5000):
+    """Seal stale segments and load every sealed segment. Returns (segments, events) loaded."""
+    seal_stale(directory)
+    segments = events = 0
+    for name in pending_segments(directory):
+        loaded = compact_segment(directory, name, chunk_events)
+        if loaded is not None:
+            segments += 1
+            events += loaded
+    return segments, events
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load /api/track segment files into the database.')
+    parser.add_argument('command', choices=['compact', 'status'])
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                        help='compact again every SECONDS until interrupted')
+    parser.add_argument('--chunk', type=int, default=5000, help='events per transaction')
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    from app import create_app
+    from app.config import Config
+
+    app = create_app(Config)
+    directory = segment_directory(app)
+    if directory is None:
+        parser.error('TRACK_SEGMENT_DIR is not set')
+    os.makedirs(directory, exist_ok=True)
+    with app.app_context():
+        if args.command == 'status':
+            names = sorted(os.listdir(directory))
+            for name in names:
+                print(f'{name:<48} {os.path.getsize(os.path.join(directory, name)):>12} bytes')
+            print(f'{len(pending_segments(directory))} sealed segment(s) to load')
+            return 0
+
+        while True:
+            segments, events = compact(directory, args.chunk)
+            print(f'loaded {events} events from {segments} segment(s)', flush=True)
+            if not args.watch:
+                return 0
+            time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -14,3 +14,27 @@ class Config:
     FLASK_ENV = os.getenv('FLASK_ENV', 'production')
     SESSION_COOKIE_SAMESITE = 'None'
     SESSION_COOKIE_SECURE = True
+
+    # Production server and SQLite profile (app/sqlite_profile.py); SQLITE_PROFILE=off keeps SQLite defaults
+    WAITRESS_THREADS = int(os.getenv('WAITRESS_THREADS', 8))
+    SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', 'production')
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+    SQLITE_TEMP_STORE = os.getenv('SQLITE_TEMP_STORE', 'MEMORY')
+    SQLITE_POOL_OVERFLOW = int(os.getenv('SQLITE_POOL_OVERFLOW', 4))
+
+    # Write-behind queue for /api/track (app/api/event_queue.py); opt-in, queued events are acknowledged
+    # before they are committed
+    TRACK_QUEUE_ENABLED = os.getenv('TRACK_QUEUE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    TRACK_QUEUE_MAX_EVENTS = int(os.getenv('TRACK_QUEUE_MAX_EVENTS', 50000))
+    TRACK_QUEUE_BATCH_SIZE = int(os.getenv('TRACK_QUEUE_BATCH_SIZE', 500))
+    TRACK_QUEUE_FLUSH_INTERVAL = float(os.getenv('TRACK_QUEUE_FLUSH_INTERVAL', 1.0))
+
+    # Segment log for /api/track (app/api/segment_log.py); replaces the queue when set
+    TRACK_SEGMENT_DIR = os.getenv('TRACK_SEGMENT_DIR', '')
+    TRACK_SEGMENT_MAX_BYTES = int(os.getenv('TRACK_SEGMENT_MAX_BYTES', 8 * 1024 * 1024))
+    TRACK_SEGMENT_MAX_AGE = float(os.getenv('TRACK_SEGMENT_MAX_AGE', 60.0))
+    TRACK_SEGMENT_FSYNC_INTERVAL = float(os.getenv('TRACK_SEGMENT_FSYNC_INTERVAL', 1.0))
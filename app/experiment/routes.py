@@ -254,7 +254,11 @@ def method_page(experiment_id, method_session_id):
     handler = get_method_handler(method.method_type)
 
     if request.method == 'POST':
-        result = handler.process_response(request.form, method_session, risks)
+        if method_session.status == 'completed':
+            # A repeated submit (double click, back button): the results are already stored
+            result = {'complete': True}
+        else:
+            result = handler.process_response(request.form, method_session, risks)
 
         if result.get('error'):
             flash(result['error'], 'danger')
@@ -276,7 +280,7 @@ def method_page(experiment_id, method_session_id):
                 return redirect(url_for('experiment.between_methods',
                                         experiment_id=experiment_id))
             else:
-                exp_session.completed_at = datetime.utcnow()
+                exp_session.completed_at = exp_session.completed_at or datetime.utcnow()
                 db.session.commit()
                 return redirect(url_for('experiment.complete',
                                         experiment_id=experiment_id))
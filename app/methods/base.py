@@ -1,4 +1,6 @@
+import json
 from abc import ABC, abstractmethod
+from datetime import datetime
 
 
 class BaseMethod(ABC):
@@ -59,3 +61,59 @@ class BaseMethod(ABC):
             list of dicts with risk results
         """
         pass
+
+    def get_prior_scores(self, method_session, risks, parameter):
+        """
+        Get scores from a completed session of this method, used to warm-start Uranus.
+
+        Args:
+            method_session: completed MethodSession instance
+            risks: list of Risk instances
+            parameter: name of the Uranus parameter the scores are for
+
+        Returns:
+            dict of risk id -> number (higher = higher priority), or None if
+            the method has no ordering to offer
+        """
+        return None
+
+    @staticmethod
+    def _results_for_parameter(method_session, parameter):
+        """Result data dicts of a per-parameter method for `parameter`, else those for 'overall'."""
+        from app.models import AssessmentResult
+        results = [(r.risk_id, r.get_result_data())
+                   for r in AssessmentResult.query.filter_by(method_session_id=method_session.id).all()]
+        for name in (parameter, 'overall'):
+            selected = [(risk_id, data) for risk_id, data in results if data.get('parameter', 'overall') == name]
+            if selected:
+                return selected
+        return []
+
+    @staticmethod
+    def _complete_with_results(method_session, rows):
+        """
+        Store the results of a validated submission and complete the session, in one transaction.
+
+        All rows are written with a single executemany INSERT rather than one
+        ORM object each, so a submission is stored completely or not at all.
+        Their typed rows (app/result_tables.py) are written in the same transaction.
+
+        Args:
+            method_session: MethodSession instance
+            rows: list of (risk_id, result data dict); a 'timestamp' is added to each
+        """
+        from app import db
+        from app.models import AssessmentResult
+        from app.result_tables import insert_rows
+        now = datetime.utcnow()
+        timestamp = now.isoformat()
+        if rows:
+            db.session.execute(AssessmentResult.__table__.insert(), [
+                {'method_session_id': method_session.id, 'risk_id': risk_id,
+                 'result_data': json.dumps({**data, 'timestamp': timestamp})}
+                for risk_id, data in rows
+            ])
+            insert_rows(method_session, rows)
+        method_session.status = 'completed'
+        method_session.completed_at = now
+        db.session.commit()
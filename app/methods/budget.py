@@ -1,4 +1,3 @@
-from datetime import datetime
 from app.methods.base import BaseMethod
 
 
@@ -16,9 +15,6 @@ class BudgetMethod(BaseMethod):
         return 'methods/budget.html'
 
     def process_response(self, form_data, method_session, risks):
-        from app.models import AssessmentResult
-        from app import db
-
         config = method_session.method.get_config()
         total_points = config.get('total_points', 100)
         mode = config.get('mode', 'overall')
@@ -29,6 +25,8 @@ class BudgetMethod(BaseMethod):
         else:
             params_to_process = ['overall']
 
+        # Validate every parameter before anything is written
+        rows = []
         for param in params_to_process:
             allocated_sum = 0
             allocations = {}
@@ -56,20 +54,12 @@ class BudgetMethod(BaseMethod):
                 }
 
             for risk in risks:
-                result = AssessmentResult(
-                    method_session_id=method_session.id,
-                    risk_id=risk.id,
-                )
-                result.set_result_data({
+                rows.append((risk.id, {
                     'points': allocations[risk.id],
                     'parameter': param,
-                    'timestamp': datetime.utcnow().isoformat(),
-                })
-                db.session.add(result)
+                }))
 
-        method_session.status = 'completed'
-        method_session.completed_at = datetime.utcnow()
-        db.session.commit()
+        self._complete_with_results(method_session, rows)
 
         return {'complete': True, 'context': {}}
 
@@ -1,4 +1,3 @@
-from datetime import datetime
 from app.methods.base import BaseMethod
 
 
@@ -16,9 +15,6 @@ class CategorizationMethod(BaseMethod):
         return 'methods/categorization.html'
 
     def process_response(self, form_data, method_session, risks):
-        from app.models import AssessmentResult
-        from app import db
-
         config = method_session.method.get_config()
         categories = config.get('categories', self.default_config()['categories'])
         mode = config.get('mode', 'overall')
@@ -29,6 +25,8 @@ class CategorizationMethod(BaseMethod):
         else:
             params_to_process = ['overall']
 
+        # Validate every parameter before anything is written
+        rows = []
         for param in params_to_process:
             for risk in risks:
                 key = f"category_{param}_{risk.id}"
@@ -40,20 +38,12 @@ class CategorizationMethod(BaseMethod):
                         'context': self.get_context(method_session, risks),
                     }
 
-                result = AssessmentResult(
-                    method_session_id=method_session.id,
-                    risk_id=risk.id,
-                )
-                result.set_result_data({
+                rows.append((risk.id, {
                     'category': category,
                     'parameter': param,
-                    'timestamp': datetime.utcnow().isoformat(),
-                })
-                db.session.add(result)
+                }))
 
-        method_session.status = 'completed'
-        method_session.completed_at = datetime.utcnow()
-        db.session.commit()
+        self._complete_with_results(method_session, rows)
 
         return {'complete': True, 'context': {}}
 
@@ -89,3 +79,11 @@ class CategorizationMethod(BaseMethod):
             })
         summary.sort(key=lambda x: (x['parameter'], x['category']))
         return {'type': 'categorization', 'results': summary}
+
+    def get_prior_scores(self, method_session, risks, parameter):
+        # Categories are ordered from high to low priority
+        config = method_session.method.get_config()
+        categories = config.get('categories', self.default_config()['categories'])
+        return {risk_id: -categories.index(data['category'])
+                for risk_id, data in self._results_for_parameter(method_session, parameter)
+                if data.get('category') in categories}
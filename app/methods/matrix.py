@@ -1,4 +1,3 @@
-from datetime import datetime
 from app.methods.base import BaseMethod
 
 
@@ -43,26 +42,34 @@ class MatrixMethod(BaseMethod):
         return 'methods/matrix.html'
 
     def process_response(self, form_data, method_session, risks):
-        from app.models import AssessmentResult
-        from app import db
-
         config = method_session.method.get_config()
         criteria = config.get('criteria', self.default_config()['criteria'])
         aggregation = config.get('aggregation', 'product')
         weights = config.get('weights', {})
 
+        # Validate every risk before anything is written
+        rows = []
         for risk in risks:
             criteria_values = {}
             for criterion in criteria:
                 key = f"{criterion['name']}_{risk.id}"
-                val = form_data.get(key)
-                if val is None or val == '':
+                try:
+                    value = int(form_data.get(key))
+                except (ValueError, TypeError):
                     return {
                         'complete': False,
                         'error': f"Please fill in all fields for all risks.",
                         'context': self.get_context(method_session, risks),
                     }
-                criteria_values[criterion['name']] = int(val)
+                low, high = criterion.get('scale_min'), criterion.get('scale_max')
+                if (low is not None and value < low) or (high is not None and value > high):
+                    return {
+                        'complete': False,
+                        'error': f"Please choose a value on the {criterion.get('display_name', criterion['name'])} "
+                                 f"scale for every risk.",
+                        'context': self.get_context(method_session, risks),
+                    }
+                criteria_values[criterion['name']] = value
 
             # Calculate priority
             if aggregation == 'product':
@@ -75,20 +82,12 @@ class MatrixMethod(BaseMethod):
                     w = weights.get(name, 1)
                     priority += v * w
 
-            result = AssessmentResult(
-                method_session_id=method_session.id,
-                risk_id=risk.id,
-            )
-            result.set_result_data({
+            rows.append((risk.id, {
                 'criteria_values': criteria_values,
                 'priority': priority,
-                'timestamp': datetime.utcnow().isoformat(),
-            })
-            db.session.add(result)
+            }))
 
-        method_session.status = 'completed'
-        method_session.completed_at = datetime.utcnow()
-        db.session.commit()
+        self._complete_with_results(method_session, rows)
 
         return {
             'complete': True,
@@ -119,3 +118,12 @@ class MatrixMethod(BaseMethod):
             })
         summary.sort(key=lambda x: x['priority'], reverse=True)
         return {'type': 'matrix', 'results': summary}
+
+    def get_prior_scores(self, method_session, risks, parameter):
+        from app.models import AssessmentResult
+        # The criterion of the same name if there is one, otherwise the aggregated priority
+        scores = {}
+        for r in AssessmentResult.query.filter_by(method_session_id=method_session.id).all():
+            data = r.get_result_data()
+            scores[r.risk_id] = data.get('criteria_values', {}).get(parameter, data.get('priority'))
+        return scores
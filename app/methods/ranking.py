@@ -1,4 +1,3 @@
-from datetime import datetime
 from app.methods.base import BaseMethod
 
 
@@ -15,9 +14,6 @@ class RankingMethod(BaseMethod):
         return 'methods/ranking.html'
 
     def process_response(self, form_data, method_session, risks):
-        from app.models import AssessmentResult
-        from app import db
-
         config = method_session.method.get_config()
         mode = config.get('mode', 'overall')
         parameters = config.get('parameters', [])
@@ -27,32 +23,31 @@ class RankingMethod(BaseMethod):
         else:
             params_to_process = ['overall']
 
+        # Validate every parameter before anything is written
+        known = {r.id for r in risks}
+        rows = []
         for param in params_to_process:
             order_key = f'order_{param}'
             order_str = form_data.get(order_key, '')
-            if not order_str:
+            try:
+                risk_ids = [int(x) for x in order_str.split(',') if x.strip()]
+            except ValueError:
+                risk_ids = []
+            # Each id once, and only the experiment's risks
+            if not risk_ids or len(set(risk_ids)) != len(risk_ids) or not known.issuperset(risk_ids):
                 return {
                     'complete': False,
                     'error': 'Please rank all risks before submitting.',
                     'context': self.get_context(method_session, risks),
                 }
 
-            risk_ids = [int(x) for x in order_str.split(',') if x.strip()]
             for rank, risk_id in enumerate(risk_ids, 1):
-                result = AssessmentResult(
-                    method_session_id=method_session.id,
-                    risk_id=risk_id,
-                )
-                result.set_result_data({
+                rows.append((risk_id, {
                     'rank': rank,
                     'parameter': param,
-                    'timestamp': datetime.utcnow().isoformat(),
-                })
-                db.session.add(result)
+                }))
 
-        method_session.status = 'completed'
-        method_session.completed_at = datetime.utcnow()
-        db.session.commit()
+        self._complete_with_results(method_session, rows)
 
         return {'complete': True, 'context': {}}
 
@@ -86,3 +81,8 @@ class RankingMethod(BaseMethod):
             })
         summary.sort(key=lambda x: (x['parameter'], x['rank']))
         return {'type': 'ranking', 'results': summary}
+
+    def get_prior_scores(self, method_session, risks, parameter):
+        # Rank 1 is the most important risk
+        return {risk_id: -data['rank'] for risk_id, data in self._results_for_parameter(method_session, parameter)
+                if 'rank' in data}
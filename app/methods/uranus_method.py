@@ -1,31 +1,141 @@
 import json
 import copy
+import threading
+import zlib
+from collections import OrderedDict
 from datetime import datetime
 from app.methods.base import BaseMethod
 
 
+class UranusCache:
+    """Bounded, thread-safe LRU of hydrated Uranus instances keyed by MethodSession id.
+
+    The DB row stays the source of truth: each entry carries a stamp (the serialized
+    state it was saved as, parameter and risk names and the risk fingerprint) and is only
+    reused while the row still holds exactly that state for the same risks. Instances are checked out (removed) while a
+    request works on them and put back after their state is saved, so a request that
+    fails halfway never leaves a half-mutated instance behind.
+    """
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def checkout(self, key, stamp):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None or entry[0] != stamp:
+            return None
+        return entry[1]
+
+    def put(self, key, stamp, u):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (stamp, u)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+uranus_cache = UranusCache()
+
+
+def risk_fingerprint(risks):
+    """CRC-32 of the risk ids in order: the list the element indexes of a Uranus state refer to."""
+    return zlib.crc32(','.join(str(r.id) for r in risks).encode('ascii'))
+
+
 class UranusMethod(BaseMethod):
     """Wrapper around uranus.py for per-session pairwise comparison."""
 
     def default_config(self):
         return {
             'parameters': ['impact', 'probability'],
+            'top_k': None,  # only order the K highest risks per parameter (None: full ranking)
+            'scheduler': 'binary',  # comparison schedule: 'binary' insertion or 'ford_johnson' merge-insertion
+            'warm_start_from': None,  # method type(s) whose earlier results seed the binary searches
         }
 
     def get_template(self):
         return 'methods/uranus.html'
 
-    def _create_uranus(self, parameters, risk_names):
-        """Create a new Uranus instance. Import here to avoid global state."""
+    @staticmethod
+    def _top_k(config):
+        """The configured top_k, or None when unset or not a positive integer."""
+        top_k = config.get('top_k')
+        if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+            return None
+        return top_k
+
+    @staticmethod
+    def _uranus_module():
+        """Import uranus.py here to avoid global state."""
         import sys
         import os
         # Ensure uranus.py is importable
         neptune_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         if neptune_dir not in sys.path:
             sys.path.insert(0, neptune_dir)
-        from uranus import Uranus
-        u = Uranus(list(parameters), list(risk_names))
-        u.set_logging(False)  # Don't write log files from per-session instances
+        import uranus
+        return uranus
+
+    def _scheduler(self, config):
+        """The configured scheduler name, or 'binary' when unset or unknown."""
+        scheduler = config.get('scheduler')
+        if isinstance(scheduler, str) and scheduler in self._uranus_module().SCHEDULERS:
+            return scheduler
+        return 'binary'
+
+    def _warm_start_prior(self, method_session, risks, parameters, config):
+        """Prior scores per parameter from the first completed `warm_start_from` method of the same session.
+
+        Scores are turned into dense integer ranks (equal scores share a rank). A
+        parameter gets None unless every risk has a score. Returns None if there is
+        no usable earlier result.
+        """
+        from app.methods import get_method_handler
+        sources = config.get('warm_start_from')
+        if isinstance(sources, str):
+            sources = [sources]
+        if not isinstance(sources, list):
+            return None
+        earlier = [ms for ms in method_session.session.method_sessions
+                   if ms.status == 'completed' and ms.id != method_session.id]
+        for source in sources:
+            for ms in earlier:
+                if source == 'uranus' or ms.method.method_type != source:
+                    continue
+                handler = get_method_handler(source)
+                prior = []
+                for parameter in parameters:
+                    scores = handler.get_prior_scores(ms, risks, parameter) or {}
+                    values = [scores.get(r.id) for r in risks]
+                    if any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in values):
+                        prior.append(None)
+                        continue
+                    rank = {v: i for i, v in enumerate(sorted(set(values)))}
+                    prior.append([rank[v] for v in values])
+                if any(p is not None for p in prior):
+                    return prior
+        return None
+
+    def _create_uranus(self, parameters, risk_names, top_k=None, scheduler='binary', prior=None):
+        """Create a new Uranus instance."""
+        uranus = self._uranus_module()
+        # Don't write log files from per-session instances
+        u = uranus.Uranus(list(parameters), list(risk_names), log_sink=uranus.NullLogSink(), top_k=top_k,
+                          scheduler=scheduler, prior=prior)
+        u.set_logging(False)
+        u.risk_fingerprint = None  # set by _get_or_create_uranus() for the risks the indexes refer to
         return u
 
     def _serialize_state(self, u):
@@ -36,53 +146,95 @@ class UranusMethod(BaseMethod):
             'num_parameters': u.num_parameters,
             'num_elements': u.num_elements,
             'num_comparisons': u.num_comparisons,
-            'prioritized': u.prioritized,
+            'prioritized': [list(p) for p in u.prioritized],
             'next_elem': u.next_elem,
             'next_parameter': u.next_parameter,
             'next_range': u.next_range,
             'final_list': u.final_list,
+            'top_k': u.top_k,
+            'below_cut': [sorted(b) for b in u.below_cut],
+            'scheduler': u.scheduler.name,
+            'scheduler_state': u.scheduler.get_state(),
+            'prior': u.prior,
+            'next_gallop': u.next_gallop,
+            'risk_fingerprint': getattr(u, 'risk_fingerprint', None),
         }
 
     def _restore_state(self, state, parameters, risk_names):
         """Restore Uranus instance from serialized state."""
-        u = self._create_uranus(parameters, risk_names)
-        u.p_names = state['p_names']
-        u.e_names = state['e_names']
+        # A session keeps the top_k and scheduler it started with (older states are binary full rankings)
+        u = self._create_uranus(parameters, risk_names, state.get('top_k'), state.get('scheduler', 'binary'))
+        # Names are only present in legacy JSON states; the compact codec takes them from config/risks
+        u.p_names = state.get('p_names', u.p_names)
+        u.e_names = state.get('e_names', u.e_names)
         u.num_parameters = state['num_parameters']
         u.num_elements = state['num_elements']
         u.num_comparisons = state['num_comparisons']
+        u.below_cut = state.get('below_cut') or [[] for _ in state['prioritized']]
         u.prioritized = state['prioritized']
         u.next_elem = state['next_elem']
         u.next_parameter = state['next_parameter']
         u.next_range = state['next_range']
         u.final_list = state.get('final_list', [])
+        u.prior = state.get('prior')
+        u.next_gallop = state.get('next_gallop', 0)
+        u.scheduler.set_state(u, state.get('scheduler_state'))
+        u.risk_fingerprint = state.get('risk_fingerprint')
         return u
 
     def _get_or_create_uranus(self, method_session, risks):
-        """Get existing Uranus instance from session state or create new one."""
+        """Get the cached Uranus instance, or restore it from session state, or create a new one."""
         config = method_session.method.get_config()
         parameters = config.get('parameters', ['impact', 'probability'])
         risk_names = [r.name for r in risks]
+        fingerprint = risk_fingerprint(risks)
 
-        state = method_session.get_uranus_state()
-        if state:
-            return self._restore_state(state, parameters, risk_names)
-        else:
-            u = self._create_uranus(parameters, risk_names)
+        stamp = (method_session.uranus_state, tuple(parameters), tuple(risk_names), fingerprint)
+        u = uranus_cache.checkout(method_session.id, stamp)
+        if u is not None:
             return u
 
-    def process_response(self, form_data, method_session, risks):
-        from app.models import AssessmentResult
-        from app import db
+        u = None
+        state = method_session.get_uranus_state()
+        # States written before the fingerprint was stored are trusted as they are
+        if state and state.get('risk_fingerprint') in (None, fingerprint):
+            u = self._restore_state(state, parameters, risk_names)
+        elif method_session.uranus_state:
+            # Unreadable snapshot, or one whose indexes refer to another risk list (risks added, removed or
+            # reordered since): rebuild the state from the stored comparisons, which name the risks by id
+            from app import uranus_replay
+            result = uranus_replay.replay(uranus_replay.session_job(method_session, risks))
+            if result['status'] != 'error':
+                u = self._restore_state(result['state'], parameters, risk_names)
+        if u is None:
+            u = self._create_uranus(parameters, risk_names, *self._new_session_settings(method_session, risks))
+        u.risk_fingerprint = fingerprint
+        return u
 
-        u = self._get_or_create_uranus(method_session, risks)
+    def _new_session_settings(self, method_session, risks):
+        """(top_k, scheduler, prior) for a session that has no state yet, from the method config."""
+        config = method_session.method.get_config()
+        scheduler = self._scheduler(config)
+        if scheduler != 'binary':
+            # top-K selection and warm starts are part of the binary insertion schedule
+            return None, scheduler, None
+        parameters = config.get('parameters', ['impact', 'probability'])
+        return self._top_k(config), scheduler, self._warm_start_prior(method_session, risks, parameters, config)
 
-        choice = int(form_data['choice'])
-        a = int(form_data['a'])
-        b = int(form_data['b'])
-        c = int(form_data['c'])
+    def _release(self, method_session, u):
+        """Return an unchanged (or just saved) instance to the cache for the next request."""
+        if not u.is_done():
+            stamp = (method_session.uranus_state, tuple(u.p_names), tuple(u.e_names), u.risk_fingerprint)
+            uranus_cache.put(method_session.id, stamp, u)
+
+    def _save_state(self, method_session, u):
+        """Write the Uranus state to the session row and keep the live instance for the next request."""
+        method_session.set_uranus_state(self._serialize_state(u))
+        self._release(method_session, u)
 
-        # Save comparison result
+    def _comparison_result(self, u, method_session, risks, a, b, c, choice):
+        """Build the AssessmentResult recording one answer (before it is applied to u)."""
+        from app.models import AssessmentResult
         chosen = "A" if choice == 0 else "B"
         result = AssessmentResult(
             method_session_id=method_session.id,
@@ -99,19 +251,26 @@ class UranusMethod(BaseMethod):
             'chosen': chosen,
             'timestamp': datetime.utcnow().isoformat(),
         })
-        db.session.add(result)
+        return result
 
-        # Apply choice to Uranus
-        try:
-            u.set_priority(choice)
-        except Exception:
-            pass
+    def _add_comparison(self, u, method_session, risks, a, b, c, choice):
+        """Add the AssessmentResult and typed PairwiseComparison for one answer (before it is applied to u)."""
+        from app import db
+        from app.result_tables import typed_rows
+        result = self._comparison_result(u, method_session, risks, a, b, c, choice)
+        db.session.add(result)
+        for model, row in typed_rows('uranus', method_session.id, result.risk_id, result.get_result_data(), []):
+            db.session.add(model(**row))
 
-        # Save state
-        method_session.set_uranus_state(self._serialize_state(u))
+    def _save_and_finish(self, method_session, u):
+        """Save state; if all comparisons are made, complete the session and store the final ranking."""
+        from app.models import AssessmentResult
+        from app.result_tables import insert_rows
+        from app import db
 
-        # Check if done
-        if u.is_done():
+        self._save_state(method_session, u)
+        if u.is_done() and method_session.status != 'completed':
+            # Only on the transition: the final ranking and its typed rows are written once per session
             method_session.status = 'completed'
             method_session.completed_at = datetime.utcnow()
 
@@ -125,12 +284,41 @@ class UranusMethod(BaseMethod):
                 ranking_result.set_result_data({
                     'type': 'final_ranking',
                     'ranking': final_list,
-                    'prioritized': u.prioritized,
+                    'prioritized': [list(p) for p in u.prioritized],
+                    'top_k': u.top_k,
+                    'scheduler': u.scheduler.name,
                     'num_comparisons': u.num_comparisons,
                     'timestamp': datetime.utcnow().isoformat(),
                 })
                 db.session.add(ranking_result)
+                insert_rows(method_session, [(None, ranking_result.get_result_data())])
 
+    def process_response(self, form_data, method_session, risks):
+        from app import db
+
+        try:
+            a, b, c, choice = (int(form_data[k]) for k in ('a', 'b', 'c', 'choice'))
+        except (KeyError, TypeError, ValueError):
+            return {'error': 'Invalid comparison answer.'}
+        if choice not in (0, 1):
+            return {'error': 'Invalid comparison answer.'}
+
+        u = self._get_or_create_uranus(method_session, risks)
+        if (a, b, c) != u.peek_next():
+            # A repeated or stale POST (double submit, back button, second tab): the pair it answers is no
+            # longer pending, so nothing is stored and the current comparison is shown again
+            self._release(method_session, u)
+            return {
+                'complete': method_session.status == 'completed' or u.is_done(),
+                'context': self.get_context(method_session, risks),
+            }
+
+        # Save comparison result, then apply the choice to the pending comparison it answers
+        self._add_comparison(u, method_session, risks, a, b, c, choice)
+        u.next_to_process()
+        u.set_priority(choice)
+
+        self._save_and_finish(method_session, u)
         db.session.commit()
 
         return {
@@ -138,18 +326,99 @@ class UranusMethod(BaseMethod):
             'context': self.get_context(method_session, risks),
         }
 
+    def process_batch(self, answers, version, method_session, risks):
+        """
+        Apply a batch of answers made locally by the page, in one transaction.
+
+        Args:
+            answers: list of {'a', 'b', 'c', 'choice'} dicts, in the order they were made
+            version: number of comparisons the state had when the first answer was made
+            method_session: MethodSession instance
+            risks: list of Risk instances
+
+        Returns:
+            dict with keys:
+                'applied': int - number of answers applied (a valid prefix of the batch)
+                'error': str or None - why the rest of the batch was rejected
+                'conflict': bool - the state moved on since `version`, or an answer does not match it
+                'version', 'complete', 'progress', 'next': state after applying
+        """
+        from app import db
+
+        u = self._get_or_create_uranus(method_session, risks)
+        applied = 0
+        error = None
+        conflict = False
+
+        if method_session.status == 'completed' or u.is_done():
+            error, conflict = 'Method already completed.', True
+        elif version != u.num_comparisons:
+            error, conflict = f'State version is {u.num_comparisons}, not {version}.', True
+        else:
+            for answer in answers:
+                try:
+                    a, b, c, choice = (int(answer[k]) for k in ('a', 'b', 'c', 'choice'))
+                except (KeyError, TypeError, ValueError):
+                    error = f'Answer {applied} is malformed.'
+                    break
+                if choice not in (0, 1):
+                    error = f'Answer {applied} has an invalid choice.'
+                    break
+                if (a, b, c) != u.peek_next():
+                    error, conflict = f'Answer {applied} does not match the pending comparison.', True
+                    break
+                self._add_comparison(u, method_session, risks, a, b, c, choice)
+                u.next_to_process()
+                u.set_priority(choice)
+                applied += 1
+
+        if applied:
+            self._save_and_finish(method_session, u)
+            db.session.commit()
+        else:
+            self._release(method_session, u)
+
+        return {
+            'applied': applied,
+            'error': error,
+            'conflict': conflict,
+            'version': u.num_comparisons,
+            'complete': u.is_done(),
+            'progress': u.progress(),
+            'next': self._comparison(u, *u.peek_next()),
+            'prefetch': self._prefetch(u),
+        }
+
+    def _comparison(self, u, a, b, c):
+        """JSON description of a pending comparison, or None when there is none."""
+        if a is None or b is None or c is None:
+            return None
+        return {
+            'a': a,
+            'b': b,
+            'c': c,
+            'parameter': u.p_names[c],
+            'risk_a': u.e_names[a],
+            'risk_b': u.e_names[b],
+        }
+
+    def _prefetch(self, u):
+        """The comparison that follows each possible answer ('0', '1'), computed on copies of the state."""
+        if u.peek_next()[0] is None:
+            return None
+        return {str(choice): self._comparison(u, *u.peek_after(choice)) for choice in (0, 1)}
+
     def get_context(self, method_session, risks):
         u = self._get_or_create_uranus(method_session, risks)
 
+        # Read-only: peek_next() does not change the state, so rendering the page writes nothing
         try:
-            a, b, c = u.next_to_process()
+            a, b, c = u.peek_next()
+            prefetch = self._prefetch(u)
         except Exception:
             a, b, c = None, None, None
-
-        # Save state after next_to_process (it may modify internal state)
-        method_session.set_uranus_state(self._serialize_state(u))
-        from app import db
-        db.session.commit()
+            prefetch = None
+        self._release(method_session, u)
 
         if a is None or b is None or c is None:
             return {
@@ -165,23 +434,25 @@ class UranusMethod(BaseMethod):
             'p_names': u.p_names,
             'e_names': u.e_names,
             'progress': u.progress(),
+            'version': u.num_comparisons,
+            'current': self._comparison(u, a, b, c),
+            'prefetch': prefetch,
         }
 
     def get_results_summary(self, method_session, risks):
         """Get the final ranking from stored results."""
         from app.models import AssessmentResult
+        from app.result_tables import final_ranks
         results = AssessmentResult.query.filter_by(method_session_id=method_session.id).all()
 
         # Find the final_ranking result
         for r in results:
             data = r.get_result_data()
             if data.get('type') == 'final_ranking':
-                ranking = data.get('ranking', [])
-                risk_names = [risks[i].name if i < len(risks) else f'Risk {i}' for i in ranking]
                 return {
                     'type': 'ranking',
-                    'ranking': [{'rank': idx + 1, 'risk': name, 'risk_index': ri}
-                                for idx, (ri, name) in enumerate(zip(ranking, risk_names))],
+                    'ranking': [{'rank': rank, 'risk': risks[ri].name if ri < len(risks) else f'Risk {ri}',
+                                 'risk_index': ri} for ri, rank in final_ranks(data)],
                     'num_comparisons': data.get('num_comparisons', 0),
                 }
 
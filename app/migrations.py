@@ -0,0 +1,197 @@
+"""Versioned forward migrations for databases created by earlier versions.
+
+db.create_all() creates missing tables (with their indexes) but never alters
+a table that already exists, so an index or data change to an existing table
+needs a migration. Each migration in MIGRATIONS has a version number and runs
+at most once per database: it is applied in one transaction together with
+its schema_version row. create_app() applies pending migrations on startup
+after create_all(); the command line gives the same runner plus a check:
+
+    python -m app.migrations upgrade    apply pending migrations
+    python -m app.migrations status     list migrations and when they were applied
+    python -m app.migrations verify     report pending migrations, missing indexes
+                                        and the query plans of the hot queries
+
+Migrations must be idempotent (CREATE INDEX IF NOT EXISTS, rebuilds): a fresh
+database already has everything create_all() made, and the sqlite3 driver
+runs DDL outside the transaction, so an index created by a migration that
+fails afterwards stays behind. Never edit an applied migration; add a new one.
+"""
+
+import argparse
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+
+def _backfill_result_tables():
+    from app import result_tables
+    result_tables.backfill(commit=False)
+
+
+def _create_indexes(*indexes):
+    """Migration creating (name, table, columns) indexes that do not exist yet."""
+    def migrate():
+        from app import db
+        quote = db.engine.dialect.identifier_preparer.quote
+        for name, table, columns in indexes:
+            db.session.execute(text(f'CREATE INDEX IF NOT EXISTS {quote(name)} ON {quote(table)} '
+                                    f'({", ".join(quote(c) for c in columns)})'))
+    return migrate
+
+
+# Indexes for the queries in HOT_QUERIES, as declared on the models
+HOT_PATH_INDEXES = [
+    ('ix_method_session_session_status_order', 'method_session', ('session_id', 'status', 'order')),
+    ('ix_method_session_method_status', 'method_session', ('method_id', 'status')),
+    ('ix_assessment_result_method_session', 'assessment_result', ('method_session_id',)),
+    ('ix_interaction_event_session_timestamp', 'interaction_event', ('session_id', 'timestamp')),
+    ('ix_interaction_event_method_session_timestamp', 'interaction_event', ('method_session_id', 'timestamp')),
+    ('ix_interaction_event_event_type', 'interaction_event', ('event_type',)),
+    ('ix_participant_experiment_name', 'participant', ('experiment_id', 'name')),
+]
+
+# (version, name, function), in the order they are applied
+MIGRATIONS = [
+    (1, 'backfill typed result tables', _backfill_result_tables),
+    (2, 'hot path indexes', _create_indexes(*HOT_PATH_INDEXES)),
+]
+
+# Queries on the participant and admin hot paths: (name, SQL, parameters)
+HOT_QUERIES = [
+    ('next method session',
+     'SELECT id FROM method_session WHERE session_id = :id AND status IN (\'pending\', \'in_progress\') '
+     'ORDER BY "order" LIMIT 1', {'id': 1}),
+    ('completed sessions of a method',
+     'SELECT id FROM method_session WHERE method_id = :id AND status = \'completed\'', {'id': 1}),
+    ('results of a method session',
+     'SELECT id, risk_id, result_data FROM assessment_result WHERE method_session_id = :id', {'id': 1}),
+    ('events of a session',
+     'SELECT id FROM interaction_event WHERE session_id = :id ORDER BY timestamp', {'id': 1}),
+    ('events of a method session',
+     'SELECT id FROM interaction_event WHERE method_session_id = :id ORDER BY timestamp', {'id': 1}),
+    ('events of a type',
+     'SELECT count(*) FROM interaction_event WHERE event_type = :type', {'type': 'click'}),
+    ('participant by name',
+     'SELECT id FROM participant WHERE experiment_id = :id AND name = :name LIMIT 1', {'id': 1, 'name': ''}),
+]
+
+
+def applied_versions():
+    """{version: applied_at} of the migrations applied to the database."""
+    from app.models import SchemaVersion
+    return {row.version: row.applied_at for row in SchemaVersion.query.all()}
+
+
+def upgrade(target=None):
+    """Apply pending migrations (up to version `target`) in order. Returns the versions applied.
+
+    A migration that another process applied first (its schema_version row
+    already exists when ours is written) is rolled back and skipped.
+    """
+    from app import db
+    from app.models import SchemaVersion
+    SchemaVersion.__table__.create(db.engine, checkfirst=True)
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if (target is not None and version > target) or version in applied_versions():
+            continue
+        try:
+            migrate()
+            db.session.add(SchemaVersion(version=version, name=name))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            continue
+        except Exception:
+            db.session.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def missing_indexes():
+    """(table, index) pairs declared on the models but absent from the database."""
+    from app import db
+    inspector = inspect(db.engine)
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        missing += [(table.name, ix.name) for ix in sorted(table.indexes, key=lambda ix: ix.name)
+                    if ix.name not in existing]
+    return missing
+
+
+def query_plan(sql, params):
+    """The database's plan for a query, as a list of lines."""
+    from app import db
+    if db.engine.dialect.name == 'sqlite':
+        return [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql), params)]
+    return [str(row[0]) for row in db.session.execute(text('EXPLAIN ' + sql), params)]
+
+
+def full_scan(plan):
+    """Whether an SQLite plan reads a whole table rather than searching an index."""
+    return any(line.startswith('SCAN ') and ' USING ' not in line for line in plan)
+
+
+def verify():
+    """Check the database against the models and migrations.
+
+    Returns a dict with 'pending' (migration versions not applied), 'missing'
+    (see missing_indexes()) and 'plans' ({query name: plan lines}).
+    """
+    from app import db
+    applied = applied_versions() if inspect(db.engine).has_table('schema_version') else {}
+    return {
+        'pending': [version for version, _, _ in MIGRATIONS if version not in applied],
+        'missing': missing_indexes(),
+        'plans': {name: query_plan(sql, params) for name, sql, params in HOT_QUERIES},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply and check versioned schema migrations.')
+    parser.add_argument('command', choices=['upgrade', 'status', 'verify'])
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    from app import create_app
+    from app.config import Config
+
+    # Not migrated on startup, so that verify reports the database as it is
+    app = create_app(Config, migrate=False)
+    with app.app_context():
+        if args.command == 'upgrade':
+            applied = upgrade()
+            print(f'applied {len(applied)} migration(s)' + (': ' + ', '.join(map(str, applied)) if applied else ''))
+            return 0
+        if args.command == 'status':
+            applied = applied_versions()
+            for version, name, _ in MIGRATIONS:
+                when = applied[version].isoformat(' ', 'seconds') if version in applied else 'pending'
+                print(f'{version:>4}  {name:<40} {when}')
+            return 0
+
+        report = verify()
+        for version in report['pending']:
+            print(f'pending migration {version}')
+        for table, index in report['missing']:
+            print(f'missing index {index} on {table}')
+        scans = 0
+        for name, plan in report['plans'].items():
+            flag = '  FULL SCAN' if full_scan(plan) else ''
+            scans += bool(flag)
+            print(f'{name}:{flag}')
+            for line in plan:
+                print(f'    {line}')
+        ok = not (report['pending'] or report['missing'] or scans)
+        print('ok' if ok else 'problems found')
+        return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
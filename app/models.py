@@ -1,5 +1,5 @@
 from datetime import datetime
-from app import db
+from app import db, uranus_codec
 import json
 
 
@@ -88,6 +88,7 @@ class Method(db.Model):
 
 class Participant(db.Model):
     __tablename__ = 'participant'
+    __table_args__ = (db.Index('ix_participant_experiment_name', 'experiment_id', 'name'),)
 
     id = db.Column(db.Integer, primary_key=True)
     experiment_id = db.Column(db.Integer, db.ForeignKey('experiment.id'), nullable=False)
@@ -134,6 +135,10 @@ class Session(db.Model):
 
 class MethodSession(db.Model):
     __tablename__ = 'method_session'
+    __table_args__ = (
+        db.Index('ix_method_session_session_status_order', 'session_id', 'status', 'order'),
+        db.Index('ix_method_session_method_status', 'method_id', 'status'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.Integer, db.ForeignKey('session.id'), nullable=False)
@@ -142,22 +147,38 @@ class MethodSession(db.Model):
     started_at = db.Column(db.DateTime, nullable=True)
     completed_at = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(20), default='pending')  # pending, in_progress, completed, abandoned
-    uranus_state = db.Column(db.Text, nullable=True)  # JSON serialized Uranus state
+    uranus_state = db.Column(db.Text, nullable=True)  # Serialized Uranus state (compact codec or legacy JSON)
 
     results = db.relationship('AssessmentResult', backref='method_session', lazy=True, cascade='all, delete-orphan')
+    # Typed copies of the results (see app/result_tables.py)
+    pairwise_comparisons = db.relationship('PairwiseComparison', lazy=True, cascade='all, delete-orphan')
+    criterion_values = db.relationship('CriterionValue', lazy=True, cascade='all, delete-orphan')
+    matrix_scores = db.relationship('MatrixScore', lazy=True, cascade='all, delete-orphan')
+    rank_positions = db.relationship('RankPosition', lazy=True, cascade='all, delete-orphan')
+    budget_allocations = db.relationship('BudgetAllocation', lazy=True, cascade='all, delete-orphan')
+    category_assignments = db.relationship('CategoryAssignment', lazy=True, cascade='all, delete-orphan')
 
     def get_uranus_state(self):
+        if not self.uranus_state:
+            return None
+        if uranus_codec.is_encoded(self.uranus_state):
+            try:
+                return uranus_codec.decode_state(self.uranus_state)
+            except (ValueError, IndexError, KeyError, TypeError):
+                return None
         try:
-            return json.loads(self.uranus_state) if self.uranus_state else None
+            return json.loads(self.uranus_state)
         except (json.JSONDecodeError, TypeError):
             return None
 
     def set_uranus_state(self, state_dict):
-        self.uranus_state = json.dumps(state_dict)
+        encoded = uranus_codec.encode_state(state_dict)
+        self.uranus_state = encoded if encoded is not None else json.dumps(state_dict)
 
 
 class AssessmentResult(db.Model):
     __tablename__ = 'assessment_result'
+    __table_args__ = (db.Index('ix_assessment_result_method_session', 'method_session_id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     method_session_id = db.Column(db.Integer, db.ForeignKey('method_session.id'), nullable=False)
@@ -174,8 +195,82 @@ class AssessmentResult(db.Model):
         self.result_data = json.dumps(data)
 
 
+# Typed result tables: one row per value, written alongside AssessmentResult.result_data
+# (which stays the source of truth) so results can be filtered and aggregated in SQL.
+
+class PairwiseComparison(db.Model):
+    __tablename__ = 'pairwise_comparison'
+    __table_args__ = (db.Index('ix_pairwise_comparison_session_step', 'method_session_id', 'step'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    method_session_id = db.Column(db.Integer, db.ForeignKey('method_session.id'), nullable=False)
+    step = db.Column(db.Integer, nullable=False)  # comparison_step: comparisons made before this one
+    parameter = db.Column(db.String(255), default='')
+    parameter_index = db.Column(db.Integer, nullable=True)
+    risk_a_id = db.Column(db.Integer, db.ForeignKey('risk.id'), nullable=True, index=True)
+    risk_b_id = db.Column(db.Integer, db.ForeignKey('risk.id'), nullable=True, index=True)
+    risk_a_index = db.Column(db.Integer, nullable=True)
+    risk_b_index = db.Column(db.Integer, nullable=True)
+    choice = db.Column(db.Integer, nullable=False)  # as passed to Uranus.set_priority: 1 = risk A higher
+    higher_risk_id = db.Column(db.Integer, db.ForeignKey('risk.id'), nullable=True, index=True)
+
+
+class CriterionValue(db.Model):
+    __tablename__ = 'criterion_value'
+
+    id = db.Column(db.Integer, primary_key=True)
+    method_session_id = db.Column(db.Integer, db.ForeignKey('method_session.id'), nullable=False, index=True)
+    risk_id = db.Column(db.Integer, db.ForeignKey('risk.id'), nullable=True, index=True)
+    criterion = db.Column(db.String(255), nullable=False)
+    value = db.Column(db.Integer, nullable=False)
+
+
+class MatrixScore(db.Model):
+    __tablename__ = 'matrix_score'
+
+    id = db.Column(db.Integer, primary_key=True)
+    method_session_id = db.Column(db.Integer, db.ForeignKey('method_session.id'), nullable=False, index=True)
+    risk_id = db.Column(db.Integer, db.ForeignKey('risk.id'), nullable=True, index=True)
+    priority = db.Column(db.Float, nullable=False)
+
+
+class RankPosition(db.Model):
+    __tablename__ = 'rank_position'
+
+    id = db.Column(db.Integer, primary_key=True)
+    method_session_id = db.Column(db.Integer, db.ForeignKey('method_session.id'), nullable=False, index=True)
+    risk_id = db.Column(db.Integer, db.ForeignKey('risk.id'), nullable=True, index=True)
+    parameter = db.Column(db.String(255), default='overall')
+    rank = db.Column(db.Integer, nullable=False)  # 1 = most important
+
+
+class BudgetAllocation(db.Model):
+    __tablename__ = 'budget_allocation'
+
+    id = db.Column(db.Integer, primary_key=True)
+    method_session_id = db.Column(db.Integer, db.ForeignKey('method_session.id'), nullable=False, index=True)
+    risk_id = db.Column(db.Integer, db.ForeignKey('risk.id'), nullable=True, index=True)
+    parameter = db.Column(db.String(255), default='overall')
+    points = db.Column(db.Integer, nullable=False)
+
+
+class CategoryAssignment(db.Model):
+    __tablename__ = 'category_assignment'
+
+    id = db.Column(db.Integer, primary_key=True)
+    method_session_id = db.Column(db.Integer, db.ForeignKey('method_session.id'), nullable=False, index=True)
+    risk_id = db.Column(db.Integer, db.ForeignKey('risk.id'), nullable=True, index=True)
+    parameter = db.Column(db.String(255), default='overall')
+    category = db.Column(db.String(255), nullable=False)
+
+
 class InteractionEvent(db.Model):
     __tablename__ = 'interaction_event'
+    __table_args__ = (
+        db.Index('ix_interaction_event_session_timestamp', 'session_id', 'timestamp'),
+        db.Index('ix_interaction_event_method_session_timestamp', 'method_session_id', 'timestamp'),
+        db.Index('ix_interaction_event_event_type', 'event_type'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.Integer, db.ForeignKey('session.id'), nullable=False)
@@ -196,3 +291,24 @@ class InteractionEvent(db.Model):
 
     def set_event_data(self, data):
         self.event_data = json.dumps(data)
+
+
+# Forward migrations applied to this database (see app/migrations.py)
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(255), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# How far the compactor has loaded each /api/track segment file (see app/api/segment_log.py);
+# updated in the same transaction as the events it loaded
+class SegmentOffset(db.Model):
+    __tablename__ = 'segment_offset'
+
+    name = db.Column(db.String(100), primary_key=True)
+    position = db.Column(db.Integer, nullable=False, default=0)  # bytes of the segment loaded
+    events = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
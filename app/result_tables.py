@@ -0,0 +1,251 @@
+"""Typed result tables, derived from AssessmentResult.result_data.
+
+Every result is still stored as a JSON blob in AssessmentResult.result_data,
+which stays the source of truth. Each value is also written as a row of a
+typed, indexed table, so results can be filtered and aggregated in SQL:
+
+    pairwise_comparison   Uranus answers (step, parameter, risks A/B, choice)
+    rank_position         ranking positions, and the Uranus final ranking ('overall')
+    criterion_value       matrix criterion values
+    matrix_score          matrix priorities
+    budget_allocation     budget points
+    category_assignment   categorization categories
+
+typed_rows() maps one result to its rows, for the live write path and for the
+backfill alike. Existing databases are backfilled (or repaired) with
+
+    python -m app.result_tables [EXPERIMENT_ID ...]
+
+which rebuilds the typed rows of each method session from its result_data;
+running it again is a no-op.
+"""
+
+import argparse
+
+CHOICES = {'A': 0, 'B': 1}  # result_data 'chosen' -> choice passed to Uranus.set_priority
+
+
+def _models():
+    from app.models import (PairwiseComparison, RankPosition, CriterionValue, MatrixScore,
+                            BudgetAllocation, CategoryAssignment)
+    return (PairwiseComparison, RankPosition, CriterionValue, MatrixScore, BudgetAllocation, CategoryAssignment)
+
+
+def final_ranks(data):
+    """(risk index, rank) pairs of a Uranus final_ranking result, rank 1 first.
+
+    In top-K mode only the first K positions were measured; the risks below the
+    cut share rank K + 1 instead of taking arbitrary consecutive ranks.
+    """
+    top_k = data.get('top_k')
+    return [(i, rank if not top_k or rank <= top_k else top_k + 1)
+            for rank, i in enumerate(data.get('ranking', []), 1)]
+
+
+def typed_rows(method_type, method_session_id, risk_id, data, risk_ids):
+    """Typed rows for one result, as a list of (model, column dict).
+
+    Args:
+        method_type: type of the method that produced the result
+        method_session_id: MethodSession id
+        risk_id: AssessmentResult.risk_id
+        data: the result data dict
+        risk_ids: ids of the experiment's risks in Risk.order (Uranus results use indexes)
+
+    Results that do not have the expected fields give no rows.
+    """
+    from app.models import (PairwiseComparison, RankPosition, CriterionValue, MatrixScore,
+                            BudgetAllocation, CategoryAssignment)
+    base = {'method_session_id': method_session_id}
+    parameter = data.get('parameter', 'overall')
+
+    if method_type == 'uranus':
+        if data.get('type') == 'final_ranking':
+            return [(RankPosition, {**base, 'risk_id': risk_ids[i], 'parameter': 'overall', 'rank': rank})
+                    for i, rank in final_ranks(data) if 0 <= i < len(risk_ids)]
+        if 'comparison_step' not in data or data.get('chosen') not in CHOICES:
+            return []
+        choice = CHOICES[data['chosen']]
+        risk_a_id, risk_b_id = data.get('risk_a_id'), data.get('risk_b_id')
+        return [(PairwiseComparison, {
+            **base,
+            'step': data['comparison_step'],
+            'parameter': data.get('parameter', ''),
+            'parameter_index': data.get('parameter_index'),
+            'risk_a_id': risk_a_id,
+            'risk_b_id': risk_b_id,
+            'risk_a_index': data.get('risk_a_index'),
+            'risk_b_index': data.get('risk_b_index'),
+            'choice': choice,
+            'higher_risk_id': risk_a_id if choice == 1 else risk_b_id,
+        })]
+    if method_type == 'matrix':
+        rows = [(CriterionValue, {**base, 'risk_id': risk_id, 'criterion': name, 'value': value})
+                for name, value in data.get('criteria_values', {}).items() if isinstance(value, int)]
+        if isinstance(data.get('priority'), (int, float)):
+            rows.append((MatrixScore, {**base, 'risk_id': risk_id, 'priority': data['priority']}))
+        return rows
+    if method_type == 'ranking' and isinstance(data.get('rank'), int):
+        return [(RankPosition, {**base, 'risk_id': risk_id, 'parameter': parameter, 'rank': data['rank']})]
+    if method_type == 'budget' and isinstance(data.get('points'), int):
+        return [(BudgetAllocation, {**base, 'risk_id': risk_id, 'parameter': parameter, 'points': data['points']})]
+    if method_type == 'categorization' and data.get('category'):
+        return [(CategoryAssignment, {**base, 'risk_id': risk_id, 'parameter': parameter,
+                                      'category': data['category']})]
+    return []
+
+
+def _risk_ids(method_session):
+    from app.models import Risk
+    return [r.id for r in Risk.query.filter_by(experiment_id=method_session.session.experiment_id)
+            .order_by(Risk.order).all()]
+
+
+def insert_rows(method_session, results, risk_ids=None):
+    """Write the typed rows of `results` ((risk_id, data) pairs) with one executemany INSERT per table.
+
+    Does not commit. `risk_ids` (experiment risk ids in order) is looked up if
+    needed and not given.
+    """
+    from app import db
+    method_type = method_session.method.method_type
+    if method_type == 'uranus' and risk_ids is None:
+        risk_ids = _risk_ids(method_session)
+    by_model = {}
+    for risk_id, data in results:
+        for model, row in typed_rows(method_type, method_session.id, risk_id, data, risk_ids or []):
+            by_model.setdefault(model, []).append(row)
+    for model, rows in by_model.items():
+        db.session.execute(model.__table__.insert(), rows)
+
+
+def rebuild(method_session, risk_ids=None):
+    """Replace the typed rows of a method session with rows derived from its results. Does not commit.
+
+    Returns the number of rows written.
+    """
+    from app import db
+    from app.models import AssessmentResult
+    for model in _models():
+        db.session.execute(model.__table__.delete().where(model.method_session_id == method_session.id))
+    method_type = method_session.method.method_type
+    if method_type == 'uranus' and risk_ids is None:
+        risk_ids = _risk_ids(method_session)
+    results = [(r.risk_id, r.get_result_data())
+               for r in AssessmentResult.query.filter_by(method_session_id=method_session.id)
+               .order_by(AssessmentResult.id).all()]
+    insert_rows(method_session, results, risk_ids)
+    return sum(len(typed_rows(method_type, method_session.id, risk_id, data, risk_ids or []))
+               for risk_id, data in results)
+
+
+def backfill(experiment_ids=None, commit=True):
+    """Rebuild the typed rows of every method session (of the given experiments). Returns (sessions, rows)."""
+    from app import db
+    from app.models import MethodSession, Session
+    query = MethodSession.query.join(Session, MethodSession.session_id == Session.id)
+    if experiment_ids:
+        query = query.filter(Session.experiment_id.in_(experiment_ids))
+    risk_ids = {}
+    num_sessions = num_rows = 0
+    for ms in query.order_by(MethodSession.id).all():
+        experiment_id = ms.session.experiment_id
+        if experiment_id not in risk_ids:
+            risk_ids[experiment_id] = _risk_ids(ms)
+        num_rows += rebuild(ms, risk_ids[experiment_id])
+        num_sessions += 1
+    if commit:
+        db.session.commit()
+    return num_sessions, num_rows
+
+
+def aggregate(method):
+    """Per-risk statistics over the completed sessions of `method`, computed with SQL GROUP BY.
+
+    Returns {'columns': [...], 'rows': [[risk_id, parameter, ...], ...]} or
+    None if the method type has no typed results. Rows are sorted by
+    parameter, then by risk id.
+    """
+    from app import db
+    from app.models import (MethodSession, PairwiseComparison, RankPosition, CriterionValue, MatrixScore,
+                            BudgetAllocation, CategoryAssignment)
+    func = db.func
+    completed = db.session.query(MethodSession.id).filter(
+        MethodSession.method_id == method.id, MethodSession.status == 'completed')
+
+    def grouped(model, *columns, parameter=None):
+        parameter = parameter if parameter is not None else model.parameter
+        return (db.session.query(model.risk_id, parameter, *columns)
+                .filter(model.method_session_id.in_(completed))
+                .group_by(model.risk_id, parameter).order_by(parameter, model.risk_id).all())
+
+    if method.method_type in ('ranking', 'uranus'):
+        rows = grouped(RankPosition, func.count(), func.avg(RankPosition.rank), func.min(RankPosition.rank),
+                       func.max(RankPosition.rank))
+        columns = ['participants', 'mean rank', 'best rank', 'worst rank']
+        if method.method_type == 'uranus':
+            # How often each risk was judged higher, over the comparisons it took part in
+            wins = dict(db.session.query(PairwiseComparison.higher_risk_id, func.count())
+                        .filter(PairwiseComparison.method_session_id.in_(completed))
+                        .group_by(PairwiseComparison.higher_risk_id).all())
+            involved = {}
+            for column in (PairwiseComparison.risk_a_id, PairwiseComparison.risk_b_id):
+                for risk_id, count in (db.session.query(column, func.count())
+                                       .filter(PairwiseComparison.method_session_id.in_(completed))
+                                       .group_by(column).all()):
+                    involved[risk_id] = involved.get(risk_id, 0) + count
+            rows = [tuple(row) + (wins.get(row[0], 0) / involved[row[0]] if involved.get(row[0]) else None,)
+                    for row in rows]
+            columns.append('win rate')
+    elif method.method_type == 'matrix':
+        rows = grouped(MatrixScore, func.count(), func.avg(MatrixScore.priority), func.min(MatrixScore.priority),
+                       func.max(MatrixScore.priority), parameter=db.literal('overall'))
+        criteria = {}
+        for risk_id, criterion, mean in (db.session.query(CriterionValue.risk_id, CriterionValue.criterion,
+                                                          func.avg(CriterionValue.value))
+                                         .filter(CriterionValue.method_session_id.in_(completed))
+                                         .group_by(CriterionValue.risk_id, CriterionValue.criterion).all()):
+            criteria.setdefault(risk_id, {})[criterion] = mean
+        names = sorted({name for values in criteria.values() for name in values})
+        rows = [tuple(row) + tuple(criteria.get(row[0], {}).get(name) for name in names) for row in rows]
+        columns = ['participants', 'mean priority', 'min priority', 'max priority'] + [f'mean {n}' for n in names]
+    elif method.method_type == 'budget':
+        rows = grouped(BudgetAllocation, func.count(), func.sum(BudgetAllocation.points),
+                       func.avg(BudgetAllocation.points))
+        columns = ['participants', 'total points', 'mean points']
+    elif method.method_type == 'categorization':
+        counts = (db.session.query(CategoryAssignment.risk_id, CategoryAssignment.parameter,
+                                   CategoryAssignment.category, func.count())
+                  .filter(CategoryAssignment.method_session_id.in_(completed))
+                  .group_by(CategoryAssignment.risk_id, CategoryAssignment.parameter, CategoryAssignment.category)
+                  .all())
+        categories = method.get_config().get('categories') or sorted({c[2] for c in counts})
+        table = {}
+        for risk_id, parameter, category, count in counts:
+            table.setdefault((parameter, risk_id), {})[category] = count
+        rows = [(risk_id, parameter, sum(values.values())) + tuple(values.get(c, 0) for c in categories)
+                for (parameter, risk_id), values in sorted(table.items())]
+        columns = ['participants'] + list(categories)
+    else:
+        return None
+    return {'columns': ['risk_id', 'parameter'] + columns, 'rows': [list(row) for row in rows]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backfill the typed result tables from AssessmentResult data.')
+    parser.add_argument('experiment_ids', type=int, nargs='*', help='experiments to backfill (default: all)')
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    from app import create_app
+    from app.config import Config
+
+    with create_app(Config).app_context():  # create_app() creates the new tables
+        num_sessions, num_rows = backfill(args.experiment_ids)
+    print(f'{num_rows} typed rows written for {num_sessions} method sessions')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,97 @@
+"""SQLite production profile: connection pragmas and pool sizing for a file database.
+
+With SQLite's defaults (rollback journal, synchronous=FULL, no busy timeout) a
+writer blocks every reader, and a second writer fails at once with
+"database is locked". Under waitress's thread pool that serialises /api/track
+beacons and participant submissions on the database lock. The profile sets,
+on every new connection (an engine 'connect' event):
+
+    journal_mode=WAL      readers no longer wait for the writer (persistent, set once per file)
+    synchronous=NORMAL    fsync at checkpoints rather than each commit; safe with WAL
+    busy_timeout          wait this long for the write lock instead of failing
+    mmap_size             read pages through a memory map
+    cache_size            page cache per connection (negative = KiB)
+    temp_store=MEMORY     sorts and temporary indexes in memory
+
+and sizes the connection pool to the waitress thread count. It is enabled by
+SQLITE_PROFILE = 'production' (the default of Config) and only applies to
+file databases; the values come from the SQLITE_* settings in app/config.py.
+create_app() runs self_check() on startup and logs the effective settings.
+"""
+
+from sqlalchemy import event
+
+# Values as SQLite reports them back, for self_check()
+_SYNCHRONOUS = {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3}
+_TEMP_STORE = {'DEFAULT': 0, 'FILE': 1, 'MEMORY': 2}
+
+
+def enabled(config):
+    """Whether the profile applies: SQLITE_PROFILE is 'production' and the database is an SQLite file."""
+    uri = config.get('SQLALCHEMY_DATABASE_URI') or ''
+    database = uri.split('://', 1)[-1].lstrip('/')
+    return (config.get('SQLITE_PROFILE') == 'production' and uri.startswith('sqlite')
+            and database not in ('', ':memory:') and 'mode=memory' not in uri)
+
+
+def pragmas(config):
+    """The pragmas of the profile, as (name, value) pairs in the order they are set."""
+    return [
+        ('journal_mode', config.get('SQLITE_JOURNAL_MODE', 'WAL')),
+        ('synchronous', config.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('busy_timeout', int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))),
+        ('mmap_size', int(config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))),
+        ('cache_size', -int(config.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))),
+        ('temp_store', config.get('SQLITE_TEMP_STORE', 'MEMORY')),
+    ]
+
+
+def engine_options(config):
+    """Engine options for the pool: one connection per waitress thread, a few more for background work."""
+    threads = int(config.get('WAITRESS_THREADS', 4))
+    return {
+        'pool_size': threads,
+        'max_overflow': int(config.get('SQLITE_POOL_OVERFLOW', 4)),
+        'pool_timeout': int(config.get('SQLITE_POOL_TIMEOUT', 30)),
+    }
+
+
+def install(engine, settings):
+    """Set `settings` ((name, value) pragmas) on every new DBAPI connection of `engine`."""
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in settings:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def _expected(name, value):
+    if name == 'journal_mode':
+        return str(value).lower()
+    if name == 'synchronous':
+        return _SYNCHRONOUS.get(str(value).upper(), value)
+    if name == 'temp_store':
+        return _TEMP_STORE.get(str(value).upper(), value)
+    return value
+
+
+def self_check(engine, settings):
+    """Read the pragmas back from a pooled connection.
+
+    Returns ({name: effective value}, [mismatch messages]). mmap_size may be
+    capped by the SQLite build (SQLITE_MAX_MMAP_SIZE), which is reported too.
+    """
+    effective = {}
+    mismatches = []
+    with engine.connect() as conn:
+        for name, value in settings:
+            row = conn.exec_driver_sql(f'PRAGMA {name}').fetchone()
+            effective[name] = row[0] if row else None
+            if effective[name] != _expected(name, value):
+                mismatches.append(f'{name} is {effective[name]!r}, not {value!r}')
+    pool = engine.pool
+    if hasattr(pool, 'size'):
+        effective['pool_size'] = pool.size()
+        effective['max_overflow'] = getattr(pool, '_max_overflow', None)
+    return effective, mismatches
@@ -27,24 +27,120 @@
         buffer.push(evt);
     }
 
-    function flush() {
-        if (buffer.length === 0) return;
-        var toSend = buffer.splice(0, buffer.length);
-        var methodSessionId = document.body.dataset.methodSessionId || '';
+    // Events waiting while the server asks us to back off (429/503 + Retry-After)
+    var MAX_BUFFER = 5000;
+    var retryAt = 0;
+    // Batches from this size on are gzipped where CompressionStream exists
+    var COMPRESS_MIN_BYTES = 1024;
+
+    // Columnar batch ("v": 2, decoded by app/api/ingest.py): every string is sent
+    // once in `strings` and referenced by index, timestamps are integer ms deltas,
+    // and event_data objects are [shape, values...] with shared key lists.
+    function encode(events) {
+        var strings = [], index = {}, shapes = [], shapeIndex = {};
+        function ref(value) {
+            value = value == null ? '' : String(value);
+            if (!Object.prototype.hasOwnProperty.call(index, value)) {
+                index[value] = strings.length;
+                strings.push(value);
+            }
+            return index[value];
+        }
+        var batch = { v: 2, strings: strings, t0: 0, dt: [], type: [], url: [], shapes: shapes, data: [] };
+        var previous = null;
+        for (var i = 0; i < events.length; i++) {
+            var evt = events[i];
+            var timestamp = Math.round(evt.timestamp);
+            if (previous === null) batch.t0 = previous = timestamp;
+            batch.dt.push(timestamp - previous);
+            previous = timestamp;
+            batch.type.push(ref(evt.event_type));
+            batch.url.push(ref(evt.page_url));
+            var keys = Object.keys(evt.event_data || {});
+            if (keys.length === 0) {
+                batch.data.push(null);
+                continue;
+            }
+            var shape = [], values = [];
+            for (var k = 0; k < keys.length; k++) {
+                var value = evt.event_data[keys[k]];
+                var isString = typeof value === 'string';
+                shape.push(isString ? -(ref(keys[k]) + 1) : ref(keys[k]));
+                values.push(isString ? ref(value) : (value === undefined ? null : value));
+            }
+            var signature = shape.join(',');
+            if (!Object.prototype.hasOwnProperty.call(shapeIndex, signature)) {
+                shapeIndex[signature] = shapes.length;
+                shapes.push(shape);
+            }
+            batch.data.push([shapeIndex[signature]].concat(values));
+        }
+        return batch;
+    }
+
+    function payload(events) {
+        var batch = encode(events);
+        batch.method_session_id = document.body.dataset.methodSessionId || null;
+        return JSON.stringify(batch);
+    }
+
+    // Promise of the gzipped body, or of null to send it as it is
+    function compress(body) {
+        if (body.length < COMPRESS_MIN_BYTES || typeof CompressionStream === 'undefined') {
+            return Promise.resolve(null);
+        }
         try {
-            navigator.sendBeacon('/api/track', JSON.stringify({
-                events: toSend,
-                method_session_id: methodSessionId || null
-            }));
+            var stream = new Blob([body]).stream().pipeThrough(new CompressionStream('gzip'));
+            return new Response(stream).arrayBuffer().catch(function() { return null; });
         } catch(e) {
-            var xhr = new XMLHttpRequest();
-            xhr.open('POST', '/api/track', true);
-            xhr.setRequestHeader('Content-Type', 'application/json');
-            xhr.send(JSON.stringify({
-                events: toSend,
-                method_session_id: methodSessionId || null
-            }));
+            return Promise.resolve(null);
+        }
+    }
+
+    function requeue(events) {
+        buffer = events.concat(buffer);
+        if (buffer.length > MAX_BUFFER) buffer.splice(0, buffer.length - MAX_BUFFER);
+    }
+
+    function beacon(events) {
+        try {
+            if (navigator.sendBeacon('/api/track', payload(events))) return;
+        } catch(e) {}
+        var xhr = new XMLHttpRequest();
+        xhr.open('POST', '/api/track', true);
+        xhr.setRequestHeader('Content-Type', 'application/json');
+        xhr.send(payload(events));
+    }
+
+    // unloading: page is going away, so send with a beacon and do not wait for an answer
+    function flush(unloading) {
+        if (buffer.length === 0) return;
+        if (!unloading && Date.now() < retryAt) return;
+        var toSend = buffer.splice(0, buffer.length);
+        if (unloading || !window.fetch) {
+            beacon(toSend);
+            return;
         }
+        var body = payload(toSend);
+        compress(body).then(function(gzipped) {
+            var headers = { 'Content-Type': 'application/json' };
+            if (gzipped) headers['Content-Encoding'] = 'gzip';
+            return fetch('/api/track', {
+                method: 'POST',
+                headers: headers,
+                body: gzipped || body,
+                keepalive: true,
+                credentials: 'same-origin'
+            });
+        }).then(function(response) {
+            if (response.status === 429 || response.status === 503) {
+                var wait = parseInt(response.headers.get('Retry-After'), 10) || 1;
+                retryAt = Date.now() + wait * 1000;
+                requeue(toSend);
+            }
+        }).catch(function() {
+            requeue(toSend);
+        });
     }
 
     function resetHesitation() {
@@ -128,7 +224,7 @@
     document.addEventListener('submit', function(e) {
         var info = getElementInfo(e.target);
         pushEvent('form_submit', info);
-        flush();
+        flush(true);
     }, true);
 
     document.addEventListener('keypress', function(e) {
@@ -148,11 +244,11 @@
         pushEvent('page_unload', {
             time_on_page_ms: performance.now() - pageStartTime
         });
-        flush();
+        flush(true);
     });
 
     // Periodic flush
-    setInterval(flush, FLUSH_INTERVAL);
+    setInterval(function() { flush(false); }, FLUSH_INTERVAL);
 
     // Init
     sendMeta();
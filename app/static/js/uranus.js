@@ -0,0 +1,113 @@
+// Pairwise comparison page: answer locally, sync in the background.
+// The server sends the comparison that follows each possible answer (prefetch), so the next pair is shown
+// immediately; answers are queued and posted in batches to /api/uranus/<id>/answers. Without JS (or fetch)
+// the plain form POST still works.
+document.addEventListener('DOMContentLoaded', function() {
+    var form = document.getElementById('uranusForm');
+    var dataEl = document.getElementById('uranusData');
+    if (!form || !dataEl || !window.fetch || !window.JSON) return;
+
+    var data = JSON.parse(dataEl.textContent);
+    var current = data.current;
+    var prefetch = data.prefetch;
+    var version = parseInt(form.dataset.version, 10);  // comparisons confirmed by the server
+    var pending = [];  // answers not yet confirmed
+    var inFlight = false;
+    var waiting = false;  // an answer was given whose follow-up is not known yet
+    var buttons = form.querySelectorAll('button[name="choice"]');
+
+    function setProgress(progress) {
+        var bar = document.getElementById('uranusProgress');
+        if (!bar || progress === undefined) return;
+        var value = Math.round(progress * 10) / 10;
+        bar.style.width = value + '%';
+        bar.setAttribute('aria-valuenow', value);
+        bar.textContent = value + '%';
+    }
+
+    function render(cmp) {
+        form.querySelector('input[name="a"]').value = cmp.a;
+        form.querySelector('input[name="b"]').value = cmp.b;
+        form.querySelector('input[name="c"]').value = cmp.c;
+        document.getElementById('uranusRiskA').textContent = cmp.risk_a;
+        document.getElementById('uranusRiskB').textContent = cmp.risk_b;
+        document.querySelectorAll('.uranus-parameter').forEach(function(el) {
+            el.textContent = cmp.parameter;
+        });
+    }
+
+    function setBusy(busy) {
+        buttons.forEach(function(btn) { btn.disabled = busy; });
+    }
+
+    function sync() {
+        if (inFlight || pending.length === 0) return;
+        inFlight = true;
+        fetch(form.dataset.answersUrl, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({version: version, answers: pending.slice()})
+        }).then(function(resp) {
+            return resp.json().then(function(body) { return {status: resp.status, body: body}; });
+        }).then(function(r) {
+            inFlight = false;
+            var body = r.body;
+            if (r.status !== 200) {
+                // conflict or rejected answer: the server state is the truth
+                window.location.reload();
+                return;
+            }
+            version = body.version;
+            pending.splice(0, body.applied);
+            if (body.complete) {
+                window.location.href = form.dataset.runUrl;
+                return;
+            }
+            if (pending.length > 0) {
+                sync();
+                return;
+            }
+            // The server has caught up with the page: its follow-ups apply to the pair on screen
+            prefetch = body.prefetch;
+            setProgress(body.progress);
+            if (waiting) {
+                waiting = false;
+                current = body.next;
+                render(current);
+                setBusy(false);
+            }
+        }).catch(function() {
+            inFlight = false;
+            setTimeout(sync, 2000);
+        });
+    }
+
+    function answer(choice) {
+        pending.push({a: current.a, b: current.b, c: current.c, choice: choice});
+        var next = prefetch ? prefetch[String(choice)] : null;
+        prefetch = null;
+        if (next) {
+            current = next;
+            render(current);
+        } else {
+            waiting = true;
+            setBusy(true);
+        }
+        sync();
+    }
+
+    buttons.forEach(function(btn) {
+        btn.addEventListener('click', function(e) {
+            e.preventDefault();
+            if (!btn.disabled) answer(parseInt(btn.value, 10));
+        });
+    });
+
+    // Answers still queued when leaving are sent as a beacon (a duplicate is rejected by the version check)
+    window.addEventListener('beforeunload', function() {
+        if (pending.length === 0 || !navigator.sendBeacon) return;
+        var payload = JSON.stringify({version: version, answers: pending});
+        navigator.sendBeacon(form.dataset.answersUrl, new Blob([payload], {type: 'application/json'}));
+    });
+});
@@ -0,0 +1,220 @@
+"""Compact text codec for serialized Uranus state (MethodSession.uranus_state).
+
+The state is stored as integer arrays only: parameter and element names are
+not written, since they are recoverable from the Method config and the
+experiment's Risk rows. The element indexes refer to the risks in Risk.order
+at the time of writing; risk_fingerprint (a CRC-32 of their ids) tells
+whether that list is still the same. Integers are packed as unsigned LEB128 varints and
+the payload is base64-encoded so it fits the existing Text column:
+
+    u2:<base64(varints)>
+
+Varint layout (version 2):
+    num_parameters, num_elements, num_comparisons,
+    next_elem + 1, next_parameter + 1          (0 means None)
+    for each parameter: len, elements...
+    next_range: offset + 1, len                (contiguous slice of prioritized[next_parameter])
+             or 0, len, elements...            (anything else)
+    final_list: len, elements...
+    top_k + 1                                  (0 means None)
+    below_cut: count, then for each parameter: len, elements...
+    scheduler: index in SCHEDULERS
+    scheduler_state: count, then for each parameter: len, answers...
+                                               (0 = no state, else count + 1)
+    prior: 0 = None, else count + 1, then for each parameter:
+           0 = None, else len + 1, scores...
+    next_gallop: 0 = None, else zigzag(next_gallop) + 1
+    risk_fingerprint + 1                       (0 means None)
+
+Version 1 states, which end after final_list, are still decoded. States of
+schedulers not listed here are stored as JSON, and anything that does not
+start with a version prefix is read as JSON.
+"""
+
+import base64
+
+PREFIX = 'u2:'
+PREFIXES = ('u1:', 'u2:')
+SCHEDULERS = ('binary', 'ford_johnson')
+INT_FIELDS = ('num_parameters', 'num_elements', 'num_comparisons')
+
+
+def is_encoded(text):
+    return isinstance(text, str) and text.startswith(PREFIXES)
+
+
+def _put(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _put_list(out, values):
+    _put(out, len(values))
+    for v in values:
+        _put(out, v)
+
+
+def _put_optional_lists(out, lists):
+    if lists is None:
+        _put(out, 0)
+        return
+    _put(out, len(lists) + 1)
+    for values in lists:
+        if values is None:
+            _put(out, 0)
+        else:
+            _put(out, len(values) + 1)
+            for v in values:
+                _put(out, v)
+
+
+def _reader(data):
+    pos = 0
+
+    def read():
+        nonlocal pos
+        n = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            n |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return n
+            shift += 7
+
+    return read
+
+
+def _read_list(read):
+    return [read() for _ in range(read())]
+
+
+def _read_optional_lists(read):
+    count = read()
+    if count == 0:
+        return None
+    lists = []
+    for _ in range(count - 1):
+        length = read()
+        lists.append(None if length == 0 else [read() for _ in range(length - 1)])
+    return lists
+
+
+def _is_uint(v):
+    return isinstance(v, int) and not isinstance(v, bool) and v >= 0
+
+
+def _slice_offset(container, part):
+    """Offset of `part` as a contiguous slice of `container`, or None."""
+    if not part:
+        return None
+    try:
+        start = container.index(part[0])
+    except ValueError:
+        return None
+    return start if container[start:start + len(part)] == part else None
+
+
+def encode_state(state):
+    """Encode a Uranus state dict. Returns None if the dict is not a complete integer-only state."""
+    if not isinstance(state, dict):
+        return None
+    if any(not _is_uint(state.get(f)) for f in INT_FIELDS):
+        return None
+    for f in ('next_elem', 'next_parameter', 'top_k', 'risk_fingerprint'):
+        if state.get(f) is not None and not _is_uint(state.get(f)):
+            return None
+    next_gallop = state.get('next_gallop', 0)
+    if next_gallop is not None and (isinstance(next_gallop, bool) or not isinstance(next_gallop, int)):
+        return None
+    prior = state.get('prior')
+    if prior is not None and not isinstance(prior, list):
+        return None
+    if state.get('scheduler', 'binary') not in SCHEDULERS:
+        return None
+    prioritized = state.get('prioritized')
+    below_cut = state.get('below_cut', [])
+    scheduler_state = state.get('scheduler_state')
+    if not isinstance(prioritized, list) or not isinstance(below_cut, list):
+        return None
+    if scheduler_state is not None and not isinstance(scheduler_state, list):
+        return None
+    lists = prioritized + below_cut + (scheduler_state or []) + [p for p in prior or [] if p is not None]
+    for values in lists + [state.get('next_range'), state.get('final_list', [])]:
+        if not isinstance(values, list) or not all(_is_uint(v) for v in values):
+            return None
+
+    out = bytearray()
+    for f in INT_FIELDS:
+        _put(out, state[f])
+    for f in ('next_elem', 'next_parameter'):
+        _put(out, 0 if state.get(f) is None else state[f] + 1)
+    _put(out, len(state['prioritized']))
+    for values in state['prioritized']:
+        _put_list(out, values)
+
+    next_range = state['next_range']
+    next_parameter = state.get('next_parameter')
+    offset = None
+    if next_parameter is not None and next_parameter < len(state['prioritized']):
+        offset = _slice_offset(state['prioritized'][next_parameter], next_range)
+    if offset is None:
+        _put(out, 0)
+        _put_list(out, next_range)
+    else:
+        _put(out, offset + 1)
+        _put(out, len(next_range))
+    _put_list(out, state.get('final_list', []))
+    _put(out, 0 if state.get('top_k') is None else state['top_k'] + 1)
+    _put(out, len(below_cut))
+    for values in below_cut:
+        _put_list(out, values)
+    _put(out, SCHEDULERS.index(state.get('scheduler', 'binary')))
+    if scheduler_state is None:
+        _put(out, 0)
+    else:
+        _put(out, len(scheduler_state) + 1)
+        for values in scheduler_state:
+            _put_list(out, values)
+    _put_optional_lists(out, prior)
+    _put(out, 0 if next_gallop is None else (2 * next_gallop if next_gallop >= 0 else -2 * next_gallop - 1) + 1)
+    _put(out, 0 if state.get('risk_fingerprint') is None else state['risk_fingerprint'] + 1)
+    return PREFIX + base64.b64encode(bytes(out)).decode('ascii')
+
+
+def decode_state(text):
+    """Decode a string produced by encode_state() into a state dict (without names)."""
+    version = text[:len(PREFIX)]
+    read = _reader(base64.b64decode(text[len(PREFIX):]))
+    state = {f: read() for f in INT_FIELDS}
+    for f in ('next_elem', 'next_parameter'):
+        v = read()
+        state[f] = None if v == 0 else v - 1
+    state['prioritized'] = [_read_list(read) for _ in range(read())]
+    offset = read()
+    if offset == 0:
+        state['next_range'] = _read_list(read)
+    else:
+        start = offset - 1
+        state['next_range'] = state['prioritized'][state['next_parameter']][start:start + read()]
+    state['final_list'] = _read_list(read)
+    if version == 'u1:':
+        return state
+    top_k = read()
+    state['top_k'] = None if top_k == 0 else top_k - 1
+    state['below_cut'] = [_read_list(read) for _ in range(read())]
+    state['scheduler'] = SCHEDULERS[read()]
+    count = read()
+    state['scheduler_state'] = None if count == 0 else [_read_list(read) for _ in range(count - 1)]
+    state['prior'] = _read_optional_lists(read)
+    gallop = read()
+    if gallop == 0:
+        state['next_gallop'] = None
+    else:
+        zigzag = gallop - 1
+        state['next_gallop'] = zigzag // 2 if zigzag % 2 == 0 else -(zigzag + 1) // 2
+    fingerprint = read()
+    state['risk_fingerprint'] = None if fingerprint == 0 else fingerprint - 1
+    return state
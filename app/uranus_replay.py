@@ -0,0 +1,273 @@
+"""Event-sourced replay of Uranus sessions from their stored comparisons.
+
+Every answer is stored as an AssessmentResult (comparison_step, risk_a_index,
+risk_b_index, parameter_index, chosen), so MethodSession.uranus_state is only
+a cache of that log: replaying the answers in order through a fresh Uranus
+with the session's settings (parameters, risks, top_k, scheduler, prior)
+rebuilds the same state. Answers are applied to the pending comparison:
+process_response() now refuses answers for another pair, but logs written
+before it did can hold them, so such rows are applied the way they were then
+and counted as mismatched; rows recorded after completion are ignored.
+
+Answers name their risks by id, and are mapped to the current Risk.order
+positions. When the snapshot was taken with another risk list (its
+risk_fingerprint differs: risks were added, removed or reordered), the log
+is not replayed in order but used as a table of known answers: each pending
+comparison is answered from it while it holds an answer for that pair.
+
+session_job() reads everything a replay needs from the DB into plain data and
+replay() does not touch the DB, so a whole experiment is replayed in a process
+pool:
+
+    python -m app.uranus_replay EXPERIMENT_ID [--processes N] [--repair] [--rerank]
+
+--repair rewrites missing, unreadable or diverging snapshots from the replay
+(completing sessions whose log is complete); --rerank recomputes the stored
+final_ranking of completed sessions, e.g. after an aggregation change.
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+CHOICES = {'A': 0, 'B': 1}
+# Snapshot fields compared with the replay; fields missing from older snapshots are skipped
+VERIFIED_KEYS = ('num_comparisons', 'prioritized', 'next_elem', 'next_parameter', 'next_range',
+                 'top_k', 'below_cut', 'scheduler', 'scheduler_state', 'prior', 'next_gallop')
+
+
+def comparison_log(method_session, risks=None):
+    """The session's answers as (a, b, c, choice) tuples, in the order they were applied.
+
+    With `risks`, a and b are the positions of the answered risks in that list
+    (by risk id; answers about risks no longer in it are left out).
+    """
+    from app.models import AssessmentResult
+    position = {r.id: i for i, r in enumerate(risks)} if risks is not None else None
+    rows = []
+    for r in AssessmentResult.query.filter_by(method_session_id=method_session.id).all():
+        data = r.get_result_data()
+        if 'comparison_step' not in data or data.get('chosen') not in CHOICES:
+            continue
+        a, b = data.get('risk_a_index'), data.get('risk_b_index')
+        if position is not None and data.get('risk_a_id') is not None and data.get('risk_b_id') is not None:
+            if data['risk_a_id'] not in position or data['risk_b_id'] not in position:
+                continue
+            a, b = position[data['risk_a_id']], position[data['risk_b_id']]
+        rows.append((data['comparison_step'], r.id, a, b, data.get('parameter_index'), CHOICES[data['chosen']]))
+    rows.sort()
+    return [row[2:] for row in rows]
+
+
+def session_job(method_session, risks):
+    """Plain-data description of one replay: settings, answers and the snapshot to verify (None if unreadable)."""
+    from app.methods.uranus_method import UranusMethod, risk_fingerprint
+    config = method_session.method.get_config()
+    snapshot = method_session.get_uranus_state()
+    fingerprint = risk_fingerprint(risks)
+    rekey = bool(snapshot) and snapshot.get('risk_fingerprint') not in (None, fingerprint)
+    if snapshot:
+        # A session keeps the settings it started with
+        top_k, scheduler, prior = snapshot.get('top_k'), snapshot.get('scheduler', 'binary'), snapshot.get('prior')
+        if rekey:
+            prior = UranusMethod()._new_session_settings(method_session, risks)[2] if scheduler == 'binary' else None
+    else:
+        top_k, scheduler, prior = UranusMethod()._new_session_settings(method_session, risks)
+    return {
+        'method_session_id': method_session.id,
+        'parameters': list(config.get('parameters', ['impact', 'probability'])),
+        'risk_names': [r.name for r in risks],
+        'top_k': top_k,
+        'scheduler': scheduler,
+        'prior': prior,
+        'answers': comparison_log(method_session, risks),
+        'snapshot': snapshot or None,
+        'risk_fingerprint': fingerprint,
+        'rekey': rekey,
+    }
+
+
+def _differences(snapshot, state):
+    def canonical(key, value):
+        return [sorted(v) for v in value] if key == 'below_cut' and value else value
+
+    return [key for key in VERIFIED_KEYS
+            if key in snapshot and canonical(key, snapshot[key]) != canonical(key, state[key])]
+
+
+def _apply_known_answers(u, answers, result):
+    """Answer each pending comparison from `answers` while they hold an answer for that pair."""
+    known = {}
+    for a, b, c, choice in answers:
+        known[(a, b, c)] = choice
+        known[(b, a, c)] = 1 - choice  # the same judgement with the risks the other way round
+    while True:
+        pending = u.peek_next()
+        if pending[0] is None or pending not in known:
+            break
+        u.next_to_process()
+        u.set_priority(known[pending])
+        result['applied'] += 1
+    result['mismatched'] = len(answers) - result['applied']
+
+
+def replay(job):
+    """Rebuild the state of one session from its answers and verify it against the snapshot.
+
+    Returns a dict with the replayed 'state', the final 'ranking' (None until
+    done), counts of 'applied', 'ignored' and 'mismatched' answers, and a
+    'status': 'ok' (snapshot matches), 'diverged' ('differences' lists the
+    fields), 'missing' (no readable snapshot) or 'error' ('error' says why).
+    """
+    from app.methods.uranus_method import UranusMethod
+    result = {'method_session_id': job['method_session_id'], 'state': None, 'ranking': None,
+              'applied': 0, 'ignored': 0, 'mismatched': 0, 'differences': [], 'error': None}
+    handler = UranusMethod()
+    try:
+        u = handler._create_uranus(job['parameters'], job['risk_names'], job['top_k'], job['scheduler'],
+                                   job['prior'])
+        u.risk_fingerprint = job.get('risk_fingerprint')
+        if job.get('rekey'):
+            _apply_known_answers(u, job['answers'], result)
+        else:
+            for a, b, c, choice in job['answers']:
+                if u.is_done():
+                    result['ignored'] += 1
+                    continue
+                if u.next_to_process() != (a, b, c):
+                    result['mismatched'] += 1
+                u.set_priority(choice)
+                result['applied'] += 1
+    except Exception as e:
+        result.update(status='error', error=f'{type(e).__name__}: {e}')
+        return result
+
+    result['state'] = handler._serialize_state(u)
+    if u.is_done():
+        result['ranking'] = list(u.prioritized_list())
+    if job['snapshot'] is None:
+        result['status'] = 'missing'
+    else:
+        result['differences'] = _differences(job['snapshot'], result['state'])
+        result['status'] = 'diverged' if result['differences'] else 'ok'
+    return result
+
+
+def replay_jobs(jobs, processes=None):
+    """Replay jobs in a process pool (in this process if processes is 1 or there is a single job)."""
+    processes = processes or os.cpu_count() or 1
+    if processes <= 1 or len(jobs) <= 1:
+        return [replay(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(replay, jobs, chunksize=max(1, len(jobs) // (4 * processes))))
+
+
+def _experiment_method_sessions(experiment_id):
+    from app.models import Method, MethodSession, Session
+    return (MethodSession.query.join(Method, MethodSession.method_id == Method.id)
+            .join(Session, MethodSession.session_id == Session.id)
+            .filter(Session.experiment_id == experiment_id, Method.method_type == 'uranus')
+            .order_by(MethodSession.id).all())
+
+
+def _repair(handler, method_session, risks, result):
+    state = result['state']
+    if state['num_comparisons'] == 0 and not method_session.uranus_state:
+        return  # never answered: nothing to write
+    u = handler._restore_state(state, state['p_names'], [r.name for r in risks])
+    if u.is_done() and method_session.status != 'completed':
+        handler._save_and_finish(method_session, u)
+    else:
+        handler._save_state(method_session, u)
+
+
+def _rerank(method_session, result):
+    from app import db
+    from app import result_tables
+    from app.models import AssessmentResult
+    if method_session.status != 'completed' or result['ranking'] is None:
+        return
+    state = result['state']
+    rows = [r for r in AssessmentResult.query.filter_by(method_session_id=method_session.id, risk_id=None).all()
+            if r.get_result_data().get('type') == 'final_ranking']
+    if not rows:
+        rows = [AssessmentResult(method_session_id=method_session.id, risk_id=None)]
+        db.session.add(rows[0])
+    for row in rows:
+        data = row.get_result_data()
+        data.update({
+            'type': 'final_ranking',
+            'ranking': result['ranking'],
+            'prioritized': state['prioritized'],
+            'top_k': state['top_k'],
+            'scheduler': state['scheduler'],
+            'num_comparisons': state['num_comparisons'],
+            'recomputed_at': datetime.utcnow().isoformat(),
+        })
+        data.setdefault('timestamp', data['recomputed_at'])
+        row.set_result_data(data)
+    result_tables.rebuild(method_session)
+
+
+def replay_experiment(experiment_id, processes=None, repair=False, rerank=False):
+    """Replay every Uranus session of an experiment; optionally repair snapshots and recompute rankings.
+
+    Returns the replay() results, in MethodSession id order.
+    """
+    from app import db
+    from app.methods.uranus_method import UranusMethod
+    from app.models import Risk
+    risks = Risk.query.filter_by(experiment_id=experiment_id).order_by(Risk.order).all()
+    method_sessions = _experiment_method_sessions(experiment_id)
+    results = replay_jobs([session_job(ms, risks) for ms in method_sessions], processes)
+
+    if repair or rerank:
+        handler = UranusMethod()
+        for ms, result in zip(method_sessions, results):
+            if result['status'] == 'error':
+                continue
+            if repair and result['status'] in ('missing', 'diverged'):
+                _repair(handler, ms, risks, result)
+            if rerank:
+                _rerank(ms, result)
+        db.session.commit()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay Uranus sessions of an experiment from stored comparisons.')
+    parser.add_argument('experiment_id', type=int)
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--repair', action='store_true', help='rewrite missing or diverging snapshots')
+    parser.add_argument('--rerank', action='store_true', help='recompute final rankings of completed sessions')
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    from app import create_app
+    from app.config import Config
+
+    with create_app(Config).app_context():
+        results = replay_experiment(args.experiment_id, args.processes, args.repair, args.rerank)
+    for r in results:
+        notes = []
+        if r['differences']:
+            notes.append('differs in ' + ', '.join(r['differences']))
+        if r['mismatched']:
+            notes.append(f"{r['mismatched']} answers name another pair")
+        if r['ignored']:
+            notes.append(f"{r['ignored']} answers after completion")
+        if r['error']:
+            notes.append(r['error'])
+        print(f"method session {r['method_session_id']}: {r['status']}, {r['applied']} answers"
+              + (f" ({'; '.join(notes)})" if notes else ''))
+    counts = {}
+    for r in results:
+        counts[r['status']] = counts.get(r['status'], 0) + 1
+    print(', '.join(f'{n} {status}' for status, n in sorted(counts.items())) or 'no Uranus sessions')
+    return 0 if all(r['status'] == 'ok' for r in results) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
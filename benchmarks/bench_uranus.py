@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Benchmark Uranus final aggregation: rank arrays vs. the recursive list-membership reference.
+
+Usage: python benchmarks/bench_uranus.py [N] [P]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uranus import NullLogSink, Uranus
+
+
+def completed_uranus(num_elements, num_parameters, seed=0):
+    rnd = random.Random(seed)
+    u = Uranus([f'p{i}' for i in range(num_parameters)], [f'e{i}' for i in range(num_elements)],
+               log_sink=NullLogSink())
+    u.set_logging(False)
+    u.prioritized = [rnd.sample(range(num_elements), num_elements) for _ in range(num_parameters)]
+    return u
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    num_elements = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_parameters = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    u = completed_uranus(num_elements, num_parameters)
+
+    def reference():
+        u.final_list = []
+        u.prioritize(-1, list(range(u.num_elements)), u.prioritized)
+        return u.final_list
+
+    expected = list(reference())
+    assert u.prioritized_list() == expected, "rank_prioritize() order differs from prioritize()"
+
+    t_ref = best_of(reference, 3)
+    t_new = best_of(u.prioritized_list, 3)
+    print(f"N={num_elements} P={num_parameters}")
+    print(f"prioritize (reference): {t_ref * 1000:10.2f} ms")
+    print(f"rank_prioritize:        {t_new * 1000:10.2f} ms")
+    print(f"speedup:                {t_ref / t_new:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
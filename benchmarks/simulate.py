@@ -0,0 +1,607 @@
+#!/usr/bin/env python3
+"""Drive the experiment flow with synthetic participants and report server-side costs.
+
+Each participant walks the real routes (welcome -> start -> demographics ->
+run_method -> method_page ... -> complete), answers every method from a shared
+ground-truth ordering of the risks plus Gaussian noise, and sends the
+/api/session_meta and /api/track beacons tracker.js would send for each page
+view: one flush every 5 s of simulated dwell time plus one on submit/unload.
+Dwell time is simulated, not slept, so beacons keep a realistic ratio to page
+requests without slowing the run down.
+
+Usage:
+    python benchmarks/simulate.py [--participants N] [--workers W] [--risks R]
+                                  [--truth 3,0,1,2 | random] [--noise SD] [--track-scale S]
+                                  [--db PATH] [--experiment ID] [--url URL] [--seed S]
+
+By default the app runs in this process (create_app + test client) on a
+scratch SQLite file with a generated experiment that uses every method type.
+--db/--experiment reuse an existing database and experiment. --url drives a
+running server over HTTP instead (the experiment must exist, and session
+cookies must not be Secure-only for plain http); pass --db to that server's
+database file to also measure its growth. SQLite write/commit timings and lock
+errors are only measured in-process.
+
+The report gives throughput, per-route p50/p95/p99 latency, SQLite write waits
+and DB growth (bytes and rows) per participant.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from http.cookiejar import CookieJar
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api import ingest  # noqa: E402  (encodes /api/track batches the way tracker.js does)
+
+METHOD_TYPES = ('uranus', 'matrix', 'ranking', 'categorization', 'budget')
+FLUSH_INTERVAL = 5.0  # tracker.js FLUSH_INTERVAL, seconds
+EVENTS_PER_SECOND = 0.8  # clicks, scrolls, changes and key presses while a page is open
+# Mean simulated dwell time per page view, seconds (form pages add FIELD_TIME per field)
+DWELL_TIME = {'welcome': 8.0, 'demographics': 15.0, 'method_choice': 10.0, 'instructions': 20.0,
+              'method': 4.0, 'between': 5.0, 'complete': 5.0}
+FIELD_TIME = 2.0
+SLOW_WRITE = 0.010  # writes/commits slower than this are counted as lock waits
+MAX_STEPS = 5000  # requests per participant before giving up
+
+
+class PageParser(HTMLParser):
+    """Form fields of a rendered page, plus the data attributes the method pages use."""
+
+    def __init__(self):
+        super().__init__()
+        self.fields = {}      # name -> value, in document order
+        self.selects = {}     # select name -> option values (without the empty placeholder)
+        self.checkboxes = []  # (name, value)
+        self.totals = {}      # budget parameter -> total points
+        self.lists = {}       # ranking parameter -> risk ids in page order
+        self._select = None
+        self._list = None
+
+    def handle_starttag(self, tag, attrs):
+        a = dict(attrs)
+        name = a.get('name')
+        if tag == 'input' and name:
+            if a.get('type') == 'checkbox':
+                self.checkboxes.append((name, a.get('value', 'on')))
+            else:
+                self.fields[name] = a.get('value') or ''
+        elif tag in ('select', 'textarea') and name:
+            self.fields[name] = ''
+            if tag == 'select':
+                self._select = self.selects.setdefault(name, [])
+        elif tag == 'option' and self._select is not None and a.get('value'):
+            self._select.append(a['value'])
+        elif tag == 'ul' and 'sortable-list' in (a.get('class') or ''):
+            self._list = self.lists.setdefault(a.get('data-param'), [])
+        elif tag == 'li' and self._list is not None and 'data-id' in a:
+            self._list.append(a['data-id'])
+        elif 'data-total' in a:
+            self.totals[a.get('data-param')] = int(a['data-total'])
+
+    def handle_endtag(self, tag):
+        if tag == 'select':
+            self._select = None
+        elif tag == 'ul':
+            self._list = None
+
+
+def parse_page(html):
+    parser = PageParser()
+    parser.feed(html)
+    return parser
+
+
+def route_name(method, path):
+    return f"{method} {re.sub(r'/[0-9]+', '/<id>', path)}"
+
+
+class Recorder:
+    """Thread-safe request latencies per route."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}  # route -> [seconds]
+        self.statuses = {}   # route -> {status: count}
+
+    def record(self, route, seconds, status):
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            counts = self.statuses.setdefault(route, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    @property
+    def num_requests(self):
+        return sum(len(v) for v in self.latencies.values())
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a sorted list."""
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+class TestClientTransport:
+    """Requests through the app's test client (one cookie jar per participant)."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form=None, json_body=None):
+        resp = self.client.open(path, method=method, data=form, json=json_body)
+        location = resp.headers.get('Location')
+        return resp.status_code, location and urllib.parse.urlsplit(location).path, resp.get_data(as_text=True)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpTransport:
+    """Requests over HTTP to a running server; redirects are returned, not followed, so each is timed."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect)
+
+    def request(self, method, path, form=None, json_body=None):
+        data, headers = None, {}
+        if json_body is not None:
+            data, headers = json.dumps(json_body).encode(), {'Content-Type': 'application/json'}
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode()
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as resp:
+                status, headers, body = resp.status, resp.headers, resp.read()
+        except urllib.error.HTTPError as e:
+            status, headers, body = e.code, e.headers, e.read()
+        location = headers.get('Location')
+        return status, location and urllib.parse.urlsplit(location).path, body.decode('utf-8', 'replace')
+
+
+class Participant:
+    """One synthetic participant: walks the flow and answers from perceived scores."""
+
+    def __init__(self, transport, recorder, experiment_id, name, truth, noise, track_scale, rnd):
+        self.transport = transport
+        self.recorder = recorder
+        self.experiment_id = experiment_id
+        self.name = name
+        self.truth = {position: 1 - i / len(truth) for i, position in enumerate(truth)}
+        self.noise = noise
+        self.track_scale = track_scale
+        self.rnd = rnd
+        self.steps = 0
+        self.clock = 0.0  # simulated ms since the page was loaded, for event timestamps
+
+    def perceive(self, position):
+        """Noisy score of the risk at `position` (risks not in the truth ordering score 0)."""
+        return self.truth.get(position, 0.0) + self.rnd.gauss(0, self.noise)
+
+    def request(self, method, path, form=None, json_body=None):
+        self.steps += 1
+        if self.steps > MAX_STEPS:
+            raise RuntimeError(f'no completion after {MAX_STEPS} requests')
+        start = time.perf_counter()
+        status, location, body = self.transport.request(method, path, form, json_body)
+        self.recorder.record(route_name(method, path), time.perf_counter() - start, status)
+        if status >= 500:
+            raise RuntimeError(f'{method} {path} returned {status}')
+        return status, location, body
+
+    # --- tracker.js ---
+
+    def _event(self, event_type, path, data=None):
+        self.clock += self.rnd.expovariate(EVENTS_PER_SECOND) * 1000
+        return {'timestamp': round(self.clock, 1), 'event_type': event_type, 'page_url': path,
+                'element_id': '', 'element_tag': 'button' if event_type == 'click' else '',
+                'element_class': '', 'event_data': data or {}}
+
+    def view(self, kind, path, method_session_id=None, num_fields=0):
+        """Send what tracker.js sends while a page of `kind` is open."""
+        if self.track_scale <= 0:
+            return
+        self.clock = 0.0
+        self.request('POST', '/api/session_meta', json_body={
+            'screen_width': 1920, 'screen_height': 1080, 'language': 'en-US',
+            'timezone': 'Europe/Warsaw', 'is_iframe': False})
+        mean = DWELL_TIME[kind] + FIELD_TIME * num_fields
+        dwell = self.rnd.lognormvariate(math.log(mean), 0.5)
+        events = [self._event('page_load', path, {'url': path, 'referrer': ''})]
+        num_flushes = int(dwell // FLUSH_INTERVAL) + 1
+        for i in range(num_flushes):
+            interval = min(FLUSH_INTERVAL, dwell - i * FLUSH_INTERVAL)
+            expected = EVENTS_PER_SECOND * interval * self.track_scale
+            for _ in range(int(expected) + (self.rnd.random() < expected % 1)):
+                events.append(self._event(self.rnd.choice(('click', 'scroll', 'change', 'keypress')), path))
+            if i == num_flushes - 1:
+                events.append(self._event('page_unload', path, {'time_on_page_ms': round(dwell * 1000)}))
+            if events:
+                self.request('POST', '/api/track', json_body=ingest.encode_columns(events, method_session_id))
+            events = []
+
+    # --- answers ---
+
+    def _ranks(self, count):
+        """Rank (0 = most important) of each of `count` risks in page order, as perceived now."""
+        scores = [self.perceive(position) for position in range(count)]
+        order = sorted(range(count), key=lambda i: -scores[i])
+        ranks = [0] * count
+        for rank, i in enumerate(order):
+            ranks[i] = rank
+        return ranks
+
+    def answer(self, page):
+        """Form data answering a method page."""
+        fields = page.fields
+        if {'a', 'b', 'c'} <= fields.keys():
+            a, b = int(fields['a']), int(fields['b'])
+            choice = 1 if self.perceive(a) > self.perceive(b) else 0
+            return {'a': fields['a'], 'b': fields['b'], 'c': fields['c'], 'choice': str(choice)}
+
+        groups = {}  # (kind, parameter) -> field names in page (= risk) order
+        for name in fields:
+            match = re.fullmatch(r'(category|points)_(.+)_[0-9]+', name)
+            if match:
+                groups.setdefault(match.groups(), []).append(name)
+            elif name.startswith('order_'):
+                groups[('order', name[len('order_'):])] = [name]
+            elif re.fullmatch(r'.+_[0-9]+', name) and name in page.selects:
+                groups.setdefault(('matrix', name.rsplit('_', 1)[0]), []).append(name)
+
+        form = {}
+        for (kind, param), names in groups.items():
+            if kind == 'order':
+                ids = page.lists.get(param, [])
+                ranks = self._ranks(len(ids))
+                form[names[0]] = ','.join(ids[i] for i in sorted(range(len(ids)), key=ranks.__getitem__))
+                continue
+            ranks = self._ranks(len(names))
+            if kind == 'points':
+                total = page.totals.get(param, 100)
+                weights = [len(names) - r for r in ranks]
+                points = [total * w // sum(weights) for w in weights]
+                for i in sorted(range(len(names)), key=ranks.__getitem__)[:total - sum(points)]:
+                    points[i] += 1
+                form.update(zip(names, map(str, points)))
+            else:
+                for name, rank in zip(names, ranks):
+                    options = page.selects[name]
+                    band = rank * len(options) // len(names)
+                    # Categories are listed from most to least important, matrix scales from low to high
+                    form[name] = options[band] if kind == 'category' else options[len(options) - 1 - band]
+        return form
+
+    def fill(self, page):
+        """Form data for the demographics page: a random option for selects, other fields left empty."""
+        return {name: (self.rnd.choice(page.selects[name]) if page.selects.get(name) else '')
+                for name in page.fields}
+
+    # --- flow ---
+
+    def run(self):
+        exp = f'/experiment/{self.experiment_id}'
+        status, _, _ = self.request('GET', exp)
+        if status != 200:
+            raise RuntimeError(f'experiment {self.experiment_id} is not available ({status})')
+        self.view('welcome', exp, num_fields=1)
+        _, path, _ = self.request('POST', f'{exp}/start', form={'name': self.name})
+        while True:
+            if path is None:
+                raise RuntimeError('expected a redirect')
+            kind = path.rstrip('/').rsplit('/', 1)[-1]
+            if path.endswith('/run'):
+                _, path, _ = self.request('GET', path)
+            elif '/method/' in path:
+                path = self.method(path)
+            elif kind in ('demographics', 'method_choice'):
+                _, _, body = self.request('GET', path)
+                page = parse_page(body)
+                self.view(kind, path, num_fields=len(page.fields) + len(page.checkboxes))
+                if kind == 'demographics':
+                    form = self.fill(page)
+                else:
+                    form = {'methods': [value for name, value in page.checkboxes if name == 'methods']}
+                _, path, _ = self.request('POST', path, form=form)
+            elif kind in ('instructions', 'between'):
+                self.request('GET', path)
+                self.view(kind, path)
+                path = f'{exp}/run'
+            elif kind == 'complete':
+                self.request('GET', path)
+                self.view(kind, path)
+                return
+            else:
+                raise RuntimeError(f'unexpected redirect to {path}')
+
+    def method(self, path):
+        """Answer the method page at `path` until it redirects; returns the redirect target."""
+        method_session_id = int(path.rstrip('/').rsplit('/', 1)[-1])
+        status, location, body = self.request('GET', path)
+        empty_pages = 0
+        while True:
+            if location:
+                return location
+            page = parse_page(body)
+            form = self.answer(page)
+            self.view('method', path, method_session_id, num_fields=len(form))
+            if not form:
+                # Method intro, or a finished Uranus page: go on once, then move to the next method
+                empty_pages += 1
+                target = path if empty_pages == 1 else f'/experiment/{self.experiment_id}/run'
+                status, location, body = self.request('GET', target)
+                if target != path and not location:
+                    raise RuntimeError(f'{target} did not redirect')
+                continue
+            status, location, body = self.request('POST', path, form=form)
+
+
+class SqliteMonitor:
+    """Times SQLite writes and commits of an in-process app (waits on the database lock show up here)."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+        self._event = event
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.durations = []
+        self.locked_errors = 0
+        self._listeners = [
+            (engine, 'before_cursor_execute', self._before_execute),
+            (engine, 'after_cursor_execute', self._after_execute),
+            (engine, 'commit', self._before_commit),
+            (Session, 'after_commit', self._after_commit),
+            (engine, 'handle_error', self._error),
+        ]
+        for target, name, fn in self._listeners:
+            event.listen(target, name, fn)
+
+    def close(self):
+        for target, name, fn in self._listeners:
+            self._event.remove(target, name, fn)
+
+    def _add(self, seconds):
+        with self._lock:
+            self.durations.append(seconds)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.execute_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            self._add(time.perf_counter() - self._local.execute_start)
+
+    def _before_commit(self, conn):
+        self._local.commit_start = time.perf_counter()
+
+    def _after_commit(self, session):
+        start = getattr(self._local, 'commit_start', None)
+        if start is not None:
+            self._add(time.perf_counter() - start)
+            self._local.commit_start = None
+
+    def _error(self, context):
+        if 'database is locked' in str(context.original_exception):
+            with self._lock:
+                self.locked_errors += 1
+
+    def summary(self):
+        durations = sorted(self.durations)
+        slow = [d for d in durations if d >= SLOW_WRITE]
+        return {
+            'writes': len(durations),
+            'p99_ms': percentile(durations, 99) * 1000 if durations else 0.0,
+            'max_ms': durations[-1] * 1000 if durations else 0.0,
+            'slow': len(slow),
+            'slow_total_s': sum(slow),
+            'locked_errors': self.locked_errors,
+        }
+
+
+def db_footprint(path):
+    """Bytes on disk (including -wal/-journal) and row counts per table of a SQLite file."""
+    size = sum(os.path.getsize(path + suffix) for suffix in ('', '-wal', '-journal')
+               if os.path.exists(path + suffix))
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        tables = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        rows = {t: conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in tables}
+    finally:
+        conn.close()
+    return size, rows
+
+
+def local_app(db_path):
+    from app import create_app
+    from app.config import Config
+
+    class SimulationConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.abspath(db_path)
+        SESSION_COOKIE_SECURE = False
+        SESSION_COOKIE_SAMESITE = 'Lax'
+
+    return create_app(SimulationConfig)
+
+
+def drain(app):
+    """Store the events the app's /api/track queue or segment log still holds; returns its stats."""
+    segment_log = app.extensions.get('segment_log')
+    if segment_log is not None:
+        from app.api import segment_log as segments
+        segment_log.close()
+        stats = segment_log.stats()
+        with app.app_context():
+            start = time.perf_counter()
+            stats['compacted'] = segments.compact(segment_log.directory)
+            stats['compact_s'] = time.perf_counter() - start
+        return stats
+    queue = app.extensions.get('event_queue')
+    if queue is None:
+        return None
+    queue.flush()
+    return queue.stats()
+
+
+def create_experiment(app, num_risks):
+    """Active experiment with `num_risks` risks and one method of each type (fixed order)."""
+    from app import db
+    from app.methods import METHOD_TYPE_LABELS, get_default_config
+    from app.models import Experiment, Method, Risk
+    with app.app_context():
+        exp = Experiment(name='Simulation', is_active=True, demographics_enabled=True,
+                         method_assignment_mode='fixed')
+        db.session.add(exp)
+        db.session.flush()
+        for i in range(num_risks):
+            db.session.add(Risk(experiment_id=exp.id, name=f'Risk {i + 1}', order=i))
+        for i, method_type in enumerate(METHOD_TYPES):
+            db.session.add(Method(experiment_id=exp.id, method_type=method_type,
+                                  display_name=METHOD_TYPE_LABELS[method_type],
+                                  config=json.dumps(get_default_config(method_type)), order=i, is_active=True))
+        db.session.commit()
+        return exp.id
+
+
+def simulate(transport_factory, experiment_id, participants, workers=8, truth=(), noise=0.1,
+             track_scale=1.0, seed=0):
+    """Run `participants` synthetic participants with `workers` threads.
+
+    Returns a dict with the Recorder, the wall time and the per-participant
+    errors (participant index -> message).
+    """
+    recorder = Recorder()
+    errors = {}
+
+    def one(i):
+        rnd = random.Random(seed * 1000003 + i)
+        p = Participant(transport_factory(), recorder, experiment_id, f'sim-{seed}-{i}', truth, noise,
+                        track_scale, rnd)
+        try:
+            p.run()
+        except Exception as e:
+            errors[i] = f'{type(e).__name__}: {e}'
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(one, range(participants)))
+    return {'recorder': recorder, 'wall_s': time.perf_counter() - start, 'errors': errors}
+
+
+def report(result, participants, sqlite=None, growth=None, out=sys.stdout):
+    recorder, wall = result['recorder'], result['wall_s']
+    completed = participants - len(result['errors'])
+    print(f"participants: {completed} completed, {len(result['errors'])} failed in {wall:.2f} s "
+          f"({completed / wall:.1f}/s); {recorder.num_requests} requests ({recorder.num_requests / wall:.0f}/s)",
+          file=out)
+    for i, message in sorted(result['errors'].items())[:5]:
+        print(f'  participant {i}: {message}', file=out)
+
+    print(f"\n{'route':<48} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  status", file=out)
+    for route in sorted(recorder.latencies):
+        values = sorted(recorder.latencies[route])
+        statuses = ' '.join(f'{s}:{n}' for s, n in sorted(recorder.statuses[route].items()))
+        print(f'{route:<48} {len(values):>7} ' + ' '.join(
+            f'{percentile(values, q) * 1000:>8.2f}' for q in (50, 95, 99)) + f'  {statuses}', file=out)
+
+    if sqlite is not None:
+        print(f"\nSQLite writes/commits: {sqlite['writes']}, p99 {sqlite['p99_ms']:.2f} ms, "
+              f"max {sqlite['max_ms']:.2f} ms; {sqlite['slow']} waited >= {SLOW_WRITE * 1000:.0f} ms "
+              f"({sqlite['slow_total_s']:.2f} s in total); {sqlite['locked_errors']} 'database is locked' errors",
+              file=out)
+    if growth is not None:
+        (size_before, rows_before), (size_after, rows_after) = growth
+        per = max(completed, 1)
+        print(f'\nDB growth: {(size_after - size_before) / per / 1024:.1f} KiB per participant '
+              f'({size_before / 1024:.0f} -> {size_after / 1024:.0f} KiB)', file=out)
+        for table in sorted(rows_after):
+            delta = rows_after[table] - rows_before.get(table, 0)
+            if delta:
+                print(f'  {table:<22} {delta / per:>10.1f} rows per participant', file=out)
+
+
+def parse_truth(value, num_risks, seed):
+    if value == 'random':
+        order = list(range(num_risks))
+        random.Random(seed).shuffle(order)
+        return order
+    return [int(x) for x in value.split(',') if x.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate participants against the experiment flow.')
+    parser.add_argument('--participants', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=8, help='concurrent participants (threads)')
+    parser.add_argument('--risks', type=int, default=10, help='risks in the generated experiment')
+    parser.add_argument('--truth', default='random',
+                        help="risk positions from most to least important, e.g. 2,0,1 (default: random)")
+    parser.add_argument('--noise', type=float, default=0.1,
+                        help='standard deviation of perception noise, as a fraction of the score range')
+    parser.add_argument('--track-scale', type=float, default=1.0,
+                        help='multiplier for tracker event rates (0 disables /api/track and /api/session_meta)')
+    parser.add_argument('--db', help='SQLite file (default: scratch file; with --url, the server database)')
+    parser.add_argument('--experiment', type=int, help='existing experiment id')
+    parser.add_argument('--url', help='base URL of a running server')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.url and args.experiment is None:
+        parser.error('--url needs --experiment')
+    truth = parse_truth(args.truth, args.risks, args.seed)
+
+    monitor = None
+    if args.url:
+        base_url = args.url
+        transport_factory = lambda: HttpTransport(base_url)  # noqa: E731
+        db_path, experiment_id = args.db, args.experiment
+    else:
+        db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='neptune-sim-'), 'simulate.db')
+        app = local_app(db_path)
+        experiment_id = args.experiment or create_experiment(app, args.risks)
+        with app.app_context():
+            from app import db
+            monitor = SqliteMonitor(db.engine)
+        transport_factory = lambda: TestClientTransport(app)  # noqa: E731
+        print(f'database: {db_path}, experiment {experiment_id}')
+
+    before = db_footprint(db_path) if db_path else None
+    try:
+        result = simulate(transport_factory, experiment_id, args.participants, args.workers, truth,
+                          args.noise, args.track_scale, args.seed)
+    finally:
+        queue_stats = drain(app) if not args.url else None
+        if monitor:
+            monitor.close()
+    growth = (before, db_footprint(db_path)) if db_path else None
+    report(result, args.participants, monitor.summary() if monitor else None, growth)
+    if queue_stats and 'compacted' in queue_stats:
+        segments, events = queue_stats['compacted']
+        print(f"\nsegment log: {queue_stats['batches']} batches, {queue_stats['bytes'] / 1024:.0f} KiB in "
+              f"{queue_stats['sealed']} segments; compacted {events} events from {segments} segments "
+              f"in {queue_stats['compact_s']:.2f} s")
+    elif queue_stats:
+        print(f"\nevent queue: {queue_stats['written']} written in {queue_stats['flushes']} flushes "
+              f"(mean {queue_stats['mean_flush_ms'] or 0:.1f} ms, max {queue_stats['max_flush_ms']:.1f} ms), "
+              f"max depth {queue_stats['max_depth']}, {queue_stats['rejected']} rejected, "
+              f"{queue_stats['lost']} lost")
+    return 0 if not result['errors'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
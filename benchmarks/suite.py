@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the Uranus core and the method handlers, with stored baselines.
+
+Usage:
+    python benchmarks/suite.py [-k SUBSTRING] [--rounds R] [--output results.json]
+                               [--baseline benchmarks/baseline.json] [--threshold 0.25] [--save]
+
+Each benchmark is timed for R rounds. A round repeats the benchmark, each time
+after a fresh untimed setup, until MIN_ROUND_TIME of work is measured. The
+per-operation minimum and median over the rounds are reported. Results are compared with the
+baseline file on the minimum: a benchmark more than THRESHOLD slower is a
+regression and makes the command exit with status 1. --output writes the
+results as JSON ('-' for stdout), --save overwrites the baseline with them.
+Timings are machine-specific: record the baseline on the machine that runs the
+comparison (e.g. the deploy host) before comparing versions.
+
+Method handlers run against an in-memory SQLite app, with empty tables and
+generated risks for each round. The track.* benchmarks store /api/track
+batches through the bulk ingest path and, for comparison, through the ORM
+path it replaced; an operation is one event, so ops/s is events per second.
+The track.decode.* benchmarks only decode a request body into rows, for the
+object-per-event and the columnar wire format, and for gzipped columnar.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import uranus  # noqa: E402
+from app import uranus_codec  # noqa: E402
+
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+CORE_SIZES = (15, 100, 1000)
+HANDLER_SIZES = (15, 100)
+METHOD_TYPES = ('uranus', 'matrix', 'ranking', 'categorization', 'budget')
+MAX_URANUS_ANSWERS = 100  # answers per setup for the Uranus process_response benchmark
+MIN_ROUND_TIME = 0.05  # seconds of timed work per round (cheap benchmarks repeat their setup)
+
+# (name, setup); setup() returns a callable that runs the benchmark once and returns its number of operations
+BENCHMARKS = []
+
+
+def register(name, setup):
+    BENCHMARKS.append((name, setup))
+
+
+# --- Uranus core ---
+
+def _truth(num_elements, num_parameters, seed=0):
+    """Element -> rank (higher = more important) for each parameter."""
+    rnd = random.Random(seed)
+    return [rnd.sample(range(num_elements), num_elements) for _ in range(num_parameters)]
+
+
+def _new_uranus(num_elements, num_parameters=2):
+    u = uranus.Uranus([f'p{i}' for i in range(num_parameters)], [f'e{i}' for i in range(num_elements)],
+                      log_sink=uranus.NullLogSink())
+    u.set_logging(False)
+    return u
+
+
+def _answer(u, truth, limit=None):
+    """Answer pending comparisons from `truth` until done (or `limit` answers); returns the number answered."""
+    count = 0
+    while not u.is_done() and (limit is None or count < limit):
+        a, b, c = u.next_to_process()
+        u.set_priority(1 if truth[c][a] > truth[c][b] else 0)
+        count += 1
+    return count
+
+
+def bench_uranus_loop(n):
+    u = _new_uranus(n)
+    truth = _truth(n, 2)
+    return lambda: _answer(u, truth)
+
+
+def bench_prioritized_list(n):
+    rnd = random.Random(0)
+    u = _new_uranus(n, 5)
+    u.prioritized = [rnd.sample(range(n), n) for _ in range(5)]
+    reps = max(1, 1000 // n)
+
+    def run():
+        for _ in range(reps):
+            u.prioritized_list()
+        return reps
+    return run
+
+
+def bench_state_roundtrip(n):
+    from app.methods.uranus_method import UranusMethod
+    handler = UranusMethod()
+    u = _new_uranus(n)
+    truth = _truth(n, 2)
+    _answer(u, truth, limit=_answer(_new_uranus(n), truth) // 2)
+    reps = max(10, 10000 // n)
+
+    def run():
+        for _ in range(reps):
+            text = uranus_codec.encode_state(handler._serialize_state(u))
+            handler._restore_state(uranus_codec.decode_state(text), u.p_names, u.e_names)
+        return reps
+    return run
+
+
+for _n in CORE_SIZES:
+    register(f'uranus.loop[{_n}]', lambda n=_n: bench_uranus_loop(n))
+    register(f'uranus.prioritized_list[{_n}]', lambda n=_n: bench_prioritized_list(n))
+    register(f'uranus.state_roundtrip[{_n}]', lambda n=_n: bench_state_roundtrip(n))
+
+
+# --- Method handlers ---
+
+class BenchConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SECRET_KEY = 'bench'
+    ADMIN_PASSWORD = 'bench'
+
+
+_app = None
+
+
+def bench_app():
+    global _app
+    if _app is None:
+        from app import create_app
+        _app = create_app(BenchConfig)
+    return _app
+
+
+def _method_session(method_type, num_risks):
+    """A new in-progress MethodSession of `method_type` (default config) over `num_risks` risks, in an empty DB."""
+    from app import db
+    from app.methods import get_default_config
+    from app.methods.uranus_method import uranus_cache
+    # Start from empty tables so timings do not depend on the benchmarks that ran before
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    uranus_cache.clear()
+    from app.models import Experiment, Method, MethodSession, Participant, Risk, Session
+    exp = Experiment(name='Benchmark')
+    db.session.add(exp)
+    db.session.flush()
+    risks = [Risk(experiment_id=exp.id, name=f'Risk {i}', order=i) for i in range(num_risks)]
+    method = Method(experiment_id=exp.id, method_type=method_type, display_name=method_type,
+                    config=json.dumps(get_default_config(method_type)))
+    participant = Participant(experiment_id=exp.id, uuid=f'bench-{exp.id}', name='bench')
+    db.session.add_all(risks + [method, participant])
+    db.session.flush()
+    exp_session = Session(participant_id=participant.id, experiment_id=exp.id)
+    db.session.add(exp_session)
+    db.session.flush()
+    ms = MethodSession(session_id=exp_session.id, method_id=method.id, order=0, status='in_progress')
+    db.session.add(ms)
+    db.session.commit()
+    return ms, risks
+
+
+def _form(method_type, config, risks, rnd):
+    """A complete, valid form submission for a non-Uranus method."""
+    if method_type == 'matrix':
+        return {f"{c['name']}_{r.id}": str(rnd.randint(c['scale_min'], c['scale_max']))
+                for c in config['criteria'] for r in risks}
+    if method_type == 'ranking':
+        return {'order_overall': ','.join(str(r.id) for r in rnd.sample(risks, len(risks)))}
+    if method_type == 'categorization':
+        return {f'category_overall_{r.id}': rnd.choice(config['categories']) for r in risks}
+    points = [0] * len(risks)
+    for _ in range(config['total_points']):
+        points[rnd.randrange(len(risks))] += 1
+    return {f'points_overall_{r.id}': str(p) for r, p in zip(risks, points)}
+
+
+def _uranus_form(handler, ms, risks, truth):
+    ctx = handler.get_context(ms, risks)
+    a, b, c = ctx['a'], ctx['b'], ctx['c']
+    return {'a': str(a), 'b': str(b), 'c': str(c), 'choice': '1' if truth[c][a] > truth[c][b] else '0'}
+
+
+def bench_process_response(method_type, n):
+    from app.methods import get_method_handler
+    handler = get_method_handler(method_type)
+    ms, risks = _method_session(method_type, n)
+    if method_type == 'uranus':
+        truth = _truth(n, 2)
+
+        def run():
+            count = 0
+            while ms.status != 'completed' and count < MAX_URANUS_ANSWERS:
+                handler.process_response(_uranus_form(handler, ms, risks, truth), ms, risks)
+                count += 1
+            return count
+        return run
+
+    form = _form(method_type, ms.method.get_config(), risks, random.Random(0))
+
+    def run():
+        handler.process_response(form, ms, risks)
+        return 1
+    return run
+
+
+def bench_results_summary(method_type, n):
+    from app import db
+    from app.methods import get_method_handler
+    handler = get_method_handler(method_type)
+    ms, risks = _method_session(method_type, n)
+    if method_type == 'uranus':
+        # Complete the session directly on the instance, then store it the way the handler does
+        u = handler._get_or_create_uranus(ms, risks)
+        _answer(u, _truth(n, 2))
+        handler._save_and_finish(ms, u)
+        db.session.commit()
+    else:
+        handler.process_response(_form(method_type, ms.method.get_config(), risks, random.Random(0)), ms, risks)
+
+    def run():
+        for _ in range(10):
+            handler.get_results_summary(ms, risks)
+        return 10
+    return run
+
+
+for _type in METHOD_TYPES:
+    for _n in HANDLER_SIZES:
+        register(f'method.{_type}.process_response[{_n}]', lambda t=_type, n=_n: bench_process_response(t, n))
+        register(f'method.{_type}.get_results_summary[{_n}]', lambda t=_type, n=_n: bench_results_summary(t, n))
+
+
+# --- Interaction event ingest (/api/track) ---
+
+TRACK_SIZES = (50, 500)  # events per request
+
+
+def _track_body(n, seed=0, columns=False):
+    """A /api/track request body with `n` events shaped like tracker.js collects them.
+
+    columns=True encodes them in the columnar format tracker.js sends (see app/api/ingest.py).
+    """
+    from app.api import ingest
+    rnd = random.Random(seed)
+    kinds = ('click', 'scroll', 'change', 'focus', 'blur', 'keypress', 'hesitation')
+    events = [{'timestamp': 1000.0 + 37.5 * i, 'event_type': rnd.choice(kinds), 'page_url': '/experiment/1/method/2',
+               'event_data': {'element_id': f'risk_{rnd.randrange(100)}', 'element_tag': 'button',
+                              'element_class': 'btn btn-outline-primary', 'x': rnd.randrange(1920),
+                              'y': rnd.randrange(1080)}}
+              for i in range(n)]
+    if columns:
+        return json.dumps(ingest.encode_columns(events, '1')).encode()
+    return json.dumps({'events': events, 'method_session_id': '1'}).encode()
+
+
+def _track_orm(data, session_id, method_session_id):
+    """The /api/track write path before the bulk insert (one ORM object per event), kept as the reference."""
+    from app import db
+    from app.models import InteractionEvent
+    for evt in data.get('events', []):
+        event = InteractionEvent(
+            session_id=session_id,
+            method_session_id=method_session_id,
+            timestamp=evt.get('timestamp', 0),
+            event_type=evt.get('event_type', 'unknown'),
+            element_id=evt.get('element_id', ''),
+            element_tag=evt.get('element_tag', ''),
+            element_class=evt.get('element_class', ''),
+            page_url=evt.get('page_url', ''),
+        )
+        event.set_event_data(evt.get('event_data', {}))
+        db.session.add(event)
+    db.session.commit()
+
+
+def bench_track(path, n):
+    """Decode and store one request of `n` events; an operation is one event."""
+    from app import db
+    from app.api import ingest
+    ms, _ = _method_session('ranking', 1)
+    session_id, method_session_id = ms.session_id, ms.id
+    body = _track_body(n)
+
+    def run():
+        data = json.loads(body)
+        if path == 'orm':
+            _track_orm(data, session_id, method_session_id)
+        else:
+            ingest.insert_events(ingest.parse_events(data, session_id))
+            db.session.commit()
+        return n
+    return run
+
+
+def bench_track_decode(wire, n):
+    """Decode one request body of `n` events into rows: object-per-event, columnar, or gzipped columnar."""
+    import gzip
+    from app.api import ingest
+    body = _track_body(n, columns=wire != 'objects')
+    encoding = None
+    if wire == 'gzip':
+        body, encoding = gzip.compress(body), 'gzip'
+
+    def run():
+        return len(ingest.parse_events(ingest.decode_payload(ingest.decode_body(body, encoding)), 1))
+    return run
+
+
+for _n in TRACK_SIZES:
+    register(f'track.orm[{_n}]', lambda n=_n: bench_track('orm', n))
+    register(f'track.bulk[{_n}]', lambda n=_n: bench_track('bulk', n))
+    register(f'track.decode.objects[{_n}]', lambda n=_n: bench_track_decode('objects', n))
+    register(f'track.decode.columns[{_n}]', lambda n=_n: bench_track_decode('columns', n))
+    register(f'track.decode.gzip[{_n}]', lambda n=_n: bench_track_decode('gzip', n))
+
+
+# --- Running and comparing ---
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _round(setup):
+    """Time fresh setups until MIN_ROUND_TIME of work is measured; returns (seconds, operations)."""
+    elapsed = ops = 0
+    gc.collect()
+    gc.disable()
+    try:
+        while not ops or elapsed < MIN_ROUND_TIME:
+            fn = setup()
+            start = time.perf_counter()
+            ops += max(fn(), 1)
+            elapsed += time.perf_counter() - start
+    finally:
+        gc.enable()
+    return elapsed, ops
+
+
+def run(pattern=None, rounds=5):
+    """Run the benchmarks whose name contains `pattern`; returns the results document."""
+    from app.methods.uranus_method import uranus_cache
+    results = {}
+    with bench_app().app_context():
+        for name, setup in BENCHMARKS:
+            if pattern and pattern not in name:
+                continue
+            times = []
+            for _ in range(rounds):
+                elapsed, ops = _round(setup)
+                times.append(elapsed / ops)
+            results[name] = {'min_s': min(times), 'median_s': statistics.median(times), 'rounds': rounds,
+                             'ops': ops}
+    uranus_cache.clear()
+    return {
+        'meta': {
+            'commit': _commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': datetime.utcnow().isoformat(),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=0.25):
+    """Per-benchmark comparison with a baseline document.
+
+    Returns a list of (name, current min_s, baseline min_s or None, ratio or
+    None, status) with status 'ok', 'regression' (ratio > 1 + threshold),
+    'faster' (ratio < 1 - threshold) or 'new'.
+    """
+    rows = []
+    base = (baseline or {}).get('results', {})
+    for name, result in current['results'].items():
+        if name not in base:
+            rows.append((name, result['min_s'], None, None, 'new'))
+            continue
+        ratio = result['min_s'] / base[name]['min_s'] if base[name]['min_s'] else None
+        if ratio is None:
+            status = 'ok'
+        elif ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 - threshold:
+            status = 'faster'
+        else:
+            status = 'ok'
+        rows.append((name, result['min_s'], base[name]['min_s'], ratio, status))
+    return rows
+
+
+def _format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds >= 1 / scale:
+            return f'{seconds * scale:.2f} {unit}'
+    return f'{seconds * 1e9:.0f} ns'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the benchmark suite and compare with the baseline.')
+    parser.add_argument('-k', dest='pattern', help='only benchmarks whose name contains this')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--output', help="write results as JSON to this file ('-' for stdout)")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown as a fraction of the baseline (default 0.25)')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    args = parser.parse_args(argv)
+
+    current = run(args.pattern, max(1, args.rounds))
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    rows = compare(current, baseline, args.threshold)
+
+    out = sys.stderr if args.output == '-' else sys.stdout
+    print(f"{'benchmark':<46} {'per op':>10} {'ops/s':>10} {'baseline':>10} {'ratio':>7}", file=out)
+    for name, now, base, ratio, status in rows:
+        print(f"{name:<46} {_format_time(now):>10} {f'{1 / now:,.0f}' if now else '-':>10} "
+              f"{_format_time(base) if base else '-':>10} "
+              f"{f'{ratio:.2f}' if ratio else '-':>7}  {status if status != 'ok' else ''}", file=out)
+    regressions = [row[0] for row in rows if row[4] == 'regression']
+    if baseline is not None:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%} against "
+              f"{baseline.get('meta', {}).get('commit') or args.baseline}", file=out)
+
+    if args.output == '-':
+        json.dump(current, sys.stdout, indent=2)
+        print()
+    elif args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.save:
+        if args.pattern and baseline:
+            # A partial run only replaces the benchmarks it ran
+            baseline['results'].update(current['results'])
+            baseline['meta'] = current['meta']
+            current = baseline
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2)
+            f.write('\n')
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
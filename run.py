@@ -2,6 +2,8 @@
 """Entry point for URANUS v3 (Neptune v3.0)."""
 
 import os
+import signal
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -18,13 +20,19 @@ if __name__ == '__main__':
 
     print(f"Starting URANUS v3 at http://{host}:{port}")
     print(f"Admin panel: http://{host}:{port}/admin/login")
+    if 'sqlite_profile' in app.extensions:
+        print("SQLite: " + ", ".join(f"{k}={v}" for k, v in app.extensions['sqlite_profile'].items()))
+
+    # Exit normally on SIGTERM (systemd, docker stop) so that atexit handlers
+    # run, among them the flush of the /api/track event queue
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
     if debug_mode:
         app.run(debug=True, host=host, port=port)
     else:
         from waitress import serve
         try:
-            serve(app, host=host, port=port)
+            serve(app, host=host, port=port, threads=Config.WAITRESS_THREADS)
         except Exception as e:
             print(f"Error starting Waitress: {e}")
             print("Falling back to Flask dev server...")
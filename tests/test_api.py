@@ -4,7 +4,7 @@ import uuid
 from app import db
 from app.models import (
     Experiment, Risk, Method, Participant,
-    Session as ExpSession, MethodSession, InteractionEvent,
+    Session as ExpSession, MethodSession, InteractionEvent, AssessmentResult,
 )
 
 
@@ -71,6 +71,105 @@ class TestTrackAPI:
         assert data['count'] == 0
 
 
+    def test_track_beacon_text_plain(self, client, sample_experiment):
+        # navigator.sendBeacon posts a string body as text/plain
+        self._start_session(client, sample_experiment.id)
+        resp = client.post('/api/track', data=json.dumps({
+            'events': [{'timestamp': 10, 'event_type': 'click', 'event_data': {'x': 1}}],
+            'method_session_id': '',
+        }), content_type='text/plain;charset=UTF-8')
+        assert resp.status_code == 200
+        assert resp.get_json()['count'] == 1
+        with client.application.app_context():
+            event = InteractionEvent.query.one()
+            assert event.get_event_data() == {'x': 1}
+            assert event.method_session_id is None
+
+    def test_track_normalises_fields(self, client, sample_experiment):
+        self._start_session(client, sample_experiment.id)
+        with client.application.app_context():
+            ms_id = MethodSession.query.first().id
+        resp = client.post('/api/track', json={
+            'events': [{'timestamp': 'soon', 'event_type': 'x' * 80, 'element_id': 7},
+                       {'timestamp': '12.5'}],
+            'method_session_id': str(ms_id),
+        })
+        assert resp.status_code == 200
+        with client.application.app_context():
+            first, second = InteractionEvent.query.order_by(InteractionEvent.id).all()
+            assert (first.timestamp, len(first.event_type), first.element_id) == (0.0, 50, '7')
+            assert (second.timestamp, second.event_type, second.get_event_data()) == (12.5, 'unknown', {})
+            assert first.method_session_id == second.method_session_id == ms_id
+
+    def test_track_rejects_invalid_batch_entirely(self, client, sample_experiment):
+        self._start_session(client, sample_experiment.id)
+        resp = client.post('/api/track', json={'events': [{'event_type': 'click'}, 'oops']})
+        assert resp.status_code == 400
+        assert resp.get_json()['status'] == 'invalid'
+        resp = client.post('/api/track', json=[1, 2])
+        assert resp.status_code == 400
+        with client.application.app_context():
+            assert InteractionEvent.query.count() == 0
+
+    def test_track_columnar_payload_matches_objects(self, client, sample_experiment):
+        from app.api import ingest
+        self._start_session(client, sample_experiment.id)
+        events = [
+            {'timestamp': 1000.0, 'event_type': 'click', 'page_url': '/m',
+             'event_data': {'element_id': 'choice_1', 'element_tag': 'button', 'nested': [1, 'a'], 'x': 450}},
+            {'timestamp': 1250.0, 'event_type': 'scroll', 'page_url': '/m', 'event_data': {}},
+            {'timestamp': 1240.0, 'event_type': 'click', 'page_url': '/m', 'element_class': 'btn',
+             'event_data': {'element_id': 'choice_2', 'element_tag': 'button', 'nested': None, 'x': 460}},
+        ]  # event_data keys in order: the test client sends JSON with sorted keys
+        payload = ingest.encode_columns(events)
+        assert payload['strings'].count('button') == 1 and payload['dt'] == [0, 250, -10]
+        assert client.post('/api/track', json=payload).get_json() == {'status': 'ok', 'count': 3}
+        assert client.post('/api/track', json={'events': events}).status_code == 200
+        columns = ['timestamp', 'event_type', 'element_id', 'element_tag', 'element_class', 'page_url',
+                   'event_data']
+        with client.application.app_context():
+            stored = [[getattr(e, c) for c in columns]
+                      for e in InteractionEvent.query.order_by(InteractionEvent.id)]
+        assert stored[:3] == stored[3:]
+        assert stored[0][-1] == json.dumps(events[0]['event_data'])
+
+    def test_track_rejects_inconsistent_columns(self, client, sample_experiment):
+        from app.api import ingest
+        self._start_session(client, sample_experiment.id)
+        good = ingest.encode_columns([{'timestamp': 1, 'event_type': 'click', 'event_data': {'id': 'a'}}])
+        broken = [
+            {'v': 3},
+            {**good, 'type': []},
+            {**good, 'url': [99]},
+            {**good, 'url': [-1]},
+            {**good, 'dt': [0.5]},
+            {**good, 'data': [[5, 0]]},
+            {**good, 'data': [[0, 99]]},
+            {**good, 'shapes': [[-1, -1]]},
+            {**good, 'strings': [1, 2]},
+        ]
+        for payload in broken:
+            resp = client.post('/api/track', json=payload)
+            assert resp.status_code == 400, payload
+            assert resp.get_json()['status'] == 'invalid'
+        with client.application.app_context():
+            assert InteractionEvent.query.count() == 0
+
+    def test_track_limits(self, client, sample_experiment):
+        from app.api import ingest
+        self._start_session(client, sample_experiment.id)
+        resp = client.post('/api/track', json={'events': [{}] * (ingest.MAX_TRACK_EVENTS + 1)})
+        assert resp.status_code == 413
+        resp = client.post('/api/track', json=ingest.encode_columns([{}] * (ingest.MAX_TRACK_EVENTS + 1)))
+        assert resp.status_code == 413
+        assert resp.get_json()['status'] == 'too_large'
+        resp = client.post('/api/track', json={
+            'events': [{'event_type': 'click', 'page_url': 'x' * ingest.MAX_TRACK_BYTES}]})
+        assert resp.status_code == 413
+        with client.application.app_context():
+            assert InteractionEvent.query.count() == 0
+
+
 class TestSessionMetaAPI:
 
     def _start_session(self, client, exp_id):
@@ -106,3 +205,160 @@ class TestSessionMetaAPI:
         resp = client.post('/api/session_meta', data='bad',
                            content_type='application/json')
         assert resp.status_code == 400
+
+
+class TestCompressedBodies:
+
+    def _start_session(self, client, exp_id):
+        client.post(f'/experiment/{exp_id}/start', data={'name': 'Tracker'})
+        client.post(f'/experiment/{exp_id}/demographics', data={'email': ''})
+
+    def _post(self, client, path, body, encoding):
+        return client.post(path, data=body, content_type='application/json', headers={'Content-Encoding': encoding})
+
+    def test_gzip_and_deflate_bodies(self, client, sample_experiment):
+        import gzip
+        import zlib
+        from app.api import ingest
+        self._start_session(client, sample_experiment.id)
+        batch = json.dumps(ingest.encode_columns(
+            [{'timestamp': i, 'event_type': 'click', 'page_url': '/m', 'event_data': {'x': i}} for i in range(20)]))
+        raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        for encoding, body in [('gzip', gzip.compress(batch.encode())), ('deflate', zlib.compress(batch.encode())),
+                               ('deflate', raw.compress(batch.encode()) + raw.flush())]:
+            resp = self._post(client, '/api/track', body, encoding)
+            assert resp.status_code == 200 and resp.get_json()['count'] == 20, encoding
+        meta = gzip.compress(json.dumps({'screen_width': 1280, 'language': 'pl-PL'}).encode())
+        assert self._post(client, '/api/session_meta', meta, 'gzip').status_code == 200
+        with client.application.app_context():
+            assert InteractionEvent.query.count() == 60
+            assert ExpSession.query.first().screen_width == 1280
+
+        stats = ingest.compression_stats()
+        assert stats['gzip']['requests'] >= 2 and stats['gzip']['bytes_out'] > stats['gzip']['bytes_in']
+        assert stats['gzip']['ratio'] > 1 and stats['gzip']['decode_cpu_ms'] >= 0
+
+    def test_decompression_limits_and_errors(self, client, sample_experiment):
+        import gzip
+        from app.api import ingest
+        self._start_session(client, sample_experiment.id)
+        # A few hundred bytes that would inflate to far more than an uncompressed body may be
+        bomb = gzip.compress(b'{"events": [' + b' ' * (64 * ingest.MAX_TRACK_BYTES) + b']}')
+        assert len(bomb) < ingest.MAX_TRACK_BYTES // 4
+        resp = self._post(client, '/api/track', bomb, 'gzip')
+        assert resp.status_code == 413 and resp.get_json()['status'] == 'too_large'
+        meta = gzip.compress(b'{"language": "' + b'x' * ingest.MAX_META_BYTES + b'"}')
+        assert self._post(client, '/api/session_meta', meta, 'gzip').status_code == 413
+
+        resp = self._post(client, '/api/track', gzip.compress(b'{"events": []}')[:-6], 'gzip')
+        assert resp.status_code == 400 and resp.get_json()['status'] == 'invalid_encoding'
+        resp = self._post(client, '/api/track', b'{"events": []}', 'br')
+        assert resp.status_code == 415 and resp.get_json()['status'] == 'unsupported_encoding'
+        with client.application.app_context():
+            assert InteractionEvent.query.count() == 0
+        assert ingest.compression_stats()['br']['rejected'] >= 1
+
+
+class TestUranusAnswersAPI:
+
+    def _setup(self, client, num_risks=6):
+        """Helper: experiment with one Uranus method; start a session and open the method."""
+        with client.application.app_context():
+            exp = Experiment(name='Pairwise', is_active=True, demographics_enabled=False)
+            db.session.add(exp)
+            db.session.flush()
+            for i in range(num_risks):
+                db.session.add(Risk(experiment_id=exp.id, name=f'Risk {i}', order=i))
+            db.session.add(Method(experiment_id=exp.id, method_type='uranus', display_name='Pairwise',
+                                  config=json.dumps({'parameters': ['impact', 'probability']}), order=0))
+            db.session.commit()
+            exp_id = exp.id
+        client.post(f'/experiment/{exp_id}/start', data={'name': 'Batcher'})
+        resp = client.get(f'/experiment/{exp_id}/run')
+        ms_id = int(resp.headers['Location'].rstrip('/').split('/')[-1])
+        return exp_id, ms_id
+
+    def _local_answers(self, num_risks, count, start=0):
+        """Answer comparisons locally with a reference Uranus (always choice 1)."""
+        from uranus import Uranus, NullLogSink
+        u = Uranus(['impact', 'probability'], [f'Risk {i}' for i in range(num_risks)], log_sink=NullLogSink())
+        answers = []
+        while u.num_comparisons < start + count:
+            a, b, c = u.next_to_process()
+            if a is None:
+                break
+            if u.num_comparisons >= start:
+                answers.append({'a': a, 'b': b, 'c': c, 'choice': 1})
+            u.set_priority(1)
+        return answers
+
+    def test_batch_applied_in_one_request(self, client, db):
+        exp_id, ms_id = self._setup(client)
+        answers = self._local_answers(6, 5)
+        resp = client.post(f'/api/uranus/{ms_id}/answers', json={'version': 0, 'answers': answers})
+        assert resp.status_code == 200
+        data = resp.get_json()
+        assert data['applied'] == 5
+        assert data['version'] == 5
+        assert data['next'] is not None
+        expected_next = self._local_answers(6, 1, start=5)[0]
+        assert (data['next']['a'], data['next']['b'], data['next']['c']) == \
+            (expected_next['a'], expected_next['b'], expected_next['c'])
+        following = self._local_answers(6, 1, start=6)[0]  # the reference always answers 1
+        assert (data['prefetch']['1']['a'], data['prefetch']['1']['b'], data['prefetch']['1']['c']) == \
+            (following['a'], following['b'], following['c'])
+        with client.application.app_context():
+            assert AssessmentResult.query.filter_by(method_session_id=ms_id).count() == 5
+
+    def test_batch_completes_method(self, client, db):
+        exp_id, ms_id = self._setup(client, num_risks=4)
+        answers = self._local_answers(4, 100)
+        resp = client.post(f'/api/uranus/{ms_id}/answers', json={'version': 0, 'answers': answers})
+        data = resp.get_json()
+        assert data['complete'] is True
+        assert data['next'] is None
+        with client.application.app_context():
+            ms = MethodSession.query.get(ms_id)
+            assert ms.status == 'completed'
+            results = [r.get_result_data() for r in ms.results]
+            assert any(r.get('type') == 'final_ranking' for r in results)
+
+    def test_version_conflict(self, client, db):
+        exp_id, ms_id = self._setup(client)
+        answers = self._local_answers(6, 2)
+        client.post(f'/api/uranus/{ms_id}/answers', json={'version': 0, 'answers': answers})
+        resp = client.post(f'/api/uranus/{ms_id}/answers', json={'version': 0, 'answers': answers})
+        assert resp.status_code == 409
+        data = resp.get_json()
+        assert data['applied'] == 0
+        assert data['version'] == 2
+
+    def test_mismatched_answer_stops_batch(self, client, db):
+        exp_id, ms_id = self._setup(client)
+        answers = self._local_answers(6, 3)
+        answers[2] = dict(answers[2], b=answers[2]['a'])
+        resp = client.post(f'/api/uranus/{ms_id}/answers', json={'version': 0, 'answers': answers})
+        assert resp.status_code == 409
+        data = resp.get_json()
+        assert data['applied'] == 2
+        assert data['version'] == 2
+
+    def test_invalid_payload(self, client, db):
+        exp_id, ms_id = self._setup(client)
+        resp = client.post(f'/api/uranus/{ms_id}/answers', json={'answers': 'x'})
+        assert resp.status_code == 400
+
+    def test_other_participants_session_forbidden(self, client, db):
+        exp_id, ms_id = self._setup(client)
+        other = client.application.test_client()
+        other.post(f'/experiment/{exp_id}/start', data={'name': 'Intruder'})
+        resp = other.post(f'/api/uranus/{ms_id}/answers', json={'version': 0, 'answers': []})
+        assert resp.status_code == 403
+
+    def test_method_page_embeds_prefetch(self, client, db):
+        exp_id, ms_id = self._setup(client)
+        resp = client.get(f'/experiment/{exp_id}/method/{ms_id}')
+        assert resp.status_code == 200
+        assert b'id="uranusData"' in resp.data
+        assert b'"prefetch"' in resp.data
+        assert b'js/uranus.js' in resp.data
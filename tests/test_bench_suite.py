@@ -0,0 +1,51 @@
+"""Tests for the benchmark suite runner (benchmarks/suite.py)."""
+import json
+
+from benchmarks import suite
+
+
+def _doc(**times):
+    return {'meta': {}, 'results': {name: {'min_s': t} for name, t in times.items()}}
+
+
+class TestBenchSuite:
+
+    def test_compare_with_baseline(self):
+        rows = suite.compare(_doc(a=1.3, b=1.0, c=0.5, d=2.0), _doc(a=1.0, b=0.9, c=1.0), threshold=0.25)
+        assert [(row[0], row[4]) for row in rows] == [('a', 'regression'), ('b', 'ok'), ('c', 'faster'),
+                                                      ('d', 'new')]
+        assert rows[0][3] == 1.3
+        assert all(row[4] == 'new' for row in suite.compare(_doc(a=1.0), None))
+
+    def test_run_selected_benchmarks(self, monkeypatch):
+        monkeypatch.setattr(suite, 'MIN_ROUND_TIME', 0)
+        doc = suite.run('[15]', rounds=1)
+        assert set(doc['results']) == {name for name, _ in suite.BENCHMARKS if '[15]' in name}
+        assert all(r['min_s'] > 0 and r['ops'] >= 1 for r in doc['results'].values())
+        assert 0 < doc['results']['method.uranus.process_response[15]']['ops'] <= suite.MAX_URANUS_ANSWERS
+        assert set(doc['meta']) == {'commit', 'python', 'platform', 'timestamp'}
+
+    def test_track_benchmarks_store_every_event(self, monkeypatch):
+        from app.models import InteractionEvent
+        monkeypatch.setattr(suite, 'MIN_ROUND_TIME', 0)
+        with suite.bench_app().app_context():
+            for path in ('orm', 'bulk'):
+                assert suite.bench_track(path, 50)() == 50
+                assert InteractionEvent.query.count() == 50
+        doc = suite.run('track.', rounds=1)
+        assert all(r['ops'] % 50 == 0 for r in doc['results'].values())
+
+    def test_command_line_saves_and_flags_regressions(self, tmp_path, monkeypatch, capsys):
+        monkeypatch.setattr(suite, 'MIN_ROUND_TIME', 0)
+        baseline, output = tmp_path / 'baseline.json', tmp_path / 'out.json'
+        baseline.write_text(json.dumps(_doc(**{'uranus.loop[15]': 1e-12, 'other': 1.0})))
+        args = ['-k', 'uranus.loop[', '--rounds', '1', '--baseline', str(baseline)]
+
+        assert suite.main(args + ['--output', str(output)]) == 1
+        assert 'regression' in capsys.readouterr().out
+        assert set(json.loads(output.read_text())['results']) == {f'uranus.loop[{n}]' for n in suite.CORE_SIZES}
+
+        # A partial --save replaces only the benchmarks that ran
+        assert suite.main(args + ['--save']) == 0
+        saved = json.loads(baseline.read_text())['results']
+        assert saved['other'] == {'min_s': 1.0} and saved['uranus.loop[15]']['min_s'] > 1e-12
@@ -0,0 +1,121 @@
+"""Tests for the /api/track write-behind queue (app/api/event_queue.py)."""
+import time
+import uuid
+
+import pytest
+
+from app import create_app, db
+from app.api import event_queue
+from app.models import Experiment, InteractionEvent, Participant, Session as ExpSession
+from tests.conftest import TestConfig
+
+
+@pytest.fixture
+def queued_app(tmp_path):
+    config = type('QueueConfig', (TestConfig,), {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'queue.db'),
+        'TRACK_QUEUE_ENABLED': True, 'TRACK_QUEUE_MAX_EVENTS': 10,
+        'TRACK_QUEUE_BATCH_SIZE': 4, 'TRACK_QUEUE_FLUSH_INTERVAL': 60.0})
+    app = create_app(config)
+    with app.app_context():
+        exp = Experiment(name='Queue', is_active=True)
+        db.session.add(exp)
+        db.session.flush()
+        participant = Participant(experiment_id=exp.id, uuid=str(uuid.uuid4()), name='Tracker')
+        db.session.add(participant)
+        db.session.flush()
+        exp_session = ExpSession(participant_id=participant.id, experiment_id=exp.id)
+        db.session.add(exp_session)
+        db.session.commit()
+        app.config['TEST_SESSION_ID'] = exp_session.id
+    yield app
+    app.extensions['event_queue'].stop()
+
+
+@pytest.fixture
+def tracking_client(queued_app):
+    client = queued_app.test_client()
+    with client.session_transaction() as sess:
+        sess['exp_session_id'] = queued_app.config['TEST_SESSION_ID']
+    return client
+
+
+def _events(n):
+    return {'events': [{'timestamp': i, 'event_type': 'click'} for i in range(n)]}
+
+
+def _stored(app):
+    with app.app_context():
+        return InteractionEvent.query.count()
+
+
+class TestEventQueue:
+
+    def test_track_answers_202_and_flush_writes(self, queued_app, tracking_client):
+        resp = tracking_client.post('/api/track', json=_events(3))
+        assert resp.status_code == 202
+        assert resp.get_json() == {'status': 'queued', 'count': 3}
+        queue = queued_app.extensions['event_queue']
+        assert queue.flush(timeout=10)
+        assert _stored(queued_app) == 3
+        stats = queue.stats()
+        assert stats['depth'] == 0 and stats['enqueued'] == 3 and stats['written'] == 3
+        assert stats['flushes'] == 1 and stats['last_flush_ms'] is not None
+
+    def test_full_batch_is_written_without_waiting_for_the_interval(self, queued_app, tracking_client):
+        tracking_client.post('/api/track', json=_events(4))
+        deadline = time.monotonic() + 10
+        while _stored(queued_app) < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert _stored(queued_app) == 4
+
+    def test_full_queue_answers_429_with_retry_after(self, queued_app, tracking_client):
+        queue = queued_app.extensions['event_queue']
+        # Hold the writer so the queue fills up
+        with queue._cond:
+            assert tracking_client.post('/api/track', json=_events(3)).status_code == 202
+            assert tracking_client.post('/api/track', json=_events(3)).status_code == 202
+            resp = tracking_client.post('/api/track', json=_events(5))
+            assert resp.status_code == 429
+            assert resp.get_json()['status'] == 'busy'
+            assert int(resp.headers['Retry-After']) >= 1
+        assert queue.flush(timeout=10)
+        assert _stored(queued_app) == 6
+        assert queue.stats()['rejected'] == 5
+
+    def test_stop_flushes_and_refuses_later_events(self, queued_app, tracking_client):
+        queue = queued_app.extensions['event_queue']
+        tracking_client.post('/api/track', json=_events(2))
+        queue.stop(timeout=10)
+        assert _stored(queued_app) == 2
+        assert not queue.stats()['running']
+        assert tracking_client.post('/api/track', json=_events(1)).status_code == 429
+
+    def test_failed_writes_are_retried_then_counted_as_lost(self, queued_app, monkeypatch):
+        queue = event_queue.EventQueue(queued_app, batch_size=2, flush_interval=0.01)
+        calls = []
+
+        def failing(rows):
+            calls.append(len(rows))
+            raise RuntimeError('disk full')
+        monkeypatch.setattr('app.api.ingest.insert_events', failing)
+        session_id = queued_app.config['TEST_SESSION_ID']
+        assert queue.put([(session_id, None, 0.0, 'click', '', '', '', '', '{}')] * 2)
+        assert queue.flush(timeout=10)
+        queue.stop()
+        assert calls == [2] * event_queue.MAX_RETRIES
+        stats = queue.stats()
+        assert stats['write_errors'] == event_queue.MAX_RETRIES and stats['lost'] == 2
+        assert stats['written'] == 0
+
+    def test_stats_endpoint_requires_admin(self, queued_app, tracking_client):
+        assert tracking_client.get('/admin/ingest/stats').status_code == 302
+        with tracking_client.session_transaction() as sess:
+            sess['admin_logged_in'] = True
+        tracking_client.post('/api/track', json=_events(1))
+        stats = tracking_client.get('/admin/ingest/stats').get_json()
+        assert stats['enabled'] and stats['enqueued'] == 1 and stats['capacity'] == 10
+
+    def test_stats_endpoint_without_queue(self, admin_session):
+        stats = admin_session.get('/admin/ingest/stats').get_json()
+        assert stats['enabled'] is False and set(stats) == {'enabled', 'compression'}
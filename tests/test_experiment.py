@@ -148,6 +148,20 @@ class TestMethodFlow:
         resp = client.get(f'/experiment/{exp_id}/between')
         assert resp.status_code == 200
 
+    def test_resubmitted_method_form_stores_nothing(self, client, sample_experiment):
+        from app.models import AssessmentResult
+        exp_id = sample_experiment.id
+        client.post(f'/experiment/{exp_id}/start', data={'name': 'Heidi'})
+        client.post(f'/experiment/{exp_id}/demographics', data={'email': ''})
+        url = client.get(f'/experiment/{exp_id}/run').headers['Location']
+        risks = Risk.query.filter_by(experiment_id=exp_id).all()
+        form = {f'{c}_{r.id}': '3' for c in ('probability', 'impact') for r in risks}
+        first = client.post(url, data=form)
+        second = client.post(url, data=form)  # double submit or back button
+        assert first.status_code == second.status_code == 302
+        assert second.headers['Location'] == first.headers['Location']
+        assert AssessmentResult.query.count() == len(risks)
+
     def test_complete_page(self, client, sample_experiment):
         exp_id = sample_experiment.id
         resp = client.get(f'/experiment/{exp_id}/complete')
@@ -13,7 +13,7 @@ from app.methods.matrix import MatrixMethod
 from app.methods.ranking import RankingMethod
 from app.methods.budget import BudgetMethod
 from app.methods.categorization import CategorizationMethod
-from app.methods.uranus_method import UranusMethod
+from app.methods.uranus_method import UranusMethod, UranusCache, uranus_cache
 
 
 def _create_test_env(db_session, method_type, config=None, num_risks=3):
@@ -152,6 +152,19 @@ class TestMatrixMethod:
             assert result['complete'] is False
             assert 'error' in result
 
+    def test_invalid_value_writes_nothing(self, app, db):
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'matrix')
+            handler = MatrixMethod()
+            valid = {f'{c}_{r.id}': '3' for c in ('probability', 'impact') for r in risks}
+            for key, value in ((f'impact_{risks[2].id}', 'high'), (f'impact_{risks[2].id}', '6'),
+                               (f'probability_{risks[1].id}', '0')):
+                result = handler.process_response({**valid, key: value}, ms, risks)
+                assert result['complete'] is False and 'error' in result
+            db.session.commit()  # nothing pending from the valid risks before the invalid one
+            assert AssessmentResult.query.filter_by(method_session_id=ms.id).count() == 0
+            assert ms.status == 'in_progress'
+
     def test_get_context(self, app, db):
         with app.app_context():
             exp, risks, method, ms = _create_test_env(db.session, 'matrix')
@@ -213,6 +226,19 @@ class TestRankingMethod:
             ars = AssessmentResult.query.filter_by(method_session_id=ms.id).all()
             assert len(ars) == 6  # 3 risks * 2 parameters
 
+    def test_invalid_order_writes_nothing(self, app, db):
+        with app.app_context():
+            config = {'mode': 'per_parameter', 'parameters': ['impact', 'probability']}
+            exp, risks, method, ms = _create_test_env(db.session, 'ranking', config=config)
+            handler = RankingMethod()
+            valid = ','.join(str(r.id) for r in risks)
+            for order in ('1,x,3', f'{risks[0].id},{risks[0].id}', f'{valid},{risks[-1].id + 100}'):
+                result = handler.process_response({'order_impact': valid, 'order_probability': order}, ms, risks)
+                assert result['complete'] is False and 'error' in result
+            db.session.commit()  # nothing pending from the valid first parameter
+            assert AssessmentResult.query.filter_by(method_session_id=ms.id).count() == 0
+            assert ms.status == 'in_progress'
+
     def test_process_response_empty_order(self, app, db):
         with app.app_context():
             exp, risks, method, ms = _create_test_env(db.session, 'ranking')
@@ -405,6 +431,41 @@ class TestCategorizationMethod:
             assert summary['type'] == 'categorization'
             assert len(summary['results']) == 3
 
+    def test_invalid_later_parameter_writes_nothing(self, app, db):
+        with app.app_context():
+            config = {'categories': ['High', 'Low'], 'mode': 'per_parameter',
+                      'parameters': ['impact', 'probability']}
+            exp, risks, method, ms = _create_test_env(db.session, 'categorization', config=config)
+            form = {f'category_impact_{r.id}': 'High' for r in risks}
+            form[f'category_probability_{risks[0].id}'] = 'High'
+            result = CategorizationMethod().process_response(form, ms, risks)
+            assert result['complete'] is False
+            db.session.commit()  # nothing pending from the valid first parameter
+            assert AssessmentResult.query.filter_by(method_session_id=ms.id).count() == 0
+            assert ms.status == 'in_progress'
+
+    def test_results_written_in_one_insert(self, app, db):
+        from sqlalchemy import event
+        with app.app_context():
+            config = {'categories': ['High', 'Low'], 'mode': 'per_parameter',
+                      'parameters': ['impact', 'probability', 'detectability']}
+            exp, risks, method, ms = _create_test_env(db.session, 'categorization', config=config, num_risks=20)
+            form = {f'category_{p}_{r.id}': 'Low' for p in config['parameters'] for r in risks}
+            inserts = []
+
+            def count(conn, cursor, statement, parameters, context, executemany):
+                if statement.startswith('INSERT INTO assessment_result'):
+                    inserts.append(len(parameters) if executemany else 1)
+
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                CategorizationMethod().process_response(form, ms, risks)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+            assert inserts == [60]
+            data = AssessmentResult.query.filter_by(method_session_id=ms.id).first().get_result_data()
+            assert set(data) == {'category', 'parameter', 'timestamp'}
+
 
 # ========== Uranus Method ==========
 
@@ -509,3 +570,255 @@ class TestUranusMethod:
             handler = UranusMethod()
             summary = handler.get_results_summary(ms, risks)
             assert summary['type'] == 'in_progress'
+
+    def test_cache_reuses_live_instance(self, app, db):
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=5)
+            handler = UranusMethod()
+            uranus_cache.clear()
+            handler.get_context(ms, risks)
+            u1 = handler._get_or_create_uranus(ms, risks)
+            handler._save_state(ms, u1)
+            u2 = handler._get_or_create_uranus(ms, risks)
+            assert u2 is u1
+
+    def test_cache_detects_stale_row(self, app, db):
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=5)
+            handler = UranusMethod()
+            uranus_cache.clear()
+            ctx = handler.get_context(ms, risks)
+            handler.process_response({'choice': '0', 'a': str(ctx['a']), 'b': str(ctx['b']), 'c': str(ctx['c'])},
+                                     ms, risks)
+            cached = handler._get_or_create_uranus(ms, risks)
+            handler._save_state(ms, cached)
+            # Another worker answers the next comparison and rewrites the row
+            other = handler._restore_state(ms.get_uranus_state(), ['impact', 'probability'],
+                                           [r.name for r in risks])
+            other.next_to_process()
+            other.set_priority(1)
+            ms.set_uranus_state(handler._serialize_state(other))
+            db.session.commit()
+            u = handler._get_or_create_uranus(ms, risks)
+            assert u is not cached
+            assert u.num_comparisons == 2
+            assert [list(p) for p in u.prioritized] == [list(p) for p in other.prioritized]
+
+    def test_cache_checkout_removes_entry(self, app, db):
+        cache = UranusCache(capacity=2)
+        cache.put(1, 'a', 'u1')
+        assert cache.checkout(1, 'a') == 'u1'
+        assert cache.checkout(1, 'a') is None
+
+    def test_cache_evicts_least_recently_used(self, app, db):
+        cache = UranusCache(capacity=2)
+        cache.put(1, 'a', 'u1')
+        cache.put(2, 'b', 'u2')
+        cache.put(3, 'c', 'u3')
+        assert len(cache) == 2
+        assert cache.checkout(1, 'a') is None
+        assert cache.checkout(2, 'b') == 'u2'
+        assert cache.checkout(3, 'x') is None  # stale stamp
+
+    def test_get_context_writes_nothing(self, app, db):
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=5)
+            handler = UranusMethod()
+            ctx = handler.get_context(ms, risks)
+            assert ms.uranus_state is None
+            assert not db.session.dirty
+            form = {'choice': '1', 'a': str(ctx['a']), 'b': str(ctx['b']), 'c': str(ctx['c'])}
+            handler.process_response(form, ms, risks)
+            state = ms.uranus_state
+            ctx2 = handler.get_context(ms, risks)
+            assert handler.get_context(ms, risks) == ctx2  # refreshing shows the same comparison
+            assert ms.uranus_state == state
+            assert not db.session.dirty
+
+    def test_resubmitted_answer_writes_nothing(self, app, db):
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=5)
+            handler = UranusMethod()
+            ctx = handler.get_context(ms, risks)
+            form = {'choice': '1', 'a': str(ctx['a']), 'b': str(ctx['b']), 'c': str(ctx['c'])}
+            handler.process_response(form, ms, risks)
+            state = ms.uranus_state
+            pending = handler.get_context(ms, risks)['current']
+            result = handler.process_response(form, ms, risks)  # double submit / back button
+            assert not result['complete'] and result['context']['current'] == pending
+            assert AssessmentResult.query.filter_by(method_session_id=ms.id).count() == 1
+            assert ms.uranus_state == state
+
+    def test_malformed_answer_is_rejected(self, app, db):
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=5)
+            handler = UranusMethod()
+            ctx = handler.get_context(ms, risks)
+            for form in ({'choice': 'x', 'a': str(ctx['a']), 'b': str(ctx['b']), 'c': str(ctx['c'])},
+                         {'choice': '2', 'a': str(ctx['a']), 'b': str(ctx['b']), 'c': str(ctx['c'])},
+                         {'choice': '1', 'a': str(ctx['a'])}):
+                assert 'error' in handler.process_response(form, ms, risks)
+            assert AssessmentResult.query.filter_by(method_session_id=ms.id).count() == 0
+            assert ms.uranus_state is None
+
+    def test_get_context_prefetches_both_answers(self, app, db):
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=6)
+            handler = UranusMethod()
+            for choice in ['1', '0', '0', '1', '1']:
+                ctx = handler.get_context(ms, risks)
+                predicted = ctx['prefetch'][choice]
+                form = {'choice': choice, 'a': str(ctx['a']), 'b': str(ctx['b']), 'c': str(ctx['c'])}
+                handler.process_response(form, ms, risks)
+                ctx = handler.get_context(ms, risks)
+                assert ctx['current'] == predicted
+
+    def test_top_k_flow(self, app, db):
+        with app.app_context():
+            config = {'parameters': ['impact'], 'top_k': 2}
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', config=config, num_risks=8)
+            handler = UranusMethod()
+            truth = [[3, 0, 6, 1, 7, 5, 2, 4]]
+            self._run_to_completion(handler, ms, risks, truth, uncached=True)
+            assert ms.status == 'completed'
+            ranking = AssessmentResult.query.filter_by(method_session_id=ms.id, risk_id=None).all()
+            data = [r.get_result_data() for r in ranking if r.get_result_data().get('type') == 'final_ranking'][0]
+            assert data['top_k'] == 2
+            assert data['prioritized'] == [[2, 4]]
+            assert data['ranking'][:2] == [4, 2]
+
+    def test_top_k_ignores_invalid_config(self, app, db):
+        assert UranusMethod._top_k({'top_k': 0}) is None
+        assert UranusMethod._top_k({'top_k': '3'}) is None
+        assert UranusMethod._top_k({'top_k': True}) is None
+        assert UranusMethod._top_k({'top_k': 3}) == 3
+
+    def test_ford_johnson_scheduler_flow(self, app, db):
+        with app.app_context():
+            config = {'parameters': ['impact', 'probability'], 'scheduler': 'ford_johnson', 'top_k': 2}
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', config=config, num_risks=6)
+            handler = UranusMethod()
+            truth = [[3, 0, 5, 1, 4, 2], [1, 2, 0, 5, 3, 4]]
+            state = self._run_to_completion(handler, ms, risks, truth, uncached=True)
+            assert ms.status == 'completed'
+            assert state['scheduler'] == 'ford_johnson'
+            assert state['top_k'] is None  # top_k only applies to the binary scheduler
+            assert state['prioritized'] == truth
+            assert state['num_comparisons'] <= 2 * 10
+
+    def test_ford_johnson_single_risk_batch(self, app, db):
+        with app.app_context():
+            config = {'parameters': ['impact', 'probability'], 'scheduler': 'ford_johnson'}
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', config=config, num_risks=1)
+            handler = UranusMethod()
+            uranus_cache.clear()
+            result = handler.process_batch([], 0, ms, risks)
+            assert result['progress'] == 100 and result['next'] is None
+            assert handler.get_context(ms, risks) == {'done': True, 'progress': 100}
+
+    def test_ford_johnson_two_risks_batch(self, app, db):
+        with app.app_context():
+            config = {'parameters': ['impact', 'probability'], 'scheduler': 'ford_johnson'}
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', config=config, num_risks=2)
+            handler = UranusMethod()
+            uranus_cache.clear()
+            ctx = handler.get_context(ms, risks)
+            pending, version, progress = ctx['current'], ctx['version'], []
+            while pending is not None:
+                answer = {'a': pending['a'], 'b': pending['b'], 'c': pending['c'], 'choice': 1}
+                result = handler.process_batch([answer], version, ms, risks)
+                assert result['applied'] == 1
+                pending, version = result['next'], result['version']
+                progress.append(result['progress'])
+            assert progress == [50, 100]
+            assert ms.status == 'completed'
+            assert ms.get_uranus_state()['prioritized'] == [[1, 0], [1, 0]]
+
+    def test_scheduler_ignores_unknown_config(self, app, db):
+        handler = UranusMethod()
+        assert handler._scheduler({}) == 'binary'
+        assert handler._scheduler({'scheduler': 'quick'}) == 'binary'
+        assert handler._scheduler({'scheduler': ['ford_johnson']}) == 'binary'
+        assert handler._scheduler({'scheduler': 'ford_johnson'}) == 'ford_johnson'
+
+    @staticmethod
+    def _completed_method(db_session, ms, method_type, config, rows):
+        """Add a completed method session of another type, with one result per (risk, data) row."""
+        m = Method(experiment_id=ms.method.experiment_id, method_type=method_type, display_name=method_type,
+                   config=json.dumps(config), is_active=True, order=1)
+        db_session.add(m)
+        db_session.flush()
+        earlier = MethodSession(session_id=ms.session_id, method_id=m.id, order=1, status='completed')
+        db_session.add(earlier)
+        db_session.flush()
+        for risk, data in rows:
+            result = AssessmentResult(method_session_id=earlier.id, risk_id=risk.id)
+            result.set_result_data(data)
+            db_session.add(result)
+        db_session.commit()
+        return earlier
+
+    def _run_to_completion(self, handler, ms, risks, truth, uncached=False):
+        """Answer every comparison from `truth` (least to most important, per parameter).
+
+        With `uncached`, every step goes through the serialized state instead of the Uranus cache.
+        """
+        if uncached:
+            uranus_cache.clear()
+        for _ in range(200):
+            ctx = handler.get_context(ms, risks)
+            if ctx.get('done'):
+                break
+            if uncached:
+                uranus_cache.clear()
+            choice = 1 if truth[ctx['c']].index(ctx['a']) > truth[ctx['c']].index(ctx['b']) else 0
+            handler.process_response({'choice': str(choice), 'a': str(ctx['a']), 'b': str(ctx['b']),
+                                      'c': str(ctx['c'])}, ms, risks)
+        return ms.get_uranus_state()
+
+    def test_warm_start_from_ranking(self, app, db):
+        with app.app_context():
+            truth = [[4, 0, 7, 2, 9, 5, 1, 8, 3, 6]]
+            config = {'parameters': ['impact'], 'warm_start_from': 'ranking'}
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', config=config, num_risks=10)
+            # Ranking: rank 1 is the most important risk
+            self._completed_method(db.session, ms, 'ranking', {'mode': 'overall'},
+                                   [(risks[e], {'rank': 10 - i, 'parameter': 'overall'})
+                                    for i, e in enumerate(truth[0])])
+            handler = UranusMethod()
+            uranus_cache.clear()
+            state = self._run_to_completion(handler, ms, risks, truth)
+            assert state['prior'] == [[truth[0].index(e) for e in range(10)]]
+            assert state['prioritized'] == truth
+            assert state['num_comparisons'] <= 2 * 9
+
+            exp, risks, method, cold = _create_test_env(db.session, 'uranus', config={'parameters': ['impact']},
+                                                        num_risks=10)
+            assert self._run_to_completion(handler, cold, risks, truth)['num_comparisons'] > state['num_comparisons']
+
+    def test_warm_start_without_earlier_results(self, app, db):
+        with app.app_context():
+            config = {'parameters': ['impact'], 'warm_start_from': ['matrix', 'categorization']}
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', config=config, num_risks=4)
+            handler = UranusMethod()
+            assert handler._warm_start_prior(ms, risks, ['impact'], config) is None
+
+    def test_warm_start_prior_scores(self, app, db):
+        with app.app_context():
+            config = {'parameters': ['impact', 'probability'], 'warm_start_from': ['matrix', 'categorization']}
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', config=config, num_risks=3)
+            self._completed_method(db.session, ms, 'categorization', {'categories': ['High', 'Low']},
+                                   [(risks[0], {'category': 'Low', 'parameter': 'overall'}),
+                                    (risks[1], {'category': 'High', 'parameter': 'overall'}),
+                                    (risks[2], {'category': 'Low', 'parameter': 'overall'})])
+            handler = UranusMethod()
+            # Categories rank equal risks equally; matrix (listed first) is not in this session
+            assert handler._warm_start_prior(ms, risks, ['impact', 'probability'], config) == [[0, 1, 0], [0, 1, 0]]
+            matrix = self._completed_method(
+                db.session, ms, 'matrix', {},
+                [(risks[0], {'criteria_values': {'impact': 5, 'probability': 1}, 'priority': 5}),
+                 (risks[1], {'criteria_values': {'impact': 2, 'probability': 2}, 'priority': 4}),
+                 (risks[2], {'criteria_values': {'impact': 1, 'probability': 4}, 'priority': 4})])
+            assert handler._warm_start_prior(ms, risks, ['impact', 'probability'], config) == [[2, 1, 0], [0, 1, 2]]
+            assert MatrixMethod().get_prior_scores(matrix, risks, 'other') == {risks[0].id: 5, risks[1].id: 4,
+                                                                                risks[2].id: 4}
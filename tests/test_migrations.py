@@ -0,0 +1,87 @@
+"""Tests for the versioned migration runner (app/migrations.py)."""
+import pytest
+from sqlalchemy import text
+
+from app import migrations, result_tables
+from app.methods.ranking import RankingMethod
+from app.models import RankPosition, SchemaVersion
+from tests.test_methods import _create_test_env
+
+
+def _make_legacy(db):
+    """Turn the test database into one created before the migrations: no indexes, no schema_version rows."""
+    for index, _, _ in migrations.HOT_PATH_INDEXES:
+        db.session.execute(text(f'DROP INDEX IF EXISTS {index}'))
+    SchemaVersion.query.delete()
+    db.session.commit()
+
+
+class TestUpgrade:
+
+    def test_fresh_database_records_every_migration_once(self, app, db):
+        with app.app_context():
+            SchemaVersion.query.delete()
+            db.session.commit()
+            assert migrations.upgrade() == [version for version, _, _ in migrations.MIGRATIONS]
+            assert migrations.upgrade() == []
+            assert sorted(migrations.applied_versions()) == [version for version, _, _ in migrations.MIGRATIONS]
+            assert migrations.verify()['pending'] == []
+
+    def test_adds_indexes_to_an_existing_database(self, app, db):
+        with app.app_context():
+            _make_legacy(db)
+            report = migrations.verify()
+            assert report['pending'] == [1, 2]
+            assert ('interaction_event', 'ix_interaction_event_session_timestamp') in report['missing']
+            assert migrations.full_scan(report['plans']['events of a session'])
+
+            assert migrations.upgrade(target=1) == [1]
+            assert migrations.upgrade() == [2]
+            report = migrations.verify()
+            assert report['pending'] == [] and report['missing'] == []
+            for name, plan in report['plans'].items():
+                assert not migrations.full_scan(plan), (name, plan)
+
+    def test_backfills_typed_result_tables(self, app, db):
+        with app.app_context():
+            _, risks, _, ms = _create_test_env(db.session, 'ranking')
+            RankingMethod().process_response({'order_overall': ','.join(str(r.id) for r in risks)}, ms, risks)
+            for model in result_tables._models():
+                model.query.delete()
+            _make_legacy(db)
+            migrations.upgrade()
+            assert RankPosition.query.filter_by(method_session_id=ms.id).count() == 3
+
+    def test_failed_migration_is_rolled_back(self, app, db, monkeypatch):
+        with app.app_context():
+            _make_legacy(db)
+            _create_test_env(db.session, 'ranking')
+
+            def broken():
+                db.session.execute(text("UPDATE risk SET name = 'changed'"))
+                raise RuntimeError('boom')
+            monkeypatch.setattr(migrations, 'MIGRATIONS', [(1, 'broken', broken)])
+            with pytest.raises(RuntimeError):
+                migrations.upgrade()
+            assert migrations.applied_versions() == {}
+            assert [name for (name,) in db.session.execute(text('SELECT name FROM risk'))] == [
+                'Risk A', 'Risk B', 'Risk C']
+
+
+class TestCommandLine:
+
+    def test_verify_and_upgrade(self, app, db, monkeypatch, capsys):
+        with app.app_context():
+            _make_legacy(db)
+        monkeypatch.setattr('app.create_app', lambda config, migrate=True: app)
+        assert migrations.main(['verify']) == 1
+        out = capsys.readouterr().out
+        assert 'missing index ix_participant_experiment_name on participant' in out
+        assert 'FULL SCAN' in out and out.strip().endswith('problems found')
+
+        assert migrations.main(['upgrade']) == 0
+        assert capsys.readouterr().out.strip() == 'applied 2 migration(s): 1, 2'
+        assert migrations.main(['status']) == 0
+        assert 'pending' not in capsys.readouterr().out
+        assert migrations.main(['verify']) == 0
+        assert capsys.readouterr().out.strip().endswith('ok')
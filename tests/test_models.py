@@ -194,6 +194,100 @@ class TestMethodSessionModel:
             db.session.commit()
             assert ms.get_uranus_state() is None
 
+    def _method_session(self, db):
+        exp = Experiment(name='Test')
+        db.session.add(exp)
+        db.session.flush()
+        m = Method(experiment_id=exp.id, method_type='uranus', display_name='U', config='{}')
+        db.session.add(m)
+        db.session.flush()
+        p = Participant(experiment_id=exp.id, uuid=str(uuid.uuid4()), name='Jan')
+        db.session.add(p)
+        db.session.flush()
+        s = ExpSession(participant_id=p.id, experiment_id=exp.id)
+        db.session.add(s)
+        db.session.flush()
+        ms = MethodSession(session_id=s.id, method_id=m.id, order=0)
+        db.session.add(ms)
+        db.session.flush()
+        return ms
+
+    def test_uranus_state_compact_codec(self, app, db):
+        with app.app_context():
+            ms = self._method_session(db)
+            state = {
+                'p_names': ['impact', 'probability'],
+                'e_names': [f'Risk number {i} with a long description' for i in range(200)],
+                'num_parameters': 2, 'num_elements': 200, 'num_comparisons': 1234,
+                'prioritized': [list(range(199, -1, -1)), list(range(150))],
+                'next_elem': 150, 'next_parameter': 1, 'next_range': list(range(38, 75)),
+                'final_list': [],
+            }
+            ms.set_uranus_state(state)
+            db.session.commit()
+            assert ms.uranus_state.startswith('u2:')
+            assert len(ms.uranus_state) < 1000
+            recovered = ms.get_uranus_state()
+            assert 'p_names' not in recovered and 'e_names' not in recovered
+            for key in ('num_parameters', 'num_elements', 'num_comparisons', 'prioritized',
+                        'next_elem', 'next_parameter', 'next_range', 'final_list'):
+                assert recovered[key] == state[key]
+
+    def test_uranus_state_codec_keeps_binary_options(self, app, db):
+        with app.app_context():
+            ms = self._method_session(db)
+            state = {
+                'num_parameters': 2, 'num_elements': 6, 'num_comparisons': 9,
+                'prioritized': [[4, 1], [0, 5]], 'next_elem': 3, 'next_parameter': 0, 'next_range': [4],
+                'final_list': [], 'top_k': 2, 'below_cut': [[0, 2], [1]],
+                'scheduler': 'binary', 'scheduler_state': None, 'prior': [[3, 0, 1, 2, 5, 4], None], 'next_gallop': -2,
+                'risk_fingerprint': 3735928559,
+            }
+            ms.set_uranus_state(state)
+            db.session.commit()
+            assert ms.get_uranus_state() == state
+
+    def test_uranus_state_codec_keeps_scheduler_state(self, app, db):
+        with app.app_context():
+            ms = self._method_session(db)
+            state = {
+                'num_parameters': 2, 'num_elements': 5, 'num_comparisons': 4,
+                'prioritized': [[], []], 'next_elem': 2, 'next_parameter': 0, 'next_range': [],
+                'final_list': [], 'top_k': None, 'below_cut': [[], []],
+                'scheduler': 'ford_johnson', 'scheduler_state': [[1, 0], [0, 0]], 'prior': None, 'next_gallop': 0,
+                'risk_fingerprint': None,
+            }
+            ms.set_uranus_state(state)
+            db.session.commit()
+            assert ms.uranus_state.startswith('u2:')
+            assert ms.get_uranus_state() == state
+
+    def test_uranus_state_reads_version_1_codec(self, app, db):
+        with app.app_context():
+            ms = self._method_session(db)
+            ms.uranus_state = 'u1:AQMCAgEBAgIAAQIA'
+            recovered = ms.get_uranus_state()
+            assert recovered['prioritized'] == [[2, 0]]
+            assert recovered['next_range'] == [2, 0]
+            assert 'top_k' not in recovered and 'scheduler' not in recovered
+
+    def test_uranus_state_reads_legacy_json(self, app, db):
+        with app.app_context():
+            ms = self._method_session(db)
+            ms.uranus_state = json.dumps({'p_names': ['impact'], 'e_names': ['A', 'B'], 'num_parameters': 1,
+                                          'num_elements': 2, 'num_comparisons': 0, 'prioritized': [[0]],
+                                          'next_elem': 1, 'next_parameter': 0, 'next_range': [0]})
+            db.session.commit()
+            recovered = ms.get_uranus_state()
+            assert recovered['e_names'] == ['A', 'B']
+            assert recovered['next_range'] == [0]
+
+    def test_uranus_state_corrupt_codec(self, app, db):
+        with app.app_context():
+            ms = self._method_session(db)
+            ms.uranus_state = 'u1:AAE'
+            assert ms.get_uranus_state() is None
+
 
 class TestAssessmentResultModel:
 
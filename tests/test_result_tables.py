@@ -0,0 +1,203 @@
+"""Tests for the typed result tables (app/result_tables.py)."""
+from app import result_tables
+from app.methods.budget import BudgetMethod
+from app.methods.categorization import CategorizationMethod
+from app.methods.matrix import MatrixMethod
+from app.methods.ranking import RankingMethod
+from app.methods.uranus_method import UranusMethod
+from app.models import (MethodSession, PairwiseComparison, RankPosition, CriterionValue, MatrixScore,
+                        BudgetAllocation, CategoryAssignment)
+from tests.test_methods import _create_test_env
+from tests.test_uranus_replay import _answer_all, _truth
+
+
+def _second_session(db, ms):
+    other = MethodSession(session_id=ms.session_id, method_id=ms.method_id, order=1, status='in_progress')
+    db.session.add(other)
+    db.session.commit()
+    return other
+
+
+def _typed(ms):
+    return {model.__tablename__: model.query.filter_by(method_session_id=ms.id).count()
+            for model in result_tables._models()}
+
+
+class TestLiveWrites:
+
+    def test_matrix(self, app, db):
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'matrix')
+            form = {}
+            for i, r in enumerate(risks):
+                form[f'probability_{r.id}'] = str(i + 1)
+                form[f'impact_{r.id}'] = '4'
+            MatrixMethod().process_response(form, ms, risks)
+            values = {(v.risk_id, v.criterion): v.value for v in CriterionValue.query.all()}
+            assert values[(risks[2].id, 'probability')] == 3 and values[(risks[2].id, 'impact')] == 4
+            assert {s.risk_id: s.priority for s in MatrixScore.query.all()} == {
+                r.id: (i + 1) * 4 for i, r in enumerate(risks)}
+
+    def test_ranking_budget_categorization(self, app, db):
+        with app.app_context():
+            _, risks, _, ms = _create_test_env(db.session, 'ranking')
+            RankingMethod().process_response({'order_overall': ','.join(str(r.id) for r in reversed(risks))},
+                                             ms, risks)
+            assert [(p.risk_id, p.rank) for p in RankPosition.query.order_by(RankPosition.rank)] == [
+                (r.id, i) for i, r in enumerate(reversed(risks), 1)]
+
+            _, risks, _, ms = _create_test_env(db.session, 'budget')
+            BudgetMethod().process_response({f'points_overall_{r.id}': p for r, p in zip(risks, ['50', '30', '20'])},
+                                            ms, risks)
+            assert sorted(a.points for a in BudgetAllocation.query.filter_by(method_session_id=ms.id)) == [20, 30, 50]
+
+            _, risks, _, ms = _create_test_env(db.session, 'categorization')
+            CategorizationMethod().process_response(
+                {f'category_overall_{r.id}': c for r, c in zip(risks, ['Critical', 'High', 'Low'])}, ms, risks)
+            assert {a.risk_id: a.category for a in CategoryAssignment.query.all()}[risks[1].id] == 'High'
+
+    def test_uranus_comparisons_and_final_ranking(self, app, db):
+        with app.app_context():
+            _, risks, _, ms = _create_test_env(db.session, 'uranus', num_risks=5)
+            _answer_all(UranusMethod(), ms, risks, _truth(5))
+            comparisons = PairwiseComparison.query.filter_by(method_session_id=ms.id).order_by(
+                PairwiseComparison.step).all()
+            assert [c.step for c in comparisons] == list(range(len(comparisons)))
+            for c in comparisons:
+                assert c.higher_risk_id == (c.risk_a_id if c.choice == 1 else c.risk_b_id)
+            summary = UranusMethod().get_results_summary(ms, risks)
+            positions = [p.risk_id for p in RankPosition.query.filter_by(method_session_id=ms.id)
+                         .order_by(RankPosition.rank)]
+            assert positions == [risks[r['risk_index']].id for r in summary['ranking']]
+            assert len(positions) == len(risks)
+
+
+class TestBackfill:
+
+    def test_backfill_rebuilds_and_is_idempotent(self, app, db):
+        with app.app_context():
+            exp, risks, _, ms = _create_test_env(db.session, 'uranus', num_risks=4)
+            _answer_all(UranusMethod(), ms, risks, _truth(4))
+            expected = _typed(ms)
+            assert expected['pairwise_comparison'] > 0 and expected['rank_position'] == 4
+
+            # A database from before the typed tables: results only
+            for model in result_tables._models():
+                model.query.delete()
+            db.session.commit()
+            assert result_tables.backfill() == (1, sum(expected.values()))
+            assert _typed(ms) == expected
+            assert result_tables.backfill([exp.id]) == (1, sum(expected.values()))
+            assert _typed(ms) == expected
+            assert result_tables.backfill([exp.id + 1]) == (0, 0)
+
+    def test_typed_rows_are_deleted_with_the_session(self, app, db):
+        with app.app_context():
+            _, risks, _, ms = _create_test_env(db.session, 'budget')
+            BudgetMethod().process_response({f'points_overall_{r.id}': p for r, p in zip(risks, ['50', '30', '20'])},
+                                            ms, risks)
+            db.session.delete(ms)
+            db.session.commit()
+            assert BudgetAllocation.query.count() == 0
+
+    def test_command_line(self, app, db, monkeypatch, capsys):
+        with app.app_context():
+            _, risks, _, ms = _create_test_env(db.session, 'ranking')
+            RankingMethod().process_response({'order_overall': ','.join(str(r.id) for r in risks)}, ms, risks)
+        monkeypatch.setattr('app.create_app', lambda config: app)
+        assert result_tables.main([]) == 0
+        assert capsys.readouterr().out.strip() == '3 typed rows written for 1 method sessions'
+
+
+class TestAggregate:
+
+    def test_ranking(self, app, db):
+        with app.app_context():
+            _, risks, method, ms = _create_test_env(db.session, 'ranking')
+            other = _second_session(db, ms)
+            RankingMethod().process_response({'order_overall': ','.join(str(r.id) for r in risks)}, ms, risks)
+            RankingMethod().process_response({'order_overall': ','.join(str(r.id) for r in reversed(risks))},
+                                             other, risks)
+            table = result_tables.aggregate(method)
+            assert table['columns'] == ['risk_id', 'parameter', 'participants', 'mean rank', 'best rank',
+                                        'worst rank']
+            assert table['rows'][0] == [risks[0].id, 'overall', 2, 2.0, 1, 3]
+            assert table['rows'][1] == [risks[1].id, 'overall', 2, 2.0, 2, 2]
+
+    def test_only_completed_sessions_count(self, app, db):
+        with app.app_context():
+            _, risks, method, ms = _create_test_env(db.session, 'budget')
+            BudgetMethod().process_response({f'points_overall_{r.id}': p for r, p in zip(risks, ['50', '30', '20'])},
+                                            ms, risks)
+            other = _second_session(db, ms)
+            BudgetMethod().process_response({f'points_overall_{r.id}': p for r, p in zip(risks, ['10', '10', '80'])},
+                                            other, risks)
+            other.status = 'in_progress'
+            db.session.commit()
+            rows = result_tables.aggregate(method)['rows']
+            assert [row[2:] for row in rows] == [[1, 50, 50.0], [1, 30, 30.0], [1, 20, 20.0]]
+
+    def test_matrix_and_categorization(self, app, db):
+        with app.app_context():
+            _, risks, method, ms = _create_test_env(db.session, 'matrix')
+            other = _second_session(db, ms)
+            for session, probability in ((ms, '2'), (other, '4')):
+                MatrixMethod().process_response({**{f'probability_{r.id}': probability for r in risks},
+                                                 **{f'impact_{r.id}': '3' for r in risks}}, session, risks)
+            table = result_tables.aggregate(method)
+            assert table['columns'][-2:] == ['mean impact', 'mean probability']
+            assert table['rows'][0][2:] == [2, 9.0, 6.0, 12.0, 3.0, 3.0]
+
+            _, risks, method, ms = _create_test_env(db.session, 'categorization')
+            CategorizationMethod().process_response(
+                {f'category_overall_{r.id}': c for r, c in zip(risks, ['Critical', 'High', 'Critical'])}, ms, risks)
+            table = result_tables.aggregate(method)
+            assert table['columns'][2:] == ['participants', 'Critical', 'High', 'Medium', 'Low', 'Negligible']
+            assert table['rows'][1][2:] == [1, 0, 1, 0, 0, 0]
+
+    def test_uranus_win_rate(self, app, db):
+        with app.app_context():
+            _, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=4)
+            truth = [[2, 0, 3, 1], [2, 0, 3, 1]]  # least to most important, for both parameters
+            _answer_all(UranusMethod(), ms, risks, truth)
+            rows = {row[0]: row for row in result_tables.aggregate(method)['rows']}
+            assert rows[risks[1].id][3] == 1.0 and rows[risks[1].id][-1] == 1.0
+            assert rows[risks[2].id][3] == 4.0 and rows[risks[2].id][-1] == 0.0
+
+    def test_uranus_final_ranking_is_written_once(self, app, db):
+        from app.models import AssessmentResult
+        with app.app_context():
+            _, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=4)
+            handler = UranusMethod()
+            _answer_all(handler, ms, risks, _truth(4))
+            assert ms.status == 'completed'
+            # A late save of the finished instance (e.g. a request that raced the last answer)
+            handler._save_and_finish(ms, handler._get_or_create_uranus(ms, risks))
+            db.session.commit()
+            finals = [r for r in AssessmentResult.query.filter_by(method_session_id=ms.id, risk_id=None)
+                      if r.get_result_data().get('type') == 'final_ranking']
+            assert len(finals) == 1
+            assert RankPosition.query.filter_by(method_session_id=ms.id).count() == 4
+            assert {row[2] for row in result_tables.aggregate(method)['rows']} == {1}
+
+    def test_uranus_top_k_ties_the_risks_below_the_cut(self, app, db):
+        with app.app_context():
+            config = {'parameters': ['impact'], 'top_k': 2}
+            _, risks, method, ms = _create_test_env(db.session, 'uranus', config=config, num_risks=5)
+            other = _second_session(db, ms)
+            truth = [[3, 0, 1, 4, 2]]  # least to most important
+            for session in (ms, other):
+                _answer_all(UranusMethod(), session, risks, truth)
+            rows = {row[0]: row for row in result_tables.aggregate(method)['rows']}
+            assert [rows[risks[i].id][3] for i in (2, 4)] == [1.0, 2.0]
+            assert [rows[risks[i].id][3:6] for i in (0, 1, 3)] == [[3.0, 3, 3]] * 3
+            summary = UranusMethod().get_results_summary(ms, risks)
+            assert [r['rank'] for r in summary['ranking']] == [1, 2, 3, 3, 3]
+
+    def test_admin_results_page(self, app, db, admin_session):
+        with app.app_context():
+            exp, risks, _, ms = _create_test_env(db.session, 'ranking')
+            RankingMethod().process_response({'order_overall': ','.join(str(r.id) for r in risks)}, ms, risks)
+            response = admin_session.get(f'/admin/experiment/{exp.id}/results')
+            assert response.status_code == 200
+            assert b'across participants' in response.data and b'mean rank' in response.data
@@ -0,0 +1,217 @@
+"""Tests for the /api/track segment log and its compactor (app/api/segment_log.py)."""
+import os
+import threading
+import uuid
+
+import pytest
+
+from app import create_app, db
+from app.api import segment_log
+from app.api.segment_log import SegmentLog
+from app.models import Experiment, InteractionEvent, Participant, SegmentOffset, Session as ExpSession
+from tests.conftest import TestConfig
+
+
+def _rows(n, session_id=1, start=0):
+    return [(session_id, None, float(start + i), 'click', '', '', '', '', '{}') for i in range(n)]
+
+
+def _files(directory, suffix):
+    return sorted(name for name in os.listdir(directory) if name.endswith(suffix))
+
+
+@pytest.fixture
+def segment_app(tmp_path):
+    config = type('SegmentConfig', (TestConfig,), {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'segments.db'),
+        'TRACK_SEGMENT_DIR': str(tmp_path / 'segments'), 'TRACK_SEGMENT_MAX_AGE': 3600.0})
+    app = create_app(config)
+    with app.app_context():
+        exp = Experiment(name='Segments', is_active=True)
+        db.session.add(exp)
+        db.session.flush()
+        participant = Participant(experiment_id=exp.id, uuid=str(uuid.uuid4()), name='Tracker')
+        db.session.add(participant)
+        db.session.flush()
+        exp_session = ExpSession(participant_id=participant.id, experiment_id=exp.id)
+        db.session.add(exp_session)
+        db.session.commit()
+        app.config['TEST_SESSION_ID'] = exp_session.id
+    yield app
+    app.extensions['segment_log'].close()
+
+
+def _stored(app):
+    with app.app_context():
+        return InteractionEvent.query.count()
+
+
+class TestSegmentLog:
+
+    def test_records_round_trip_and_torn_tail_is_ignored(self, tmp_path):
+        log = SegmentLog(str(tmp_path), max_bytes=1 << 20)
+        log.append(_rows(2))
+        log.append(_rows(3, start=2))
+        log.close()
+        (name,) = _files(tmp_path, segment_log.SEALED)
+        path = str(tmp_path / name)
+        with open(path, 'ab') as f:
+            f.write(segment_log.encode_record(_rows(1))[:-3])  # a record cut short by a crash
+        records = list(segment_log.read_records(path))
+        assert [len(rows) for _, rows in records] == [2, 3]
+        assert records[1][1][0] == (1, None, 2.0, 'click', '', '', '', '', '{}')
+        assert records[-1][0] < os.path.getsize(path)
+
+    def test_segments_are_sealed_by_size_and_on_close(self, tmp_path):
+        log = SegmentLog(str(tmp_path), max_bytes=50)  # every record fills a segment
+        for i in range(3):
+            log.append(_rows(2, start=i))
+        assert len(_files(tmp_path, segment_log.SEALED)) == 3
+        log.append(_rows(1))
+        assert len(_files(tmp_path, segment_log.OPEN)) == 1
+        log.close()
+        assert _files(tmp_path, segment_log.OPEN) == []
+        assert log.stats()['sealed'] == 4 and not log.append(_rows(1))
+
+    def test_track_appends_and_compactor_loads_once(self, segment_app):
+        client = segment_app.test_client()
+        with client.session_transaction() as sess:
+            sess['exp_session_id'] = segment_app.config['TEST_SESSION_ID']
+        resp = client.post('/api/track', json={'events': [{'event_type': 'click'}, {'event_type': 'scroll'}]})
+        assert resp.status_code == 202 and resp.get_json()['count'] == 2
+        assert _stored(segment_app) == 0
+        with client.session_transaction() as sess:
+            sess['admin_logged_in'] = True
+        stats = client.get('/admin/ingest/stats').get_json()['segments']
+        assert stats['batches'] == 1 and stats['events'] == 2 and stats['open_bytes'] > 0
+
+        log = segment_app.extensions['segment_log']
+        log.close()
+        with segment_app.app_context():
+            assert segment_log.compact(log.directory) == (1, 2)
+            assert segment_log.compact(log.directory) == (0, 0)
+            (state,) = SegmentOffset.query.all()
+            assert state.completed and state.events == 2
+            assert [e.event_type for e in InteractionEvent.query.order_by(InteractionEvent.id)] == ['click', 'scroll']
+        assert os.listdir(log.directory) == []
+
+    def test_crash_during_compaction_neither_loses_nor_duplicates(self, segment_app, monkeypatch):
+        log = segment_app.extensions['segment_log']
+        session_id = segment_app.config['TEST_SESSION_ID']
+        for i in range(5):
+            log.append(_rows(2, session_id, start=2 * i))
+        log.close()
+        (name,) = _files(log.directory, segment_log.SEALED)
+
+        from app.api import ingest
+        original = ingest.insert_events
+        calls = []
+
+        def crash_on_second_chunk(rows):
+            calls.append(len(rows))
+            if len(calls) == 2:
+                raise RuntimeError('killed')
+            original(rows)
+        monkeypatch.setattr(ingest, 'insert_events', crash_on_second_chunk)
+        with segment_app.app_context():
+            with pytest.raises(RuntimeError):
+                segment_log.compact_segment(log.directory, name, chunk_events=4)
+            db.session.rollback()
+            assert InteractionEvent.query.count() == 4
+            monkeypatch.setattr(ingest, 'insert_events', original)
+            assert segment_log.compact(log.directory, chunk_events=4) == (1, 6)
+            assert sorted(e.timestamp for e in InteractionEvent.query) == [float(i) for i in range(10)]
+
+    def test_track_stores_at_once_when_the_log_is_closed(self, segment_app):
+        client = segment_app.test_client()
+        with client.session_transaction() as sess:
+            sess['exp_session_id'] = segment_app.config['TEST_SESSION_ID']
+        segment_app.extensions['segment_log'].close()  # shutting down
+        resp = client.post('/api/track', json={'events': [{'event_type': 'click'}]})
+        assert resp.status_code == 200 and resp.get_json() == {'status': 'ok', 'count': 1}
+        assert _stored(segment_app) == 1
+
+    def test_track_answers_503_when_the_append_fails(self, segment_app, monkeypatch):
+        client = segment_app.test_client()
+        with client.session_transaction() as sess:
+            sess['exp_session_id'] = segment_app.config['TEST_SESSION_ID']
+
+        def disk_full(rows):
+            raise OSError(28, 'No space left on device')
+        monkeypatch.setattr(segment_app.extensions['segment_log'], 'append', disk_full)
+        resp = client.post('/api/track', json={'events': [{'event_type': 'click'}]})
+        assert resp.status_code == 503 and resp.headers['Retry-After'] == '5'
+        assert _stored(segment_app) == 0
+
+    def test_segment_left_open_by_a_dead_process_is_sealed(self, segment_app):
+        directory = segment_app.extensions['segment_log'].directory
+        session_id = segment_app.config['TEST_SESSION_ID']
+        path = os.path.join(directory, '20260101T000000000000-99999999-1' + segment_log.OPEN)
+        with open(path, 'wb') as f:
+            f.write(segment_log.encode_record(_rows(3, session_id)))
+            f.write(segment_log.encode_record(_rows(2, session_id))[:10])
+        with segment_app.app_context():
+            assert segment_log.compact(directory) == (1, 3)
+        assert os.listdir(directory) == []
+
+    def test_segment_of_a_reused_pid_is_sealed(self, segment_app):
+        directory = segment_app.extensions['segment_log'].directory
+        session_id = segment_app.config['TEST_SESSION_ID']
+        pid, start = os.getpid(), segment_log._start_time(os.getpid())
+        if start is None:
+            pytest.skip('process start times need /proc')
+        # Same PID as this process, but written by an earlier process (e.g. PID 1 before a container restart)
+        earlier = f'20260101T000000000000-{pid}-{start + 1}-1{segment_log.OPEN}'
+        current = f'20260101T000000000001-{pid}-{start}-1{segment_log.OPEN}'
+        for name, n in ((earlier, 2), (current, 1)):
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(segment_log.encode_record(_rows(n, session_id)))
+        assert segment_log.seal_stale(directory) == [earlier]
+        with segment_app.app_context():
+            assert segment_log.compact(directory) == (1, 2)
+        assert _files(directory, segment_log.OPEN) == [current]
+
+    def test_fsync_does_not_block_appends(self, tmp_path, monkeypatch):
+        log = SegmentLog(str(tmp_path), fsync_interval=0.01)
+        started, release = threading.Event(), threading.Event()
+        real_fsync = os.fsync
+
+        def slow_fsync(fd):
+            started.set()
+            release.wait(10)
+            real_fsync(fd)
+        monkeypatch.setattr(segment_log.os, 'fsync', slow_fsync)
+        log.append(_rows(1))
+        assert started.wait(10)
+        appended = threading.Thread(target=log.append, args=(_rows(1),))
+        appended.start()
+        appended.join(5)
+        still_blocked = appended.is_alive()
+        release.set()
+        appended.join()
+        log.close()
+        assert not still_blocked
+        assert log.stats()['events'] == 2 and log.stats()['fsyncs'] >= 1
+
+    def test_competing_compactor_skips_a_segment_it_did_not_claim(self, segment_app):
+        log = segment_app.extensions['segment_log']
+        log.append(_rows(2, segment_app.config['TEST_SESSION_ID']))
+        log.close()
+        (name,) = _files(log.directory, segment_log.SEALED)
+        with segment_app.app_context():
+            db.session.add(SegmentOffset(name=name, position=0, events=0, completed=False))
+            db.session.commit()
+            # Another compactor has moved on since this one read the position
+            assert not segment_log._advance(name, 5, 10, _rows(2, segment_app.config['TEST_SESSION_ID']))
+            assert InteractionEvent.query.count() == 0
+
+    def test_command_line(self, segment_app, monkeypatch, capsys):
+        log = segment_app.extensions['segment_log']
+        log.append(_rows(3, segment_app.config['TEST_SESSION_ID']))
+        log.close()
+        monkeypatch.setattr('app.create_app', lambda config: segment_app)
+        assert segment_log.main(['status']) == 0
+        assert '1 sealed segment(s) to load' in capsys.readouterr().out
+        assert segment_log.main(['compact']) == 0
+        assert capsys.readouterr().out.strip() == 'loaded 3 events from 1 segment(s)'
+        assert _stored(segment_app) == 3
@@ -0,0 +1,60 @@
+"""Tests for the synthetic participant harness (benchmarks/simulate.py)."""
+import io
+import json
+import sqlite3
+
+from benchmarks import simulate
+
+
+class TestSimulate:
+
+    def _run(self, tmp_path, truth, participants=2, noise=0.0, track_scale=1.0):
+        db_path = str(tmp_path / 'sim.db')
+        app = simulate.local_app(db_path)
+        experiment_id = simulate.create_experiment(app, len(truth))
+        before = simulate.db_footprint(db_path)
+        result = simulate.simulate(lambda: simulate.TestClientTransport(app), experiment_id, participants,
+                                   workers=2, truth=truth, noise=noise, track_scale=track_scale)
+        simulate.drain(app)
+        return db_path, before, result
+
+    def test_participants_complete_every_method(self, tmp_path):
+        db_path, before, result = self._run(tmp_path, [3, 0, 4, 1, 2])
+        assert result['errors'] == {}
+        routes = result['recorder'].statuses
+        assert routes['GET /experiment/<id>/complete'] == {200: 2}
+        # Stored synchronously (the queue is opt-in), or no_session for pages before the participant starts
+        assert set(routes['POST /api/track']) == {200}
+        size, rows = simulate.db_footprint(db_path)
+        assert rows['method_session'] - before[1]['method_session'] == 2 * len(simulate.METHOD_TYPES)
+        assert rows['interaction_event'] > 0 and size > before[0]
+
+        out = io.StringIO()
+        simulate.report(result, 2, growth=(before, (size, rows)), out=out)
+        assert 'p99 ms' in out.getvalue() and 'rows per participant' in out.getvalue()
+
+    def test_noiseless_answers_reproduce_the_truth(self, tmp_path):
+        truth = [2, 4, 0, 3, 1]
+        db_path, _, result = self._run(tmp_path, truth, participants=1, track_scale=0)
+        assert result['errors'] == {}
+        assert set(result['recorder'].latencies) & {'POST /api/track', 'POST /api/session_meta'} == set()
+
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute('SELECT m.method_type, r.risk_id, r.result_data FROM assessment_result r '
+                            'JOIN method_session ms ON ms.id = r.method_session_id '
+                            'JOIN method m ON m.id = ms.method_id').fetchall()
+        risk_ids = [r[0] for r in conn.execute('SELECT id FROM risk ORDER BY "order"')]
+        conn.close()
+        by_type = {}
+        for method_type, risk_id, data in rows:
+            by_type.setdefault(method_type, []).append((risk_id, json.loads(data)))
+
+        final = next(d for _, d in by_type['uranus'] if d.get('type') == 'final_ranking')
+        assert final['ranking'] == truth
+        ranked = sorted(by_type['ranking'], key=lambda r: r[1]['rank'])
+        assert [risk_ids.index(risk_id) for risk_id, _ in ranked] == truth
+        points = {risk_id: d['points'] for risk_id, d in by_type['budget']}
+        assert sum(points.values()) == 100
+        assert [points[risk_ids[i]] for i in truth] == sorted(points.values(), reverse=True)
+        priority = {risk_id: d['priority'] for risk_id, d in by_type['matrix']}
+        assert priority[risk_ids[truth[0]]] == 25 and priority[risk_ids[truth[-1]]] == 1
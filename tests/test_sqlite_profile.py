@@ -0,0 +1,71 @@
+"""Tests for the SQLite production profile (app/sqlite_profile.py)."""
+import sqlite3
+
+from sqlalchemy.exc import OperationalError
+
+from app import create_app, db, sqlite_profile
+from tests.conftest import TestConfig
+
+
+def _app(tmp_path, **settings):
+    config = type('ProfileConfig', (TestConfig,), {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'profile.db'),
+        'SQLITE_PROFILE': 'production', 'WAITRESS_THREADS': 6, **settings})
+    return create_app(config)
+
+
+class TestSqliteProfile:
+
+    def test_enabled_only_for_file_databases(self):
+        assert sqlite_profile.enabled({'SQLITE_PROFILE': 'production', 'SQLALCHEMY_DATABASE_URI': 'sqlite:///x.db'})
+        assert not sqlite_profile.enabled({'SQLITE_PROFILE': 'off', 'SQLALCHEMY_DATABASE_URI': 'sqlite:///x.db'})
+        assert not sqlite_profile.enabled({'SQLITE_PROFILE': 'production', 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        assert not sqlite_profile.enabled({'SQLITE_PROFILE': 'production',
+                                           'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+        assert not sqlite_profile.enabled({'SQLITE_PROFILE': 'production',
+                                           'SQLALCHEMY_DATABASE_URI': 'postgresql://db/uranus'})
+
+    def test_pragmas_and_pool_are_applied(self, tmp_path):
+        app = _app(tmp_path, SQLITE_BUSY_TIMEOUT_MS=1234)
+        effective = app.extensions['sqlite_profile']
+        assert effective['journal_mode'] == 'wal'
+        assert effective['synchronous'] == 1 and effective['temp_store'] == 2
+        assert effective['busy_timeout'] == 1234 and effective['cache_size'] == -64 * 1024
+        assert effective['pool_size'] == 6
+        with app.app_context():
+            # Every pooled connection gets the pragmas, not just the first
+            connections = [db.engine.connect() for _ in range(3)]
+            assert [c.exec_driver_sql('PRAGMA busy_timeout').scalar() for c in connections] == [1234] * 3
+            for c in connections:
+                c.close()
+            db.engine.dispose()
+        assert sqlite3.connect(tmp_path / 'profile.db').execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    def _commit_during_read(self, tmp_path, journal_mode):
+        tmp_path.mkdir()
+        app = _app(tmp_path, SQLITE_JOURNAL_MODE=journal_mode, SQLITE_BUSY_TIMEOUT_MS=0)
+        with app.app_context():
+            reader = sqlite3.connect(tmp_path / 'profile.db', isolation_level=None)
+            reader.execute('BEGIN')
+            reader.execute('SELECT count(*) FROM experiment').fetchall()  # holds a read snapshot
+            try:
+                db.session.execute(db.text("INSERT INTO experiment (name) VALUES ('x')"))
+                db.session.commit()
+                return True
+            except OperationalError:
+                db.session.rollback()
+                return False
+            finally:
+                reader.close()
+                db.engine.dispose()
+
+    def test_writer_does_not_wait_for_readers(self, tmp_path):
+        assert self._commit_during_read(tmp_path / 'wal', 'WAL')
+        assert not self._commit_during_read(tmp_path / 'delete', 'DELETE')
+
+    def test_self_check_reports_mismatches(self, tmp_path):
+        app = _app(tmp_path)
+        with app.app_context():
+            _, mismatches = sqlite_profile.self_check(db.engine, [('synchronous', 'FULL'), ('busy_timeout', 1)])
+            db.engine.dispose()
+        assert mismatches == ["synchronous is 1, not 'FULL'", 'busy_timeout is 5000, not 1']
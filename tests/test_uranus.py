@@ -0,0 +1,456 @@
+"""Tests for the core Uranus pairwise-comparison algorithm (uranus.py)."""
+import itertools
+import os
+import random
+import time
+
+import pytest
+
+from uranus import (Uranus, BlockList, CustomError, NullLogSink, MemoryLogSink, FileLogSink,
+                    ford_johnson, ford_johnson_bound)
+
+
+# Ground truth orderings used to answer comparisons: low -> high priority, one list per parameter
+TRUTH = [[3, 0, 5, 1, 4, 2], [1, 2, 0, 5, 3, 4]]
+
+# Comparisons asked by the reference (plain list) implementation for TRUTH
+EXPECTED_ASKED = [
+    (1, 0, 0), (1, 0, 1), (2, 1, 0), (2, 0, 1), (2, 1, 1), (3, 1, 0), (3, 0, 0), (3, 2, 1), (3, 0, 1),
+    (4, 1, 0), (4, 2, 0), (4, 0, 1), (4, 3, 1), (5, 1, 0), (5, 0, 0), (5, 0, 1), (5, 4, 1), (5, 3, 1),
+]
+
+
+def _new_uranus(num_parameters, num_elements, top_k=None, scheduler='binary', prior=None):
+    u = Uranus([f'p{i}' for i in range(num_parameters)], [f'e{i}' for i in range(num_elements)],
+               log_sink=NullLogSink(), top_k=top_k, scheduler=scheduler, prior=prior)
+    u.set_logging(False)
+    return u
+
+
+def _answer(truth, a, b, c):
+    return 1 if truth[c].index(a) > truth[c].index(b) else 0
+
+
+def _run(u, truth):
+    asked = []
+    while True:
+        a, b, c = u.next_to_process()
+        if a is None:
+            return asked
+        asked.append((a, b, c))
+        u.set_priority(_answer(truth, a, b, c))
+
+
+class TestBlockList:
+
+    def test_behaves_like_list(self):
+        bl = BlockList([4, 2, 7])
+        assert len(bl) == 3
+        assert list(bl) == [4, 2, 7]
+        assert bl == [4, 2, 7]
+        assert bl[0] == 4 and bl[-1] == 7
+        assert bl[1:] == [2, 7]
+        assert 2 in bl and 5 not in bl
+        assert bl.index(7) == 2
+        assert repr(bl) == '[4, 2, 7]'
+
+    def test_insert_next_to(self):
+        bl = BlockList([1, 2])
+        bl.insert_before(1, 0)
+        bl.insert_after(2, 3)
+        bl.insert_after(1, 9)
+        assert bl == [0, 1, 9, 2, 3]
+        assert bl.index(2) == 3
+
+    def test_block_splits_keep_order(self, monkeypatch):
+        monkeypatch.setattr(BlockList, 'min_load', 2)
+        rnd = random.Random(7)
+        bl, ref = BlockList([0]), [0]
+        for e in range(1, 300):
+            pivot = rnd.choice(ref)
+            if rnd.random() < 0.5:
+                bl.insert_before(pivot, e)
+                ref.insert(ref.index(pivot), e)
+            else:
+                bl.insert_after(pivot, e)
+                ref.insert(ref.index(pivot) + 1, e)
+        assert bl == ref
+        assert all(bl.index(e) == i for i, e in enumerate(ref))
+        assert len(bl._blocks) > 1
+
+    def test_remove(self):
+        bl = BlockList([3, 1, 2])
+        bl.remove(3)
+        assert bl == [1, 2] and 3 not in bl
+        bl.remove(2)
+        bl.remove(1)
+        assert len(bl) == 0
+        bl.append(5)
+        assert bl == [5]
+
+
+class TestUranusCore:
+
+    def test_comparison_sequence_unchanged(self):
+        u = _new_uranus(2, 6)
+        assert _run(u, TRUTH) == EXPECTED_ASKED
+        assert u.prioritized == TRUTH
+        assert u.num_comparisons == 18
+        assert u.prioritized_list() == [4, 2, 1, 5, 3, 0]
+
+    def test_peek_next_matches_next_to_process_without_side_effects(self):
+        rnd = random.Random(5)
+        for num_parameters, num_elements in [(1, 1), (2, 2), (2, 6), (3, 17)]:
+            truth = [rnd.sample(range(num_elements), num_elements) for _ in range(num_parameters)]
+            u = _new_uranus(num_parameters, num_elements)
+            while True:
+                before = ([list(p) for p in u.prioritized], u.next_elem, u.next_parameter, list(u.next_range))
+                peeked = u.peek_next()
+                assert before == ([list(p) for p in u.prioritized], u.next_elem, u.next_parameter, list(u.next_range))
+                a, b, c = u.next_to_process()
+                assert peeked == (a, b, c)
+                assert u.peek_next() == (a, b, c)
+                if a is None:
+                    break
+                u.set_priority(_answer(truth, a, b, c))
+
+    def test_peek_after_predicts_both_answers(self):
+        rnd = random.Random(9)
+        truth = [rnd.sample(range(9), 9) for _ in range(2)]
+        u = _new_uranus(2, 9)
+        while True:
+            state = ([list(p) for p in u.prioritized], u.next_elem, u.next_parameter, list(u.next_range))
+            predicted = {choice: u.peek_after(choice) for choice in (0, 1)}
+            assert state == ([list(p) for p in u.prioritized], u.next_elem, u.next_parameter, list(u.next_range))
+            a, b, c = u.next_to_process()
+            if a is None:
+                assert predicted == {0: (None, None, None), 1: (None, None, None)}
+                break
+            choice = _answer(truth, a, b, c)
+            u.set_priority(choice)
+            assert u.peek_next() == predicted[choice]
+
+    def test_prioritized_accepts_plain_lists(self):
+        u = _new_uranus(2, 3)
+        u.prioritized = [[0, 2], [1]]
+        assert all(isinstance(p, BlockList) for p in u.prioritized)
+        assert u.prioritized == [[0, 2], [1]]
+
+    def test_sorts_large_list(self):
+        rnd = random.Random(3)
+        truth = [rnd.sample(range(200), 200) for _ in range(2)]
+        u = _new_uranus(2, 200)
+        _run(u, truth)
+        assert u.is_done()
+        assert u.prioritized == truth
+
+    def test_placed_counter_tracks_structure_changes(self):
+        u = _new_uranus(2, 4)
+        truth = [[0, 1, 2, 3], [3, 2, 1, 0]]
+
+        def check():
+            assert u.num_placed == sum(len(p) for p in u.prioritized)
+
+        for _ in range(5):
+            a, b, c = u.next_to_process()
+            u.set_priority(_answer(truth, a, b, c))
+            check()
+        u.add_element('e4')
+        check()
+        u.remove_element(1)
+        check()
+        u.add_parameter('p2')
+        check()
+        u.swap_parameter_priorities(0, 2)
+        check()
+        u.remove_parameter(1)
+        check()
+        assert not u.is_done()
+        u.reset()
+        assert u.num_placed == 0
+        assert u.progress() == 0
+
+    def test_progress_and_done(self):
+        u = _new_uranus(2, 6)
+        assert u.progress() == 0
+        _run(u, TRUTH)
+        assert u.is_done()
+        assert u.progress() == 100
+
+    def test_next_picks_least_placed_parameter_and_lowest_unplaced_element(self):
+        u = _new_uranus(3, 6)
+        u.prioritized = [[0, 1, 2], [4, 0], [5, 3]]
+        a, b, c = u.next_to_process()
+        assert (a, c) == (1, 1)  # parameters 1 and 2 tie on count: lowest index wins
+        u.set_priority(0)
+        u.set_priority(0)
+        assert u.prioritized[1] == [1, 4, 0]
+        a, b, c = u.next_to_process()
+        assert (a, c) == (0, 2)
+        u.remove_parameter(0)
+        u.next_range = []
+        a, b, c = u.next_to_process()
+        assert (a, c) == (0, 1)
+
+    def test_rank_prioritize_matches_recursive_reference(self):
+        rnd = random.Random(11)
+        for _ in range(100):
+            num_parameters, num_elements = rnd.randint(1, 5), rnd.randint(0, 40)
+            u = _new_uranus(num_parameters, num_elements)
+            u.prioritized = [rnd.sample(range(num_elements), num_elements) for _ in range(num_parameters)]
+            result = list(u.prioritized_list())
+            u.final_list = []
+            u.prioritize(-1, list(range(num_elements)), u.prioritized)
+            assert result == u.final_list
+
+
+class TestTopK:
+
+    def test_orders_only_the_top_k(self):
+        rnd = random.Random(13)
+        for num_parameters, num_elements, top_k in [(1, 2, 1), (2, 9, 3), (3, 30, 5), (2, 12, 12), (1, 5, 9)]:
+            truth = [rnd.sample(range(num_elements), num_elements) for _ in range(num_parameters)]
+            u = _new_uranus(num_parameters, num_elements, top_k)
+            _run(u, truth)
+            assert u.is_done() and u.progress() == 100
+            for p in range(num_parameters):
+                assert u.prioritized[p] == truth[p][-top_k:]
+                assert u.below_cut[p] == set(truth[p][:-top_k])
+
+    def test_needs_fewer_comparisons_than_full_sort(self):
+        rnd = random.Random(17)
+        truth = [rnd.sample(range(100), 100) for _ in range(2)]
+        full, top = _new_uranus(2, 100), _new_uranus(2, 100, top_k=5)
+        _run(full, truth)
+        _run(top, truth)
+        assert top.num_comparisons < full.num_comparisons / 2
+
+    def test_peeks_and_counters(self):
+        rnd = random.Random(19)
+        truth = [rnd.sample(range(15), 15) for _ in range(2)]
+        u = _new_uranus(2, 15, top_k=4)
+        while True:
+            predicted = {choice: u.peek_after(choice) for choice in (0, 1)}
+            peeked = u.peek_next()
+            a, b, c = u.next_to_process()
+            assert peeked == (a, b, c)
+            if a is None:
+                break
+            choice = _answer(truth, a, b, c)
+            u.set_priority(choice)
+            assert u.peek_next() == predicted[choice]
+            assert u.num_placed == sum(len(p) for p in u.prioritized) + sum(len(b) for b in u.below_cut)
+        assert u.is_done()
+
+    def test_ranking_puts_elements_below_the_cut_last(self):
+        u = _new_uranus(1, 6, top_k=2)
+        _run(u, [[3, 0, 5, 1, 4, 2]])
+        assert u.prioritized_list()[:2] == [2, 4]
+
+    def test_rejects_invalid_top_k(self):
+        for top_k in (0, -1, 2.5):
+            with pytest.raises(CustomError, match='top_k'):
+                _new_uranus(1, 3, top_k)
+
+
+class TestWarmStart:
+
+    @staticmethod
+    def _prior(truth, noise, rnd):
+        return [[round(order.index(e) + rnd.gauss(0, noise)) for e in range(len(order))] for order in truth]
+
+    def test_sorts_exactly_with_any_prior(self):
+        rnd = random.Random(31)
+        for num_parameters, num_elements in [(1, 2), (2, 9), (3, 25)]:
+            truth = [rnd.sample(range(num_elements), num_elements) for _ in range(num_parameters)]
+            for prior in (self._prior(truth, 0, rnd), self._prior(truth, 4, rnd),
+                          [[-order.index(e) for e in range(num_elements)] for order in truth],
+                          [None] + self._prior(truth, 1, rnd)[1:]):
+                u = _new_uranus(num_parameters, num_elements, prior=prior)
+                while True:
+                    predicted = {choice: u.peek_after(choice) for choice in (0, 1)}
+                    peeked = u.peek_next()
+                    a, b, c = u.next_to_process()
+                    assert peeked == (a, b, c)
+                    if a is None:
+                        break
+                    choice = _answer(truth, a, b, c)
+                    u.set_priority(choice)
+                    assert u.peek_next() == predicted[choice]
+                assert u.prioritized == truth
+
+    def test_good_prior_needs_fewer_comparisons(self):
+        rnd = random.Random(37)
+        truth = [rnd.sample(range(50), 50) for _ in range(2)]
+        cold = _new_uranus(2, 50)
+        exact = _new_uranus(2, 50, prior=self._prior(truth, 0, rnd))
+        noisy = _new_uranus(2, 50, prior=self._prior(truth, 2, rnd))
+        categories = _new_uranus(2, 50, prior=[[order.index(e) * 5 // 50 for e in range(50)] for order in truth])
+        for u in (cold, exact, noisy, categories):
+            _run(u, truth)
+            assert u.prioritized == truth
+        assert exact.num_comparisons <= 2 * 2 * 49
+        assert noisy.num_comparisons < categories.num_comparisons < cold.num_comparisons
+
+    def test_prior_follows_structure_changes(self):
+        u = _new_uranus(2, 4, prior=[[0, 1, 2, 3], [3, 2, 1, 0]])
+        u.remove_element(1)
+        assert u.prior == [[0, 2, 3], [3, 1, 0]]
+        u.add_parameter('p2')
+        u.swap_parameter_priorities(0, 2)
+        assert u.prior == [None, [3, 1, 0], [0, 2, 3]]
+        u.remove_parameter(0)
+        u.add_element('e4')  # no prior score: plain bisection
+        _run(u, [[2, 0, 1, 3], [0, 1, 2, 3]])
+        assert u.prioritized == [[2, 0, 1, 3], [0, 1, 2, 3]]
+
+    def test_rejects_invalid_prior(self):
+        with pytest.raises(CustomError, match='prior'):
+            _new_uranus(2, 3, prior=[[0, 1, 2]])
+        with pytest.raises(CustomError, match='prior'):
+            _new_uranus(1, 3, scheduler='ford_johnson', prior=[[0, 1, 2]])
+
+
+class TestFordJohnson:
+
+    def test_generator_sorts_within_worst_case_bound(self):
+        assert [ford_johnson_bound(n) for n in range(1, 13)] == [0, 1, 3, 5, 7, 10, 13, 16, 19, 22, 26, 30]
+        for n in range(8):
+            worst = 0
+            for truth in itertools.permutations(range(n)):
+                sort, asked = ford_johnson(list(range(n))), 0
+                try:
+                    x, y = next(sort)
+                    while True:
+                        asked += 1
+                        x, y = sort.send(1 if truth.index(x) > truth.index(y) else 0)
+                except StopIteration as stop:
+                    assert stop.value == list(truth)
+                worst = max(worst, asked)
+            assert worst == ford_johnson_bound(n)
+
+    def test_uranus_sorts_with_ford_johnson(self):
+        rnd = random.Random(23)
+        for num_parameters, num_elements in [(1, 0), (1, 1), (2, 2), (2, 9), (3, 20)]:
+            truth = [rnd.sample(range(num_elements), num_elements) for _ in range(num_parameters)]
+            u = _new_uranus(num_parameters, num_elements, scheduler='ford_johnson')
+            binary = _new_uranus(num_parameters, num_elements)
+            last = 0
+            while True:
+                predicted = {choice: u.peek_after(choice) for choice in (0, 1)}
+                peeked = u.peek_next()
+                a, b, c = u.next_to_process()
+                assert peeked == (a, b, c)
+                if a is None:
+                    break
+                assert u.progress() >= last
+                last = u.progress()
+                choice = _answer(truth, a, b, c)
+                u.set_priority(choice)
+                assert u.peek_next() == predicted[choice]
+            assert u.is_done()
+            assert u.num_comparisons <= num_parameters * ford_johnson_bound(num_elements)
+            assert [list(p) for p in u.prioritized] == (truth if num_elements else [[]] * num_parameters)
+            _run(binary, truth)
+            assert u.prioritized_list() == binary.prioritized_list()
+
+    def test_worst_case_beats_binary_insertion(self):
+        # binary insertion needs up to sum(ceil(log2(k + 1))) = 25 comparisons for 10 elements, Ford-Johnson 22
+        rnd = random.Random(29)
+        worst = {'binary': 0, 'ford_johnson': 0}
+        for _ in range(200):
+            truth = [rnd.sample(range(10), 10)]
+            for scheduler in worst:
+                asked = len(_run(_new_uranus(1, 10, scheduler=scheduler), truth))
+                worst[scheduler] = max(worst[scheduler], asked)
+        assert worst['ford_johnson'] <= ford_johnson_bound(10) == 22
+        assert worst['ford_johnson'] < worst['binary']
+
+    def test_structure_changes(self):
+        u = _new_uranus(2, 5, scheduler='ford_johnson')
+        truth = [[0, 1, 2, 3, 4], [4, 3, 2, 1, 0]]
+        for _ in range(4):
+            a, b, c = u.next_to_process()
+            u.set_priority(_answer(truth, a, b, c))
+        assert u.scheduler.get_state() == [[0, 0], [1, 1]]
+        u.add_parameter('p2')
+        u.swap_parameter_priorities(0, 2)
+        assert u.scheduler.get_state() == [[], [1, 1], [0, 0]]
+        u.remove_parameter(1)
+        assert u.scheduler.get_state() == [[], [0, 0]]
+        u.add_element('e5')
+        assert u.scheduler.get_state() == [[], []]  # a new element restarts the sort
+        u.reset()
+        assert u.progress() == 0
+
+    def test_rejects_unknown_scheduler_and_top_k(self):
+        with pytest.raises(CustomError, match='scheduler'):
+            _new_uranus(1, 3, scheduler='quick')
+        with pytest.raises(CustomError, match='top_k'):
+            _new_uranus(1, 3, top_k=2, scheduler='ford_johnson')
+
+
+class TestLogSinks:
+
+    def test_memory_sink_is_a_ring_buffer(self):
+        sink = MemoryLogSink(capacity=3)
+        u = Uranus(['impact'], ['a', 'b', 'c'], log_sink=sink)
+        u.add_element('d')
+        u.add_element('e')
+        u.add_parameter('probability')
+        assert len(sink.records) == 3
+        assert sink.records[0][1:] == ('Added new element {}: {}', (3, 'd'))
+        assert sink.lines()[-1].endswith(': Added param 1: probability (lowest priority)\n')
+
+    def test_file_sink_buffers_until_flush(self, tmp_path):
+        path = str(tmp_path / 'log.txt')
+        u = Uranus(['impact'], ['a', 'b'], log_sink=FileLogSink(path, max_records=10, max_delay=60))
+        u.add_element('c')
+        assert not os.path.exists(path)
+        u.flush()
+        with open(path) as f:
+            lines = f.readlines()
+        assert len(lines) == 2
+        assert lines[0].endswith(': start\n')
+        assert lines[1].endswith(': Added new element 2: c\n')
+
+    def test_file_sink_flushes_on_size_and_close(self, tmp_path):
+        path = str(tmp_path / 'log.txt')
+        sink = FileLogSink(path, max_records=2, max_delay=60)
+        u = Uranus(['impact'], ['a'], log_sink=sink)
+        u.add_element('b')
+        with open(path) as f:
+            assert len(f.readlines()) == 2
+        u.add_element('c')
+        u.close()
+        with open(path) as f:
+            assert len(f.readlines()) == 3
+
+    def test_file_sink_flushes_after_max_delay(self, tmp_path):
+        path = str(tmp_path / 'log.txt')
+        sink = FileLogSink(path, max_records=10, max_delay=0.05)
+        u = Uranus(['impact'], ['a'], log_sink=sink)
+        u.add_element('b')  # the last record of a burst: no later write() to notice the delay
+        deadline = time.monotonic() + 10
+        while not os.path.exists(path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with open(path) as f:
+            assert len(f.readlines()) == 2
+        u.close()
+        assert sink._timer is None
+
+    def test_set_log_file_switches_file_sink(self, tmp_path):
+        u = Uranus(['impact'], ['a'], log_sink=MemoryLogSink())
+        path = str(tmp_path / 'other.txt')
+        u.set_log_file(path)
+        u.add_element('b')
+        u.close()
+        with open(path) as f:
+            assert f.read().endswith(': Added new element 1: b\n')
+
+    def test_logging_disabled_writes_nothing(self):
+        sink = MemoryLogSink()
+        u = Uranus(['impact'], ['a'], log_sink=sink)
+        u.set_logging(False)
+        u.add_element('b')
+        assert len(sink.records) == 1  # only "start"
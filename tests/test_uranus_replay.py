@@ -0,0 +1,219 @@
+"""Tests for rebuilding Uranus state from stored comparisons (app/uranus_replay.py)."""
+import random
+
+from app import uranus_replay
+from app.methods.uranus_method import UranusMethod, uranus_cache
+from app.models import AssessmentResult, MethodSession, RankPosition
+from tests.test_methods import _create_test_env
+
+
+def _answer_all(handler, ms, risks, truth, limit=None):
+    for _ in range(limit or 500):
+        ctx = handler.get_context(ms, risks)
+        if ctx.get('done'):
+            return
+        choice = 1 if truth[ctx['c']].index(ctx['a']) > truth[ctx['c']].index(ctx['b']) else 0
+        handler.process_response({'choice': str(choice), 'a': str(ctx['a']), 'b': str(ctx['b']),
+                                  'c': str(ctx['c'])}, ms, risks)
+
+
+def _truth(num_risks, seed=1):
+    rnd = random.Random(seed)
+    return [rnd.sample(range(num_risks), num_risks) for _ in range(2)]
+
+
+class TestReplay:
+
+    def test_replay_matches_snapshot(self, app, db):
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=7)
+            _answer_all(UranusMethod(), ms, risks, _truth(7), limit=9)
+            result = uranus_replay.replay(uranus_replay.session_job(ms, risks))
+            assert result['status'] == 'ok'
+            assert result['applied'] == 9 and result['mismatched'] == 0
+            assert result['ranking'] is None
+
+    def test_replay_with_session_options(self, app, db):
+        with app.app_context():
+            for config in ({'parameters': ['impact', 'probability'], 'top_k': 3},
+                           {'parameters': ['impact', 'probability'], 'scheduler': 'ford_johnson'}):
+                exp, risks, method, ms = _create_test_env(db.session, 'uranus', config=config, num_risks=8)
+                _answer_all(UranusMethod(), ms, risks, _truth(8))
+                result = uranus_replay.replay(uranus_replay.session_job(ms, risks))
+                assert result['status'] == 'ok'
+                assert ms.status == 'completed' and result['ranking']
+
+    def test_detects_diverged_snapshot(self, app, db):
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=5)
+            _answer_all(UranusMethod(), ms, risks, _truth(5), limit=4)
+            state = ms.get_uranus_state()
+            state['prioritized'][0].reverse()
+            ms.set_uranus_state(state)
+            db.session.commit()
+            result = uranus_replay.replay(uranus_replay.session_job(ms, risks))
+            assert result['status'] == 'diverged'
+            assert result['differences'] == ['prioritized']
+
+    def test_counts_answers_for_another_pair(self, app, db):
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=5)
+            handler = UranusMethod()
+            ctx = handler.get_context(ms, risks)
+            form = {'choice': '1', 'a': str(ctx['a']), 'b': str(ctx['b']), 'c': str(ctx['c'])}
+            handler.process_response(form, ms, risks)
+            # A resubmitted form, as stored before process_response() checked the pair: applied to the next one
+            u = handler._get_or_create_uranus(ms, risks)
+            handler._add_comparison(u, ms, risks, ctx['a'], ctx['b'], ctx['c'], 1)
+            u.next_to_process()
+            u.set_priority(1)
+            handler._save_and_finish(ms, u)
+            db.session.commit()
+            result = uranus_replay.replay(uranus_replay.session_job(ms, risks))
+            assert result['status'] == 'ok'
+            assert (result['applied'], result['mismatched']) == (2, 1)
+
+    def test_corrupt_snapshot_is_rebuilt_on_load(self, app, db):
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=6)
+            handler = UranusMethod()
+            _answer_all(handler, ms, risks, _truth(6), limit=5)
+            expected = ms.get_uranus_state()
+            ms.uranus_state = 'u2:!!'
+            db.session.commit()
+            uranus_cache.clear()
+            u = handler._get_or_create_uranus(ms, risks)
+            assert u.num_comparisons == 5
+            assert [list(p) for p in u.prioritized] == expected['prioritized']
+
+
+class TestRiskListChanges:
+    """A snapshot's indexes refer to the risk list it was taken with; answers are kept by risk id."""
+
+    @staticmethod
+    def _answer_by_id(handler, ms, risks, truth_ids, limit=500):
+        # truth_ids: per parameter, risk ids from least to most important
+        for _ in range(limit):
+            ctx = handler.get_context(ms, risks)
+            if ctx.get('done'):
+                return
+            order = truth_ids[ctx['c']]
+            choice = 1 if order.index(risks[ctx['a']].id) > order.index(risks[ctx['b']].id) else 0
+            handler.process_response({'choice': str(choice), 'a': str(ctx['a']), 'b': str(ctx['b']),
+                                      'c': str(ctx['c'])}, ms, risks)
+
+    @staticmethod
+    def _risks(exp):
+        from app.models import Risk
+        return Risk.query.filter_by(experiment_id=exp.id).order_by(Risk.order).all()
+
+    def test_reordered_risks_keep_the_answers(self, app, db):
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=6)
+            truth_ids = [[risks[i].id for i in order] for order in _truth(6)]
+            handler = UranusMethod()
+            self._answer_by_id(handler, ms, risks, truth_ids, limit=6)
+            for r in risks:
+                r.order = 10 - r.order  # reverse the list mid-session
+            db.session.commit()
+            uranus_cache.clear()
+            risks = self._risks(exp)
+            self._answer_by_id(handler, ms, risks, truth_ids)
+            # Restoring the old indexes as they were would have ranked other risks
+            state = ms.get_uranus_state()
+            assert [[risks[e].id for e in p] for p in state['prioritized']] == truth_ids
+
+    def test_added_risk_keeps_the_answers(self, app, db):
+        from app.models import Risk
+        with app.app_context():
+            exp, risks, method, ms = _create_test_env(db.session, 'uranus', num_risks=5)
+            handler = UranusMethod()
+            truth = _truth(5)
+            self._answer_by_id(handler, ms, risks, [[risks[i].id for i in o] for o in truth], limit=7)
+            answered = ms.get_uranus_state()['num_comparisons']
+            extra = Risk(experiment_id=exp.id, name='Risk F', order=99)
+            db.session.add(extra)
+            db.session.commit()
+            risks = self._risks(exp)
+            truth_ids = [[risks[i].id for i in o] for o in truth]
+            for order in truth_ids:
+                order.insert(2, extra.id)
+            u = handler._get_or_create_uranus(ms, risks)
+            assert u.num_elements == 6 and u.num_comparisons == answered  # every answer still applies
+            handler._release(ms, u)
+            self._answer_by_id(handler, ms, risks, truth_ids)
+            state = ms.get_uranus_state()
+            assert ms.status == 'completed'
+            assert state['risk_fingerprint'] is not None
+            assert [[risks[e].id for e in p] for p in state['prioritized']] == truth_ids
+
+
+class TestReplayExperiment:
+
+    def _experiment(self, db, num_sessions=3):
+        exp, risks, method, first = _create_test_env(db.session, 'uranus', num_risks=6)
+        sessions = [first]
+        for i in range(1, num_sessions):
+            ms = MethodSession(session_id=first.session_id, method_id=method.id, order=i, status='in_progress')
+            db.session.add(ms)
+            db.session.commit()
+            sessions.append(ms)
+        handler = UranusMethod()
+        for i, ms in enumerate(sessions):
+            _answer_all(handler, ms, risks, _truth(6, seed=i), limit=None if i == 0 else 3 + i)
+        return exp, risks, sessions
+
+    def test_bulk_replay_in_process_pool(self, app, db):
+        with app.app_context():
+            exp, risks, sessions = self._experiment(db)
+            inline = uranus_replay.replay_experiment(exp.id, processes=1)
+            pooled = uranus_replay.replay_experiment(exp.id, processes=2)
+            assert [r['status'] for r in inline] == ['ok'] * 3
+            assert pooled == inline
+            assert [r['method_session_id'] for r in inline] == [ms.id for ms in sessions]
+
+    def test_repair_rewrites_lost_snapshot_and_completes(self, app, db):
+        with app.app_context():
+            exp, risks, sessions = self._experiment(db, num_sessions=2)
+            handler = UranusMethod()
+            partial = sessions[1]
+            _answer_all(handler, partial, risks, _truth(6, seed=1))
+            # Lose the last write of a finished session: answers are stored but state and status are not
+            expected = partial.get_uranus_state()
+            for r in AssessmentResult.query.filter_by(method_session_id=partial.id, risk_id=None).all():
+                db.session.delete(r)
+            partial.uranus_state = None
+            partial.status = 'in_progress'
+            db.session.commit()
+
+            results = uranus_replay.replay_experiment(exp.id, processes=1, repair=True)
+            assert [r['status'] for r in results] == ['ok', 'missing']
+            assert partial.status == 'completed'
+            assert partial.get_uranus_state()['prioritized'] == expected['prioritized']
+            assert handler.get_results_summary(partial, risks)['type'] == 'ranking'
+            assert [r['status'] for r in uranus_replay.replay_experiment(exp.id, processes=1)] == ['ok', 'ok']
+
+    def test_rerank_recomputes_final_ranking(self, app, db):
+        with app.app_context():
+            exp, risks, sessions = self._experiment(db, num_sessions=1)
+            ms = sessions[0]
+            row = next(r for r in AssessmentResult.query.filter_by(method_session_id=ms.id, risk_id=None))
+            data = row.get_result_data()
+            expected = data['ranking']
+            data['ranking'] = list(reversed(expected))
+            row.set_result_data(data)
+            db.session.commit()
+            uranus_replay.replay_experiment(exp.id, processes=1, rerank=True)
+            data = row.get_result_data()
+            assert data['ranking'] == expected
+            assert 'recomputed_at' in data
+            positions = RankPosition.query.filter_by(method_session_id=ms.id).order_by(RankPosition.rank).all()
+            assert [p.risk_id for p in positions] == [risks[i].id for i in expected]
+
+    def test_command_line(self, app, db, monkeypatch, capsys):
+        with app.app_context():
+            exp, risks, sessions = self._experiment(db, num_sessions=2)
+            experiment_id = exp.id
+        monkeypatch.setattr('app.create_app', lambda config: app)
+        assert uranus_replay.main([str(experiment_id), '--processes', '1']) == 0
+        assert capsys.readouterr().out.splitlines()[-1] == '2 ok'
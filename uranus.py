@@ -4,7 +4,13 @@
 # (C) 2024 Department of Software Engineering, Jagiellonian University               #
 ######################################################################################
 
+import threading
+import weakref
+from collections import deque
+from copy import copy
 from datetime import datetime
+from heapq import heapify, heappop, heappush
+from math import isqrt
 
 
 def floor(n):
@@ -17,9 +23,434 @@ class CustomError(Exception):
         super().__init__(message)
 
 
+def format_record(record):  # log records are (timestamp, message template, args) tuples, formatted only when read
+    timestamp, msg, args = record
+    return f"{timestamp}: {msg.format(*args) if args else msg}\n"
+
+
+class NullLogSink:
+
+    def write(self, record):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryLogSink:
+    # keeps the last `capacity` records in memory (ring buffer)
+
+    def __init__(self, capacity=1000):
+        self.records = deque(maxlen=capacity)
+
+    def write(self, record):
+        self.records.append(record)
+
+    def lines(self):
+        return [format_record(r) for r in self.records]
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileLogSink:
+    # appends records to a file in batches: written when `max_records` are pending, at most `max_delay` seconds
+    # after the first pending record (by a timer thread), on flush()/close(), and when the sink is garbage
+    # collected or the process exits
+
+    def __init__(self, path, max_records=100, max_delay=5.0):
+        self.path = path
+        self.max_records = max_records
+        self.max_delay = max_delay
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None  # pending timed flush; the timer only holds a weak reference to the sink
+        self._finalizer = weakref.finalize(self, FileLogSink._write_out, path, self._pending, self._lock)
+
+    @staticmethod
+    def _write_out(path, pending, lock):
+        with lock:
+            if not pending:
+                return
+            lines = [format_record(r) for r in pending]
+            pending.clear()
+        with open(path, 'a') as file:
+            file.writelines(lines)
+
+    @staticmethod
+    def _timed_flush(ref):
+        sink = ref()
+        if sink is not None:
+            sink.flush()
+
+    def write(self, record):
+        with self._lock:
+            self._pending.append(record)
+            full = len(self._pending) >= self.max_records
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.max_delay, FileLogSink._timed_flush, (weakref.ref(self),))
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        self._write_out(self.path, self._pending, self._lock)
+
+    def close(self):
+        self.flush()
+        self._finalizer()
+
+
+class BlockList:
+    # Order-preserving list of unique elements stored as a list of short blocks, with an element -> block index.
+    # Locating an element and inserting next to it cost O(sqrt(N)) instead of rebuilding the whole list.
+    # Reads (len, indexing, slicing, iteration, ==) behave like the plain list it replaces.
+
+    min_load = 16  # blocks are split when they grow above 2 * max(min_load, sqrt(N))
+
+    def __init__(self, elements=()):
+        elements = list(elements)
+        load = self._load(len(elements))
+        self._blocks = [elements[i:i + load] for i in range(0, len(elements), load)]
+        self._block_of = {e: block for block in self._blocks for e in block}
+        self._len = len(elements)
+
+    def _load(self, n):
+        return max(self.min_load, isqrt(n))
+
+    def _locate(self, element):  # returns (block number, offset of the block)
+        block = self._block_of[element]
+        offset = 0
+        for i, b in enumerate(self._blocks):
+            if b is block:
+                return i, offset
+            offset += len(b)
+        raise ValueError(f"{element} is not in the list")
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block
+
+    def __contains__(self, element):
+        return element in self._block_of
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("list index out of range")
+        for block in self._blocks:
+            if index < len(block):
+                return block[index]
+            index -= len(block)
+
+    def __eq__(self, other):
+        if isinstance(other, (BlockList, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def index(self, element):
+        if element not in self._block_of:
+            raise ValueError(f"{element} is not in the list")
+        i, offset = self._locate(element)
+        return offset + self._blocks[i].index(element)
+
+    def insert_next_to(self, pivot, element, after):
+        if pivot not in self._block_of:
+            raise ValueError(f"{pivot} is not in the list")
+        i, _ = self._locate(pivot)
+        block = self._blocks[i]
+        block.insert(block.index(pivot) + (1 if after else 0), element)
+        self._block_of[element] = block
+        self._len += 1
+        load = self._load(self._len)
+        if len(block) > 2 * load:
+            tail = block[load:]
+            del block[load:]
+            self._blocks.insert(i + 1, tail)
+            for e in tail:
+                self._block_of[e] = tail
+
+    def insert_before(self, pivot, element):
+        self.insert_next_to(pivot, element, after=False)
+
+    def insert_after(self, pivot, element):
+        self.insert_next_to(pivot, element, after=True)
+
+    def append(self, element):
+        if not self._blocks:
+            self._blocks.append([])
+        block = self._blocks[-1]
+        block.append(element)
+        self._block_of[element] = block
+        self._len += 1
+
+    def remove(self, element):
+        if element not in self._block_of:
+            raise ValueError(f"{element} is not in the list")
+        block = self._block_of.pop(element)
+        block.remove(element)
+        self._len -= 1
+        if not block:
+            self._blocks.remove(block)
+
+
+def ford_johnson(elements):
+    # merge-insertion sort as a generator: yields (x, y) and must be sent 1 if x has a higher priority than y,
+    # 0 otherwise; returns the elements ordered from low to high priority
+    if len(elements) <= 1:
+        return list(elements)
+    pairs = []  # (higher, lower)
+    for i in range(0, len(elements) - 1, 2):
+        x, y = elements[i], elements[i + 1]
+        pairs.append((x, y) if (yield x, y) else (y, x))
+    straggler = elements[-1] if len(elements) % 2 else None
+    higher = yield from ford_johnson([h for h, _ in pairs])
+    partner = dict(pairs)
+    main = [partner[higher[0]]] + higher
+    # b_i (partner of higher[i - 1], the straggler last) is inserted below its a_i, in Jacobsthal groups:
+    # b_3, b_2, then b_5, b_4, then b_11 ... b_6, so that each search runs over at most 2^k - 1 elements
+    pend = [(partner[h], h) for h in higher[1:]]
+    if straggler is not None:
+        pend.append((straggler, None))
+    previous, current = 1, 3
+    while previous <= len(pend):
+        for i in range(min(current - 1, len(pend)), previous - 1, -1):
+            element, bound = pend[i - 1]
+            low, high = 0, len(main) if bound is None else main.index(bound)
+            while low < high:
+                middle = (low + high) // 2
+                if (yield element, main[middle]):
+                    low = middle + 1
+                else:
+                    high = middle
+            main.insert(low, element)
+        previous, current = current, current + 2 * previous
+    return main
+
+
+def ford_johnson_bound(n):  # worst-case number of comparisons of ford_johnson() for n elements
+    return sum(((3 * k + 3) // 4 - 1).bit_length() for k in range(1, n + 1))
+
+
+class ComparisonScheduler:
+    """Decides which pair is compared next and applies the answers; Uranus delegates next_to_process(),
+    peek_next(), peek_after(), set_priority() and progress() to it. The hooks are called after Uranus changes
+    its elements or parameters. get_state()/set_state() carry whatever the scheduler keeps outside Uranus."""
+
+    name = None
+
+    def next_to_process(self, u):
+        raise NotImplementedError
+
+    def peek_next(self, u):
+        raise NotImplementedError
+
+    def peek_after(self, u, relation_type):
+        raise NotImplementedError
+
+    def set_priority(self, u, relation_type):  # num_comparisons is already counted
+        raise NotImplementedError
+
+    def progress(self, u):
+        total = u.num_parameters * u.num_elements
+        if total == 0:
+            return 0
+        else:
+            return 100 * u.num_placed / total
+
+    def elements_changed(self, u):
+        pass
+
+    def parameter_added(self, u):
+        pass
+
+    def parameter_removed(self, u, idx):
+        pass
+
+    def parameters_swapped(self, u, index1, index2):
+        pass
+
+    def reset(self, u):
+        pass
+
+    def get_state(self):
+        return None
+
+    def set_state(self, u, state):
+        pass
+
+
+class BinaryInsertionScheduler(ComparisonScheduler):
+    """The original Uranus schedule: elements are inserted one by one, in index order, by binary search, always
+    into the parameter with the fewest placed elements. Its state is the Uranus instance itself."""
+
+    name = 'binary'
+
+    def next_to_process(self, u):
+        return u._insertion_next()
+
+    def peek_next(self, u):
+        return u._insertion_peek()
+
+    def peek_after(self, u, relation_type):
+        return u._insertion_peek_after(relation_type)
+
+    def set_priority(self, u, relation_type):
+        return u._insertion_set_priority(relation_type)
+
+
+class FordJohnsonScheduler(ComparisonScheduler):
+    """Merge-insertion (Ford-Johnson) sort of every parameter, which needs fewer comparisons than binary insertion
+    for small lists. The state is the list of answers given so far for each parameter; the comparison runs are
+    rebuilt by replaying them. A parameter's order is written to Uranus.prioritized once it is complete. Changing
+    the elements restarts the sort."""
+
+    name = 'ford_johnson'
+
+    def __init__(self):
+        self.answers = []
+        self._runs = None  # per parameter [generator, pending pair, result], rebuilt from answers when None
+
+    @staticmethod
+    def _replay(num_elements, answers):
+        run = [ford_johnson(list(range(num_elements))), None, None]
+        try:
+            run[1] = next(run[0])
+            for answer in answers:
+                run[1] = run[0].send(answer)
+        except StopIteration as stop:
+            run[1], run[2] = None, stop.value
+        return run
+
+    def _load(self, u):
+        if len(self.answers) != len(u.p_names):
+            self.answers = (self.answers + [[] for _ in u.p_names])[:len(u.p_names)]
+            self._runs = None
+        if self._runs is None:
+            self._runs = [self._replay(u.num_elements, answers) for answers in self.answers]
+        return self._runs
+
+    def _current(self, u):  # parameter with a pending comparison and the fewest answers, lowest index on ties
+        runs = self._load(u)
+        pending = [p for p, run in enumerate(runs) if run[1] is not None]
+        return min(pending, key=lambda p: len(self.answers[p])) if pending else None
+
+    def _store_results(self, u):
+        for p, run in enumerate(self._load(u)):
+            if run[2] is not None and len(u.prioritized[p]) != len(run[2]):
+                u.prioritized[p] = BlockList(run[2])
+                u._recount()
+
+    def next_to_process(self, u):
+        self._store_results(u)
+        param = self._current(u)
+        if param is None:
+            return None, None, None
+        u.next_parameter = param
+        u.next_elem = self._runs[param][1][0]
+        return self._runs[param][1] + (param,)
+
+    def peek_next(self, u):
+        param = self._current(u)
+        if param is None:
+            return None, None, None
+        return self._runs[param][1] + (param,)
+
+    def peek_after(self, u, relation_type):
+        param = self._current(u)
+        if param is None:
+            return None, None, None
+        after = FordJohnsonScheduler()
+        after.answers = list(self.answers)
+        after.answers[param] = self.answers[param] + [relation_type]
+        after._runs = list(self._runs)  # only the answered parameter is replayed; other runs are only read
+        after._runs[param] = self._replay(u.num_elements, after.answers[param])
+        return after.peek_next(u)
+
+    def set_priority(self, u, relation_type):
+        param = self._current(u)
+        if param is None:
+            raise CustomError("nextToProcess() must be used before invoking setPriority()")
+        run = self._runs[param]
+        a, b = run[1]
+        if relation_type == 0:
+            u.log("parameter {}, {} < {}", param, a, b)
+        else:
+            u.log("parameter {}, {} < {}", param, b, a)
+        self.answers[param].append(relation_type)
+        try:
+            run[1] = run[0].send(relation_type)
+        except StopIteration as stop:
+            run[1], run[2] = None, stop.value
+            self._store_results(u)
+
+    def progress(self, u):
+        if u.num_parameters == 0 or u.num_elements == 0:
+            return 0
+        if u.is_done():
+            return 100
+        bound = ford_johnson_bound(u.num_elements)
+        if bound == 0:  # a single element needs no comparison
+            return 100
+        runs = self._load(u)
+        asked = sum(bound if run[2] is not None else min(len(a), bound) for run, a in zip(runs, self.answers))
+        return 100 * asked / (u.num_parameters * bound)
+
+    def elements_changed(self, u):
+        u.log("Elements changed, restarting the Ford-Johnson sort")
+        self.reset(u)
+        u.prioritized = [[] for _ in u.p_names]
+
+    def parameter_added(self, u):
+        self.answers.append([])
+        self._runs = None
+
+    def parameter_removed(self, u, idx):
+        self.answers.pop(idx)
+        self._runs = None
+
+    def parameters_swapped(self, u, index1, index2):
+        self.answers[index1], self.answers[index2] = self.answers[index2], self.answers[index1]
+        self._runs = None
+
+    def reset(self, u):
+        self.answers = [[] for _ in u.p_names]
+        self._runs = None
+
+    def get_state(self):
+        return [list(a) for a in self.answers]
+
+    def set_state(self, u, state):
+        self.answers = [list(a) for a in state or []]
+        self._runs = None
+
+
+SCHEDULERS = {scheduler.name: scheduler for scheduler in (BinaryInsertionScheduler, FordJohnsonScheduler)}
+
+
 class Uranus:
 
-    def __init__(self, parameter_names, element_names):
+    def __init__(self, parameter_names, element_names, log_sink=None, top_k=None, scheduler='binary', prior=None):
 
         if not isinstance(parameter_names, list):
             raise CustomError("first parameter should be a list (possibly empty) of parameter names")
@@ -29,9 +460,21 @@ class Uranus:
             raise CustomError("Names of the parameters must be unique")
         if len(set(element_names)) != len(element_names):
             raise CustomError("Names of the elements must be unique")
+        if top_k is not None and (not isinstance(top_k, int) or top_k < 1):
+            raise CustomError("top_k should be None or a positive integer")
+        if scheduler not in SCHEDULERS:
+            raise CustomError(f"Unknown scheduler {scheduler!r}, use one of: {', '.join(SCHEDULERS)}")
+        if top_k is not None and scheduler != BinaryInsertionScheduler.name:
+            raise CustomError("top_k is only supported by the binary insertion scheduler")
+        if prior is not None:
+            if not isinstance(prior, list) or len(prior) != len(parameter_names):
+                raise CustomError("prior should be None or a list with one entry per parameter")
+            if scheduler != BinaryInsertionScheduler.name:
+                raise CustomError("prior is only supported by the binary insertion scheduler")
 
         self.log_file = './log.txt'  # default log name, can be changed using setLogFile()
         self.logging = True
+        self.log_sink = log_sink if log_sink is not None else FileLogSink(self.log_file)
         self.num_comparisons = 0
         self.p_names = parameter_names
         self.e_names = element_names
@@ -39,26 +482,107 @@ class Uranus:
         self.num_elements = len(element_names)
         self.final_list = []  # final order
 
+        # top-K mode: prioritized[p] keeps only the K highest elements in order; elements proven to be below the
+        # K-th one (the cut) are moved to below_cut[p] and never compared again for that parameter
+        self.top_k = top_k
+        self._below_cut = [set() for _ in range(len(parameter_names))]
         self.prioritized = [[] for _ in range(len(parameter_names))]  # actual order for each parameter
-        for i in range(len(parameter_names)):
-            self.prioritized[i] = []
 
         self.next_elem = None
         self.next_parameter = None
         self.next_range = []  # a part of prioritized list to compare against, for a given parameter
 
+        # warm start: prior[p] is None or a list of integer scores per element (higher = higher priority) from an
+        # earlier assessment. Searches then start at the predicted position and gallop outwards (steps 1, 2, 4...)
+        # before bisecting; next_gallop is None before the first probe, +/-step while galloping up/down, 0 bisecting
+        self.prior = prior
+        self.next_gallop = 0
+
+        self.scheduler = SCHEDULERS[scheduler]()  # picks the comparisons, see ComparisonScheduler
+        self.scheduler.reset(self)
+
         self.log("start")
 
+    @property
+    def prioritized(self):
+        return self._prioritized
+
+    @prioritized.setter
+    def prioritized(self, lists):  # plain lists (e.g. restored from JSON) are wrapped into BlockLists
+        self._prioritized = [p if isinstance(p, BlockList) else BlockList(p) for p in lists]
+        self._recount()
+
+    @property
+    def below_cut(self):
+        return self._below_cut
+
+    @below_cut.setter
+    def below_cut(self, lists):
+        self._below_cut = [set(b) for b in lists]
+        self._recount()
+
+    def _recount(self):
+        # num_placed counts settled elements (ranked, or below the cut in top-K mode); kept up to date by every
+        # insert/removal and recomputed when the lists are replaced
+        self.num_placed = sum(len(p) for p in self._prioritized) + sum(len(b) for b in self._below_cut)
+        self._schedule = None
+
+    def _settled(self, param):
+        return len(self.prioritized[param]) + len(self._below_cut[param])
+
+    def _is_settled(self, param, element):
+        return element in self.prioritized[param] or element in self._below_cut[param]
+
+    def _at_cut(self, param):  # the list is full: the next element is compared with the cut (its lowest) first
+        return self.top_k is not None and len(self.prioritized[param]) >= self.top_k
+
+    def _build_schedule(self):
+        # per parameter: min-heap of element indices not yet placed; plus a heap of (placed count, parameter).
+        # Rebuilt lazily after any structural change (elements/parameters added, removed, swapped or restored)
+        remaining = [[e for e in range(self.num_elements) if not self._is_settled(i, e)]
+                     for i in range(len(self.prioritized))]
+        counts = [(self._settled(i), i) for i in range(len(self.prioritized))]
+        heapify(counts)
+        self._schedule = (remaining, counts)
+
+    def _least_placed_parameter(self):  # lowest placed count, lowest index on ties
+        counts = self._schedule[1]
+        while counts[0][0] != self._settled(counts[0][1]):
+            heappop(counts)  # stale entry left behind by an insert
+        return counts[0][1]
+
+    def _first_unplaced(self, param):
+        remaining = self._schedule[0][param]
+        while self._is_settled(param, remaining[0]):
+            heappop(remaining)
+        return remaining[0]
+
+    def _placed(self, param):
+        self.num_placed = self.num_placed + 1
+        if self._schedule is not None:
+            heappush(self._schedule[1], (self._settled(param), param))
+
     def set_log_file(self, name):
         self.log_file = name
+        self.log_sink.close()
+        self.log_sink = FileLogSink(name)
+
+    def set_log_sink(self, sink):
+        self.log_sink.close()
+        self.log_sink = sink
 
     def set_logging(self, log_status):
         self.logging = log_status
 
-    def log(self, msg):
+    def log(self, msg, *args):  # msg is a str.format template for args, formatted only when the record is written out
         if self.logging:
-            with open(self.log_file, 'a') as file:
-                file.write(f"{datetime.now()}: {msg}\n")
+            self.log_sink.write((datetime.now(), msg, args))
+
+    def flush(self):
+        self.log_sink.flush()
+
+    def close(self):
+        self.log_sink.close()
 
     def get_parameter_names(self):
         return self.p_names
@@ -69,7 +593,7 @@ class Uranus:
     def rename_parameter(self, index, new_name):
         if not (new_name in self.p_names):
             self.p_names[index] = new_name
-            self.log(f"Renamed parameter {index}: {self.p_names[index]} -> {new_name}")
+            self.log("Renamed parameter {}: {} -> {}", index, self.p_names[index], new_name)
             return True
         else:
             return False
@@ -77,7 +601,7 @@ class Uranus:
     def rename_element(self, index, new_name):
         if not (new_name in self.e_names):
             self.e_names[index] = new_name
-            self.log(f"Renamed element {index}: {self.e_names[index]} -> {new_name}")
+            self.log("Renamed element {}: {} -> {}", index, self.e_names[index], new_name)
             return True
         else:
             return False
@@ -86,18 +610,23 @@ class Uranus:
         if not (name in self.e_names):
             self.e_names.append(name)
             self.num_elements = self.num_elements + 1
-            self.log(f"Added new element {self.num_elements-1}: {name}")
+            self._schedule = None
+            self.log("Added new element {}: {}", self.num_elements-1, name)
+            self.scheduler.elements_changed(self)
             return True
         return False
 
     def remove_element(self, idx):
         if idx < len(self.e_names):
-            self.log(f"Removed element {idx}: {self.e_names[idx]}. Might rename indices > idx in prioritized, "
-                     f"next_range and next_elem")
-            self.prioritized = [[e for e in subList if e != idx] for subList in self.prioritized]
+            self.log("Removed element {}: {}. Might rename indices > idx in prioritized, "
+                     "next_range and next_elem", idx, self.e_names[idx])
+            self.prioritized = [[e for e in sublist if e != idx] for sublist in self.prioritized]
             self.next_range = [e for e in self.next_range if e != idx]
             # in prioritized and in nextRange lower by one the indices of all elements greater than idx
             self.prioritized = [[el - 1 if el > idx else el for el in sublist] for sublist in self.prioritized]
+            self.below_cut = [[el - 1 if el > idx else el for el in b if el != idx] for b in self._below_cut]
+            if self.prior is not None:
+                self.prior = [scores if scores is None else scores[:idx] + scores[idx + 1:] for scores in self.prior]
             self.next_range = [el - 1 if el > idx else el for el in self.next_range]
             self.num_elements = self.num_elements - 1
             self.e_names.pop(idx)
@@ -107,6 +636,7 @@ class Uranus:
                 elif idx == self.next_elem:
                     self.next_range = []
                     self.next_elem = None
+            self.scheduler.elements_changed(self)
             return True
         else:
             return False
@@ -115,17 +645,25 @@ class Uranus:
         if not (name in self.p_names):
             self.p_names.append(name)
             self.num_parameters = self.num_parameters + 1
-            self.prioritized.append([])
-            self.log(f"Added param {self.num_parameters-1}: {self.p_names[self.num_parameters-1]} (lowest priority)")
+            self.prioritized.append(BlockList())
+            self._below_cut.append(set())
+            if self.prior is not None:
+                self.prior.append(None)
+            self._schedule = None
+            self.log("Added param {}: {} (lowest priority)", self.num_parameters-1, name)
+            self.scheduler.parameter_added(self)
             return True
         else:
             return False
 
     def remove_parameter(self, idx):
         if idx < len(self.prioritized):
-            self.log(f"Removed param {idx}: {self.p_names[idx]}. Might modify next_parameter, next_elem and "
-                     f"next_range if next_parameter was removed")
-            self.prioritized.pop(idx)
+            self.log("Removed param {}: {}. Might modify next_parameter, next_elem and "
+                     "next_range if next_parameter was removed", idx, self.p_names[idx])
+            self.num_placed = self.num_placed - len(self.prioritized.pop(idx)) - len(self._below_cut.pop(idx))
+            if self.prior is not None:
+                self.prior.pop(idx)
+            self._schedule = None
             self.p_names.pop(idx)
             self.num_parameters = self.num_parameters - 1
             if not (self.next_parameter is None):
@@ -135,16 +673,22 @@ class Uranus:
                     self.next_range = []
                 elif self.next_parameter > idx:
                     self.next_parameter = self.next_parameter - 1
+            self.scheduler.parameter_removed(self, idx)
             return True
         else:
             return False
 
     def swap_parameter_priorities(self, index1, index2):
         if (index1 < len(self.p_names)) and (index2 < len(self.p_names)) and (index1 != index2):
-            self.log(f"Swapped parameters {index1} and {index2}: {self.p_names[index1]} <-> {self.p_names[index2]}")
+            self.log("Swapped parameters {} and {}: {} <-> {}",
+                     index1, index2, self.p_names[index1], self.p_names[index2])
             tmp = self.prioritized[index1]
             self.prioritized[index1] = self.prioritized[index2]
             self.prioritized[index2] = tmp
+            self._below_cut[index1], self._below_cut[index2] = self._below_cut[index2], self._below_cut[index1]
+            if self.prior is not None:
+                self.prior[index1], self.prior[index2] = self.prior[index2], self.prior[index1]
+            self._schedule = None
             tmp = self.p_names[index1]
             self.p_names[index1] = self.p_names[index2]
             self.p_names[index2] = tmp
@@ -152,12 +696,13 @@ class Uranus:
                 self.next_parameter = index2
             elif self.next_parameter == index2:
                 self.next_parameter = index1
+            self.scheduler.parameters_swapped(self, index1, index2)
             return True
         else:
             return False
 
     def is_done(self):
-        if sum(len(innerList) for innerList in self.prioritized) == self.num_parameters * self.num_elements:
+        if self.num_placed == self.num_parameters * self.num_elements:
             return True
         else:
             return False
@@ -185,76 +730,197 @@ class Uranus:
             return None, None
 
     def progress(self):
-        total = self.num_parameters * self.num_elements
-        if total == 0:
+        return self.scheduler.progress(self)
+
+    def peek_next(self):  # same result as next_to_process(), without changing the state
+        return self.scheduler.peek_next(self)
+
+    def peek_after(self, relation_type):  # the comparison next_to_process() returns after set_priority(relation_type)
+        return self.scheduler.peek_after(self, relation_type)
+
+    def next_to_process(self):  # returns (elem1 to compare, elem2 to compare, parameter against which to compare)
+        return self.scheduler.next_to_process(self)
+
+    def set_priority(self, relation_type):  # type=0: lower, type=1: higher
+        if not ((relation_type == 0) or (relation_type == 1)):
+            raise CustomError("Wrong priority type - only 2 values are allowed: 0 (priority(nextElement) lower than "
+                              "priority(elementToCompare) or 1 (priority(nextElement) higher than priority("
+                              "elementToCompare)")
+
+        if self.is_done():
+            return None
+
+        self.num_comparisons = self.num_comparisons + 1
+        return self.scheduler.set_priority(self, relation_type)
+
+    # binary insertion, see BinaryInsertionScheduler
+
+    def _start_gallop(self, param, elem):  # next_gallop for a new search: seeded by the prior, or plain bisection
+        if self.prior is None or self.prior[param] is None or elem >= len(self.prior[param]):
             return 0
+        return None
+
+    def _probe(self, param, elem, next_range, gallop):  # index in next_range of the element to compare with
+        if gallop == 0:
+            return floor(len(next_range) / 2)
+        if gallop is None:  # predicted position, the middle of a run of equal scores
+            scores, score = self.prior[param], self.prior[param][elem]
+            lower = sum(1 for e in next_range if e < len(scores) and scores[e] < score)
+            equal = sum(1 for e in next_range if e < len(scores) and scores[e] == score)
+            return min(lower + equal // 2, len(next_range) - 1)
+        if gallop > 0:
+            return min(gallop, len(next_range)) - 1
+        return len(next_range) - min(-gallop, len(next_range))
+
+    def _gallop(self, relation_type):  # narrows next_range around the probe; returns True once inserted
+        probe = self._probe(self.next_parameter, self.next_elem, self.next_range, self.next_gallop)
+        compared = self.next_range[probe]
+        order = self.prioritized[self.next_parameter]
+        if relation_type == 0:
+            self.log("parameter {}, {} < {}", self.next_parameter, self.next_elem, compared)
+            if probe == 0:
+                order.insert_before(compared, self.next_elem)
+                return True
+            self.next_range = self.next_range[:probe]
+            if self.next_gallop is None:
+                self.next_gallop = -1
+            elif self.next_gallop < 0:
+                self.next_gallop *= 2
+            else:
+                self.next_gallop = 0  # overshot while galloping up: bisect what is left
         else:
-            return 100 * sum(len(inner) for inner in self.prioritized) / (self.num_parameters * self.num_elements)
+            self.log("parameter {}, {} < {}", self.next_parameter, compared, self.next_elem)
+            if probe == len(self.next_range) - 1:
+                order.insert_after(compared, self.next_elem)
+                return True
+            self.next_range = self.next_range[probe + 1:]
+            if self.next_gallop is None:
+                self.next_gallop = 1
+            elif self.next_gallop > 0:
+                self.next_gallop *= 2
+            else:
+                self.next_gallop = 0
+        return False
 
-    def next_to_process(self):  # returns (elem1 to compare, elem2 to compare, parameter against which to compare)
+    def _insertion_peek(self):
+        if self.is_done() or self.num_elements == 1:
+            return None, None, None
+        if len(self.next_range) >= 1:
+            probe = self._probe(self.next_parameter, self.next_elem, self.next_range, self.next_gallop)
+            return self.next_elem, self.next_range[probe], self.next_parameter
+        if self._schedule is None:
+            self._build_schedule()
+        param = self._least_placed_parameter()
+        elem = self._first_unplaced(param)
+        if len(self.prioritized[param]) == 0 and not self._below_cut[param]:
+            # next_to_process() places elem first; nothing is placed yet, so no stale heap entries
+            return min(self._schedule[0][param][1:3]), elem, param
+        if self._at_cut(param):
+            return elem, self.prioritized[param][0], param
+        order = self.prioritized[param]
+        return elem, order[self._probe(param, elem, order, self._start_gallop(param, elem))], param
+
+    def _insertion_peek_after(self, relation_type):
+        a, b, c = self.peek_next()
+        if a is None:
+            return None, None, None
+        # speculate on a shallow copy: only the list of the compared parameter can change, so only it is cloned
+        u = copy(self)
+        u.logging = False
+        u._prioritized = list(self._prioritized)
+        u._prioritized[c] = BlockList(self._prioritized[c])
+        u._below_cut = list(self._below_cut)
+        u._below_cut[c] = set(self._below_cut[c])
+        u._schedule = None
+        u.next_to_process()
+        u.set_priority(relation_type)
+        return u.peek_next()
+
+    def _insertion_next(self):
         if self.is_done():
             return None, None, None
         if self.num_elements == 1:
-            for i in range(len(self.p_names)):
-                self.prioritized[i] = [0]
+            self.prioritized = [[0] for _ in range(len(self.p_names))]
             return None, None, None
 
         if len(self.next_range) >= 1:
-            compared_element = self.next_range[floor(len(self.next_range) / 2)]
+            probe = self._probe(self.next_parameter, self.next_elem, self.next_range, self.next_gallop)
+            compared_element = self.next_range[probe]
         else:
-            self.next_parameter = min(range(len(self.prioritized)), key=lambda j: len(self.prioritized[j]))
-            remaining_elements = (set(range(0, self.num_elements))) - set(self.prioritized[self.next_parameter])
-            self.next_elem = min(remaining_elements)
+            if self._schedule is None:
+                self._build_schedule()
+            self.next_parameter = self._least_placed_parameter()
+            self.next_elem = self._first_unplaced(self.next_parameter)
             if len(self.prioritized[self.next_parameter]) == 0:
-                self.prioritized[self.next_parameter] = [self.next_elem]
-                self.next_elem = min(remaining_elements - {self.next_elem})
-            self.next_range = self.prioritized[self.next_parameter]
-            compared_element = self.next_range[floor(len(self.next_range) / 2)]
+                self.prioritized[self.next_parameter].append(self.next_elem)
+                self._placed(self.next_parameter)
+                self.next_elem = self._first_unplaced(self.next_parameter)
+            if self._at_cut(self.next_parameter):
+                self.next_range = [self.prioritized[self.next_parameter][0]]
+            else:
+                self.next_range = self.prioritized[self.next_parameter][:]
+            self.next_gallop = self._start_gallop(self.next_parameter, self.next_elem)
+            compared_element = self.next_range[self._probe(self.next_parameter, self.next_elem, self.next_range,
+                                                           self.next_gallop)]
 
         return self.next_elem, compared_element, self.next_parameter
 
-    def set_priority(self, relation_type):  # type=0: lower, type=1: higher
-        if not ((relation_type == 0) or (relation_type == 1)):
-            raise CustomError("Wrong priority type - only 2 values are allowed: 0 (priority(nextElement) lower than "
-                              "priority(elementToCompare) or 1 (priority(nextElement) higher than priority("
-                              "elementToCompare)")
-
-        if self.is_done():
-            return None
-
+    def _insertion_set_priority(self, relation_type):
         inserted = False
-        self.num_comparisons = self.num_comparisons + 1
         # update prioritized table by inserting an element when you can do it; otherwise, restrict the search interval
         if len(self.next_range) == 0:
             raise CustomError("nextToProcess() must be used before invoking setPriority()")
-        if len(self.next_range) == 1:
-            l1, l2 = self.split_list_by_element(self.prioritized[self.next_parameter], self.next_range[0])
+        order = self.prioritized[self.next_parameter]
+        if self._at_cut(self.next_parameter) and self.next_range == [order[0]]:
+            # comparison with the cut: below it the element is settled, above it the search continues among the rest
+            if relation_type == 0:
+                self.log("parameter {}, {} < {} (below top {})",
+                         self.next_parameter, self.next_elem, self.next_range[0], self.top_k)
+                self._below_cut[self.next_parameter].add(self.next_elem)
+                self._placed(self.next_parameter)
+                self.next_range = []
+                return None
+            self.log("parameter {}, {} < {}", self.next_parameter, self.next_range[0], self.next_elem)
+            if len(order) == 1:
+                order.insert_after(self.next_range[0], self.next_elem)
+                inserted = True
+            else:
+                self.next_range = order[1:]
+        elif self.next_gallop != 0:
+            inserted = self._gallop(relation_type)
+        elif len(self.next_range) == 1:
             if relation_type == 0:
-                self.log(f"parameter {self.next_parameter}, {self.next_elem} < {self.next_range[0]}")
-                self.prioritized[self.next_parameter] = l1 + [self.next_elem, self.next_range[0]] + l2
+                self.log("parameter {}, {} < {}", self.next_parameter, self.next_elem, self.next_range[0])
+                self.prioritized[self.next_parameter].insert_before(self.next_range[0], self.next_elem)
                 inserted = True
             elif relation_type == 1:
-                self.log(f"parameter {self.next_parameter}, {self.next_range[0]} < {self.next_elem}")
-                self.prioritized[self.next_parameter] = l1 + [self.next_range[0], self.next_elem] + l2
+                self.log("parameter {}, {} < {}", self.next_parameter, self.next_range[0], self.next_elem)
+                self.prioritized[self.next_parameter].insert_after(self.next_range[0], self.next_elem)
                 inserted = True
         elif len(self.next_range) == 2 and relation_type == 0:
-            self.log(f"parameter {self.next_parameter}, {self.next_elem} < {self.next_range[1]}")
+            self.log("parameter {}, {} < {}", self.next_parameter, self.next_elem, self.next_range[1])
             self.next_range = [self.next_range[0]]
         elif len(self.next_range) == 2 and relation_type == 1:
-            self.log(f"parameter {self.next_parameter}, {self.next_range[1]} < {self.next_elem}")
-            l1, l2 = self.split_list_by_element(self.prioritized[self.next_parameter], self.next_range[1])
-            self.prioritized[self.next_parameter] = l1 + [self.next_range[1], self.next_elem] + l2
+            self.log("parameter {}, {} < {}", self.next_parameter, self.next_range[1], self.next_elem)
+            self.prioritized[self.next_parameter].insert_after(self.next_range[1], self.next_elem)
             inserted = True
         elif len(self.next_range) > 2:
             next_second_element_index = floor(len(self.next_range) / 2)
             if relation_type == 0:
-                self.log(f"param {self.next_parameter}, {self.next_elem}<{self.next_range[next_second_element_index]}")
+                self.log("param {}, {}<{}",
+                         self.next_parameter, self.next_elem, self.next_range[next_second_element_index])
                 self.next_range = self.next_range[:next_second_element_index]
             else:
-                self.log(f"param {self.next_parameter}, {self.next_range[next_second_element_index]}<{self.next_elem}")
+                self.log("param {}, {}<{}",
+                         self.next_parameter, self.next_range[next_second_element_index], self.next_elem)
                 self.next_range = self.next_range[next_second_element_index + 1:]
 
         if inserted:
+            if self.top_k is not None and len(order) > self.top_k:
+                lowest = order[0]  # pushed out of the top K
+                order.remove(lowest)
+                self._below_cut[self.next_parameter].add(lowest)
+            self._placed(self.next_parameter)
             self.next_range = []
 
     def prioritize(self, param, elements, priorities):
@@ -273,11 +939,43 @@ class Uranus:
             new_all_prioritized = [[e for e in inner_list if e in elements] for inner_list in priorities]
             return self.prioritize(-1, elements, new_all_prioritized)
 
+    def rank_prioritize(self):
+        # same order as prioritize(-1, all elements, self.prioritized), without list-membership scans:
+        # ranks[p][e] is the position of element e for parameter p, computed once; every "start over" computes,
+        # for each parameter, the set of elements in the upper half of the restricted order, and the median
+        # splits become set intersections
+        ranks = []
+        for p, order in enumerate(self.prioritized):
+            rank = [0] * self.num_elements
+            # in top-K mode elements below the cut rank under the K ranked ones, in index order; that order
+            # only makes the list total, stored results give them one shared rank (result_tables.final_ranks)
+            for position, e in enumerate(sorted(self._below_cut[p]) + list(order)):
+                rank[e] = position
+            ranks.append(rank)
+
+        def upper_halves(elements):
+            half = floor(len(elements) / 2)
+            return [frozenset(sorted(elements, key=rank.__getitem__)[half:]) for rank in ranks]
+
+        def split(param, elements, high_sets):
+            if len(elements) == 1:
+                self.final_list.extend(elements)
+            elif len(elements) > 1:
+                if param < self.num_parameters - 1:
+                    el_high = elements & high_sets[param + 1]
+                    split(param + 1, el_high, high_sets)
+                    split(param + 1, elements - el_high, high_sets)
+                else:
+                    split(-1, elements, upper_halves(elements))
+
+        all_elements = frozenset(range(self.num_elements))
+        split(-1, all_elements, upper_halves(all_elements))
+
     def prioritized_list(self):
         if self.is_done() and self.num_parameters > 0:
             self.final_list = []
-            self.prioritize(-1, list(range(self.num_elements)), self.prioritized)
-            self.log(f"Prioritization done. Final prioritized list: {self.final_list}")
+            self.rank_prioritize()
+            self.log("Prioritization done. Final prioritized list: {}", list(self.final_list))
             return self.final_list
         else:
             return []
@@ -285,9 +983,12 @@ class Uranus:
     def reset(self):
         self.num_comparisons = 0
         self.final_list = []
+        self._below_cut = [set() for _ in range(len(self.p_names))]
         self.prioritized = [[] for _ in range(len(self.p_names))]
         self.next_elem = None
         self.next_parameter = None
         self.next_range = []
+        self.next_gallop = 0
+        self.scheduler.reset(self)
         self.log("Reset complete")
 